@@ -0,0 +1,123 @@
+from __future__ import print_function
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import datetime
+from collections import defaultdict
+
+from billy.core import db, settings
+from billy.bin.commands import BaseCommand
+
+log = logging.getLogger('billy')
+
+
+def legacy_clean(obj):
+    """ BillyJSONEmitter._clean before the Serializer, modifies obj """
+    if isinstance(obj, dict):
+        if '_id' in obj:
+            obj['id'] = obj['_id']
+        if '_all_ids' in obj:
+            obj['all_ids'] = obj['_all_ids']
+
+        for key, value in list(obj.items()):
+            if key.startswith('_'):
+                del obj[key]
+            else:
+                obj[key] = legacy_clean(value)
+    elif isinstance(obj, list):
+        obj = [legacy_clean(item) for item in obj]
+    return obj
+
+
+class LegacyJSONEncoder(json.JSONEncoder):
+    """ the API's DateTimeAwareJSONEncoder before the Serializer """
+
+    def default(self, o):
+        from django.template import defaultfilters
+        if isinstance(o, datetime.datetime):
+            return defaultfilters.date(o, 'DATETIME_FORMAT')
+        elif isinstance(o, datetime.date):
+            return defaultfilters.date(o, 'DATE_FORMAT')
+        elif isinstance(o, datetime.time):
+            return defaultfilters.date(o, 'TIME_FORMAT')
+        return super(LegacyJSONEncoder, self).default(o)
+
+
+def best_time(func, repeat, setup=None):
+    """ fastest of repeat calls to func(setup()) """
+    best = None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.time()
+        func(arg)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class BenchEmitter(BaseCommand):
+
+    name = 'bench-emitter'
+    help = ("time serializing a jurisdiction's bills for the API, compared "
+            "to the emitter's previous implementation")
+
+    def add_args(self):
+        self.add_argument('abbr', metavar='ABBR', type=str,
+                          help='abbreviation of jurisdiction to take bills '
+                          'from')
+        self.add_argument('--count', type=int, default=500,
+                          help='number of bills (default: 500)')
+        self.add_argument('--repeat', type=int, default=5,
+                          help='number of runs, the fastest is reported')
+
+    def handle(self, args):
+        # datetimes are formatted with the API's settings
+        if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+            log.critical('set DJANGO_SETTINGS_MODULE to the API\'s settings')
+            sys.exit(1)
+        import django
+        django.setup()
+        from billy.web.api.emitters import Serializer
+
+        # bills as /v1/bills/ returns them with all fields, votes included
+        bills = list(db.bills.find({settings.LEVEL_FIELD: args.abbr})
+                     .limit(args.count))
+        if not bills:
+            log.critical('no bills for %s' % args.abbr)
+            sys.exit(1)
+        votes = defaultdict(list)
+        for vote in db.votes.find({'bill_id': {'$in': [bill['_id'] for bill
+                                                       in bills]}}):
+            votes[vote['bill_id']].append(vote)
+        for bill in bills:
+            bill['votes'] = votes[bill['_id']]
+
+        def legacy(docs):
+            return json.dumps(legacy_clean(docs), cls=LegacyJSONEncoder,
+                              ensure_ascii=False)
+
+        def current(docs):
+            return json.dumps(Serializer()(docs), ensure_ascii=False)
+
+        # the legacy emitter modifies what it's given, so it gets a copy
+        # (made outside of the timing) every run
+        if json.loads(legacy(copy.deepcopy(bills))) != json.loads(
+                current(bills)):
+            log.critical('serializers disagree, not timing them')
+            sys.exit(1)
+        legacy_time = best_time(legacy, args.repeat,
+                                lambda: copy.deepcopy(bills))
+        current_time = best_time(lambda _: current(bills), args.repeat)
+
+        print('%-12s %10s %12s' % ('emitter', 'seconds', 'ms/bill'))
+        for name, seconds in (('legacy', legacy_time),
+                              ('serializer', current_time)):
+            print('%-12s %10.3f %12.3f' % (name, seconds,
+                                           1000.0 * seconds / len(bills)))
+        print('%d bills, %.1fx faster (the legacy emitter also ran piston\'s '
+              'construct, which is not timed here)' % (
+                  len(bills), legacy_time / current_time))
@@ -0,0 +1,166 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+
+from billy.core import db, settings
+from billy.bin.commands import BaseCommand
+from billy.importers.timing import enable_stage_timing, pop_stage_timings
+
+log = logging.getLogger('billy')
+
+# collections cleared before every run
+BENCH_COLLECTIONS = ('bills', 'votes', 'legislators', 'committees',
+                     'import_manifests')
+
+# stages that got slower by less than this many seconds are timing noise
+MIN_REGRESSION = 0.01
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compare bench-import results to a baseline, returns a list of the
+    regressions found: stages more than tolerance (a fraction) slower and
+    counts that differ.
+    """
+    regressions = []
+    for name, timing in sorted(results['stages'].items()):
+        if name not in baseline['stages']:
+            continue
+        before = baseline['stages'][name]['seconds']
+        after = timing['seconds']
+        if (before and after > before * (1 + tolerance) and
+                after - before > MIN_REGRESSION):
+            regressions.append('%s: %.3fs -> %.3fs (+%.0f%%)' % (
+                name, before, after, 100.0 * (after - before) / before))
+    for name, counts in sorted(results['counts'].items()):
+        if name in baseline['counts'] and baseline['counts'][name] != counts:
+            regressions.append('%s counts: %s -> %s' % (
+                name, baseline['counts'][name], counts))
+    return regressions
+
+
+class BenchImport(BaseCommand):
+
+    name = 'bench-import'
+    help = ('time importing a data directory, stage by stage, and compare '
+            'to a baseline')
+
+    def add_args(self):
+        self.add_argument('abbr', metavar='ABBR', type=str,
+                          help='abbreviation of jurisdiction to import')
+        self.add_argument('--data-dir', dest='data_dir',
+                          default=settings.BILLY_DATA_DIR,
+                          help='directory holding ABBR/bills etc.')
+        self.add_argument('--repeat', type=int, default=1,
+                          help='number of runs, the fastest time of each '
+                          'stage is reported')
+        self.add_argument('--profile', default=None,
+                          help='write cProfile stats of the last run here')
+        self.add_argument('--baseline', default=None,
+                          help='compare to results saved with --save')
+        self.add_argument('--save', default=None,
+                          help='save the results as a baseline here')
+        self.add_argument('--tolerance', type=float, default=0.2,
+                          help='fraction a stage may be slower than its '
+                          'baseline (default: 0.2)')
+
+    def run_once(self, abbr, data_dir, profiler=None):
+        from billy.importers.metadata import import_metadata
+        from billy.importers.bills import import_bills
+        from billy.importers.legislators import import_legislators
+        from billy.importers.committees import import_committees
+        from billy.importers.names import reset_name_matchers
+        from billy.importers.utils import reset_committee_resolver
+
+        for collection in BENCH_COLLECTIONS:
+            db[collection].remove({settings.LEVEL_FIELD: abbr}, safe=True)
+        reset_name_matchers(abbr)
+        reset_committee_resolver(abbr)
+
+        # same order as billy-update
+        steps = (('import_metadata', lambda: import_metadata(abbr)),
+                 ('import_legislators',
+                  lambda: import_legislators(abbr, data_dir)),
+                 ('import_bills',
+                  lambda: import_bills(abbr, data_dir, full_import=True)),
+                 ('import_committees',
+                  lambda: import_committees(abbr, data_dir)))
+
+        counts = {}
+        step_timings = {}
+        enable_stage_timing()
+        if profiler:
+            profiler.enable()
+        try:
+            for name, step in steps:
+                start = time.time()
+                result = step()
+                step_timings[name] = (1, time.time() - start)
+                if isinstance(result, dict):
+                    counts[name] = result
+        finally:
+            if profiler:
+                profiler.disable()
+            timings = pop_stage_timings()
+
+        timings.update(step_timings)
+        return timings, counts
+
+    def handle(self, args):
+        # runs start by removing the jurisdiction's data
+        if not settings.MONGO_DATABASE.endswith('_bench'):
+            log.critical('bench-import clears the data it imports, set '
+                         'MONGO_DATABASE to a database ending in _bench')
+            sys.exit(1)
+        if not os.path.isdir(os.path.join(args.data_dir, args.abbr)):
+            log.critical('no data for %s in %s' % (args.abbr, args.data_dir))
+            sys.exit(1)
+
+        # metadata comes from the scraper module
+        sys.path.extend(settings.SCRAPER_PATHS)
+        settings.BILLY_DATA_DIR = args.data_dir
+
+        best = {}
+        for run in range(args.repeat):
+            profiler = None
+            if args.profile and run == args.repeat - 1:
+                profiler = cProfile.Profile()
+            timings, counts = self.run_once(args.abbr, args.data_dir,
+                                            profiler)
+            for name, (calls, seconds) in timings.items():
+                if name not in best or seconds < best[name]['seconds']:
+                    best[name] = {'calls': calls, 'seconds': seconds}
+
+        if args.profile:
+            profiler.dump_stats(args.profile)
+            log.info('wrote profile to %s' % args.profile)
+
+        results = {'abbr': args.abbr, 'stages': best, 'counts': counts}
+
+        print('%-20s %8s %10s %12s' % ('stage', 'calls', 'seconds',
+                                       'ms/call'))
+        for name, timing in sorted(best.items(),
+                                   key=lambda item: -item[1]['seconds']):
+            print('%-20s %8d %10.3f %12.3f' % (
+                name, timing['calls'], timing['seconds'],
+                1000.0 * timing['seconds'] / timing['calls']))
+
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            log.info('saved baseline to %s' % args.save)
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            regressions = compare_to_baseline(results, baseline,
+                                              args.tolerance)
+            if regressions:
+                for regression in regressions:
+                    log.error('regression: %s' % regression)
+                sys.exit(1)
+            log.info('no regressions compared to %s' % args.baseline)
@@ -2,9 +2,16 @@ from __future__ import print_function
 from billy.core import db
 from billy.bin.commands import BaseCommand
 from billy.core import settings
+from billy.importers.utils import set_normalized_fields
+from billy.utils.search import search_fields
 import pymongo
 
 
+def index_name(index):
+    """ the name mongo gives an index on the (key, direction) list """
+    return '_'.join('%s_%s' % (key, direction) for key, direction in index)
+
+
 class MongoIndex(BaseCommand):
     name = 'mongo-index'
     help = '''make indexes'''
@@ -26,7 +33,12 @@ class MongoIndex(BaseCommand):
                 [(settings.LEVEL_FIELD, pymongo.ASCENDING),
                  ('committee', pymongo.ASCENDING),
                  ('subcommittee', pymongo.ASCENDING)
-                ]
+                ],
+                # case insensitive API filters
+                [('_normalized.committee', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
+                [('_normalized.subcommittee', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
             ],
             'events': [
                 [('when', pymongo.ASCENDING),
@@ -67,6 +79,20 @@ class MongoIndex(BaseCommand):
                     ('middle_name', pymongo.ASCENDING),
                     ('suffixes', pymongo.ASCENDING)],
                 },
+                # case insensitive API filters
+                [('_normalized.last_name', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
+                [('_normalized.first_name', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
+                [('_normalized.full_name', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
+                [('roles._normalized.district', pymongo.ASCENDING),
+                 ('roles.' + settings.LEVEL_FIELD, pymongo.ASCENDING),
+                 ('roles.chamber', pymongo.ASCENDING)],
+                [('roles._normalized.party', pymongo.ASCENDING),
+                 ('roles.' + settings.LEVEL_FIELD, pymongo.ASCENDING)],
+                [('roles._normalized.term', pymongo.ASCENDING),
+                 ('roles.' + settings.LEVEL_FIELD, pymongo.ASCENDING)],
             ],
             'bills': [
                 # bill_id is used for search in conjunction with ElasticSearch
@@ -88,20 +114,32 @@ class MongoIndex(BaseCommand):
                 [(settings.LEVEL_FIELD, pymongo.ASCENDING),
                  ('type', pymongo.ASCENDING),
                 ],
+                # full text search, see billy.utils.search
+                [('_search_terms', pymongo.ASCENDING),
+                 (settings.LEVEL_FIELD, pymongo.ASCENDING)],
             ],
             'subjects': [
                 [('abbr', pymongo.ASCENDING)],
             ],
+            'import_manifests': [
+                [(settings.LEVEL_FIELD, pymongo.ASCENDING),
+                 ('type', pymongo.ASCENDING)],
+            ],
             'manual.name_matchers': [
                 [('abbr', pymongo.ASCENDING)],
             ],
             'votes': [
                 [('bill_id', pymongo.ASCENDING), ('date', pymongo.ASCENDING)],
-                [('_voters', pymongo.ASCENDING), ('date', pymongo.ASCENDING)]
+                [('_voters', pymongo.ASCENDING), ('date', pymongo.ASCENDING)],
+                # loading a session's votes when importing bills
+                [(settings.LEVEL_FIELD, pymongo.ASCENDING),
+                 ('session', pymongo.ASCENDING),
+                 ('bill_id', pymongo.ASCENDING)],
             ]
         }
 
         # add a plethora of bill indexes
+        replaced = {'bills': []}
         search_indexes = [
             ('sponsors.leg_id', settings.LEVEL_FIELD),
             ('chamber', settings.LEVEL_FIELD),
@@ -124,11 +162,41 @@ class MongoIndex(BaseCommand):
             for sort_index in sort_indexes:
                 index = [(ikey, pymongo.ASCENDING) for ikey in index_keys]
                 index += [(sort_index, pymongo.DESCENDING)]
-                all_indexes['bills'].append(index)
+                # _id breaks ties when paginating with cursors, the index
+                # without it is redundant and dropped even without --purge
+                replaced['bills'].append(index_name(index))
+                all_indexes['bills'].append(
+                    index + [('_id', pymongo.DESCENDING)])
 
         collections = args.collections or all_indexes.keys()
 
         for collection in collections:
+            if collection in ('legislators', 'committees'):
+                # objects imported before _normalized fields were added
+                normalized = 0
+                for obj in db[collection].find(
+                        {'_normalized': {'$exists': False}}):
+                    set_normalized_fields(obj)
+                    db[collection].save(obj, safe=True)
+                    normalized += 1
+                if normalized:
+                    print('added _normalized fields to', normalized,
+                          collection)
+            if collection == 'bills':
+                # bills imported before searches used _search_terms
+                indexed = 0
+                for bill in db.bills.find(
+                        {'_search_terms': {'$exists': False}},
+                        fields=['title', 'alternate_titles',
+                                'scraped_subjects', '_text_terms']):
+                    db.bills.update({'_id': bill['_id']},
+                                    {'$set': search_fields(
+                                        bill, bill.get('_text_terms'))},
+                                    safe=True)
+                    indexed += 1
+                if indexed:
+                    print('added search fields to', indexed, 'bills')
+
             print('indexing', collection, '...')
             current = set(db[collection].index_information().keys())
             current.discard('_id_')
@@ -157,6 +225,11 @@ class MongoIndex(BaseCommand):
                     raise ValueError(index)
             new = ensured - current
             old = current - ensured
+            for index in replaced.get(collection, ()):
+                if index in old:
+                    print('removing superseded index', index)
+                    db[collection].drop_index(index)
+                    old.discard(index)
             if len(new):
                 print(len(new), 'new indexes:', ', '.join(new))
             if len(old):
@@ -0,0 +1,45 @@
+import sys
+import logging
+
+from billy.core import settings
+from billy.bin.commands import BaseCommand
+from billy.utils.fulltext import (FulltextPipeline, LocalBlobStore,
+                                  S3BlobStore, iter_versions)
+
+log = logging.getLogger('billy')
+
+
+class Fulltext(BaseCommand):
+
+    name = 'fulltext'
+    help = 'fetch bill versions and extract their full text'
+
+    def add_args(self):
+        self.add_argument('abbr', metavar='ABBR', type=str,
+                          help='abbreviation of jurisdiction to process')
+        self.add_argument('--session', type=str, default=None,
+                          help='only process versions of bills in SESSION')
+        self.add_argument('-j', '--workers', type=int,
+                          default=settings.BILLY_FULLTEXT_WORKERS,
+                          help='number of documents to process at once')
+        self.add_argument('--store', choices=('local', 's3'), default=None,
+                          help='where to store documents and text (default: '
+                          's3 if AWS_BUCKET is set, local otherwise)')
+        self.add_argument('--store-dir', dest='store_dir',
+                          default=settings.BILLY_FULLTEXT_DIR,
+                          help='directory used by the local store')
+
+    def handle(self, args):
+        # extract_text lives in the scraper module
+        sys.path.extend(settings.SCRAPER_PATHS)
+
+        store = args.store or ('s3' if settings.AWS_BUCKET else 'local')
+        if store == 's3':
+            store = S3BlobStore()
+        else:
+            store = LocalBlobStore(args.store_dir)
+
+        pipeline = FulltextPipeline(args.abbr, store, workers=args.workers)
+        counts = pipeline.run(iter_versions(args.abbr, args.session))
+        if counts['failed']:
+            log.warning('%s documents failed', counts['failed'])
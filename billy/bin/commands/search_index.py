@@ -0,0 +1,83 @@
+import logging
+
+from billy.core import db, settings
+from billy.bin.commands import BaseCommand
+from billy.importers.utils import BulkWriter
+from billy.utils.search import search_fields, text_terms
+
+log = logging.getLogger('billy')
+
+SEARCH_FIELDS = ['title', 'alternate_titles', 'scraped_subjects', 'versions',
+                 '_search_terms', '_search_weights', '_text_terms']
+
+
+def version_terms(abbr, bill, store, limit):
+    """ the most common terms of the stored text of the bill's versions """
+    from billy.utils.fulltext import text_key
+    terms = set()
+    for doc in bill.get('versions', []):
+        if not doc.get('doc_id'):
+            continue
+        text = store.get(text_key(abbr, doc))
+        if text:
+            terms.update(text_terms(text, limit))
+    return sorted(terms)
+
+
+class SearchIndex(BaseCommand):
+
+    name = 'search-index'
+    help = 'rebuild the full text search fields of bills'
+
+    def add_args(self):
+        self.add_argument('abbrs', metavar='ABBR', type=str, nargs='+',
+                          help='abbreviations of jurisdictions to index')
+        self.add_argument('--session', type=str, default=None,
+                          help='only index bills in SESSION')
+        self.add_argument('--fulltext', action='store_true', default=False,
+                          help='also index the text of versions stored by '
+                          'billy-util fulltext')
+        self.add_argument('--store', choices=('local', 's3'), default=None,
+                          help='where the text is stored (default: s3 if '
+                          'AWS_BUCKET is set, local otherwise)')
+        self.add_argument('--store-dir', dest='store_dir',
+                          default=settings.BILLY_FULLTEXT_DIR,
+                          help='directory used by the local store')
+
+    def handle(self, args):
+        store = None
+        if args.fulltext:
+            # only needs boto when indexing text
+            from billy.utils.fulltext import LocalBlobStore, S3BlobStore
+            store = args.store or ('s3' if settings.AWS_BUCKET else 'local')
+            if store == 's3':
+                store = S3BlobStore()
+            else:
+                store = LocalBlobStore(args.store_dir)
+
+        for abbr in args.abbrs:
+            spec = {settings.LEVEL_FIELD: abbr}
+            if args.session:
+                spec['session'] = args.session
+
+            indexed = changed = 0
+            with BulkWriter(db.bills) as writer:
+                for bill in db.bills.find(spec, fields=SEARCH_FIELDS,
+                                          timeout=False):
+                    fields = {}
+                    if store:
+                        fields['_text_terms'] = version_terms(
+                            abbr, bill, store,
+                            settings.BILLY_SEARCH_TEXT_TERMS)
+                    terms = fields.get('_text_terms', bill.get('_text_terms'))
+                    fields.update(search_fields(bill, terms))
+
+                    indexed += 1
+                    # only the fields needed were fetched, so $set the
+                    # changed ones (without touching updated_at)
+                    if any(bill.get(key) != value
+                           for key, value in fields.items()):
+                        writer.update({'_id': bill['_id']}, {'$set': fields})
+                        changed += 1
+            log.info('%s: indexed %s bills, %s changed', abbr, indexed,
+                     changed)
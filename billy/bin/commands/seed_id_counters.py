@@ -0,0 +1,23 @@
+from __future__ import print_function
+from billy.core import db
+from billy.bin.commands import BaseCommand
+from billy.importers.utils import ID_COUNTERS, seed_id_counter
+
+
+class SeedIdCounters(BaseCommand):
+    name = 'seed-id-counters'
+    help = '''initialize bill/legislator/committee id counters from the
+              largest ids in use'''
+
+    def add_args(self):
+        self.add_argument('abbrs', nargs='*',
+                          help='abbr(s) to seed counters for (defaults to '
+                          'all)')
+
+    def handle(self, args):
+        abbrs = args.abbrs or [meta['_id'] for meta in
+                               db.metadata.find(fields=[])]
+        for abbr in abbrs:
+            for collection in sorted(ID_COUNTERS):
+                seq = seed_id_counter(abbr, collection)
+                print('seeded %s %s counter at %s' % (abbr, collection, seq))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Run billy-update for many jurisdictions at once.
+
+Every jurisdiction runs in its own process, exactly as a separate
+billy-update invocation would (including its billy_runs record), with its
+output going to LOG_DIR/<abbr>.log.  Scrapes are network bound and spend
+most of their time waiting on their own legislature's site (each process
+keeps its own scrapelib rate limit), so many can run side by side, while
+imports are bounded separately so they don't all hit mongo at once.
+
+Arguments that billy-run-many doesn't know are passed on to billy-update.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import datetime
+import multiprocessing
+
+from billy.core import settings
+from billy.bin import update
+
+logger = logging.getLogger('billy')
+
+
+def find_jurisdictions(paths=None):
+    """ names of the scraper modules found in SCRAPER_PATHS """
+    abbrs = set()
+    for path in (paths or settings.SCRAPER_PATHS):
+        if not os.path.isdir(path):
+            continue
+        for name in os.listdir(path):
+            if name.startswith(('_', '.')):
+                continue
+            if os.path.exists(os.path.join(path, name, '__init__.py')):
+                abbrs.add(name)
+    return sorted(abbrs)
+
+
+def _update_one(abbr, update_args, log_path, import_slots):
+    # point stdout/stderr (and therefore logging) at the jurisdiction's log
+    log = open(log_path, 'a')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    update._import_slots = import_slots
+    sys.argv = ['billy-update', abbr] + update_args
+    update.main()
+
+
+def run_many(abbrs, update_args, jobs=4, import_jobs=2, log_dir='logs',
+             poll_interval=1):
+    """
+    Run billy-update for each of abbrs, at most jobs at a time and with at
+    most import_jobs of them importing at once.
+
+    Returns a dict mapping abbr to the exit code of its billy-update run.
+    """
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+    import_slots = multiprocessing.BoundedSemaphore(import_jobs)
+    pending = list(abbrs)
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < jobs:
+            abbr = pending.pop(0)
+            log_path = os.path.join(log_dir, '%s.log' % abbr)
+            proc = multiprocessing.Process(
+                target=_update_one,
+                args=(abbr, update_args, log_path, import_slots))
+            proc.start()
+            running[abbr] = (proc, datetime.datetime.utcnow())
+            logger.info('started %s (%s remaining)' % (abbr, len(pending)))
+
+        time.sleep(poll_interval)
+
+        for abbr, (proc, started) in list(running.items()):
+            if proc.is_alive():
+                continue
+            proc.join()
+            del running[abbr]
+            results[abbr] = proc.exitcode
+            elapsed = datetime.datetime.utcnow() - started
+            if proc.exitcode == 0:
+                logger.info('finished %s in %s' % (abbr, elapsed))
+            else:
+                logger.error('%s failed with exit code %s after %s, see %s' %
+                             (abbr, proc.exitcode, elapsed,
+                              os.path.join(log_dir, '%s.log' % abbr)))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='run billy-update for many jurisdictions in parallel',
+        epilog='other arguments (given after the jurisdictions) are passed '
+        'on to billy-update')
+    parser.add_argument('abbrs', metavar='ABBR', type=str, nargs='*',
+                        help='scraper modules to update (eg. nc)')
+    parser.add_argument('--all', action='store_true', default=False,
+                        help='update every scraper module in SCRAPER_PATHS')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='number of jurisdictions to update at once')
+    parser.add_argument('--import-jobs', type=int, default=2,
+                        dest='import_jobs',
+                        help='number of jurisdictions to import at once')
+    parser.add_argument('--log-dir', default='logs', dest='log_dir',
+                        help='directory to write per-jurisdiction logs to')
+
+    args, update_args = parser.parse_known_args()
+
+    if args.all:
+        abbrs = find_jurisdictions()
+    else:
+        abbrs = args.abbrs
+    if not abbrs:
+        parser.error('specify jurisdictions to update or --all')
+
+    results = run_many(abbrs, update_args, jobs=args.jobs,
+                       import_jobs=args.import_jobs, log_dir=args.log_dir)
+
+    failed = sorted(abbr for abbr, code in results.items() if code != 0)
+    logger.info('%s of %s jurisdictions updated' %
+                (len(results) - len(failed), len(results)))
+    if failed:
+        logger.error('failed: %s' % ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
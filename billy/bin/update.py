@@ -4,11 +4,11 @@ import os
 import sys
 import pdb
 import json
-import glob
 import logging
 import inspect
 import argparse
 import traceback
+import contextlib
 import importlib
 import six
 
@@ -19,6 +19,32 @@ from billy.core import settings, base_arg_parser
 from billy.scrape import ScrapeError, get_scraper, check_sessions
 from billy.utils import term_for_session
 from billy.scrape.validator import DatetimeValidator
+from billy.scrape.output import clear_scraped
+from billy.scrape.cache import ScrapeCache
+from billy.scrape.utils import evict_converted
+
+
+# set by billy-run-many to bound the number of jurisdictions importing at once
+_import_slots = None
+
+
+def _acquire_import_slot():
+    if _import_slots is not None:
+        _import_slots.acquire()
+
+
+def _release_import_slot():
+    if _import_slots is not None:
+        _import_slots.release()
+
+
+@contextlib.contextmanager
+def _import_slot():
+    _acquire_import_slot()
+    try:
+        yield
+    finally:
+        _release_import_slot()
 
 
 def _clear_scraped_data(output_dir, scraper_type=''):
@@ -30,8 +56,7 @@ def _clear_scraped_data(output_dir, scraper_type=''):
         if e.errno != 17:
             raise e
         else:
-            for f in glob.glob(path + '/*.json'):
-                os.remove(f)
+            clear_scraped(path)
 
 
 def _get_configured_scraper(scraper_type, options, metadata):
@@ -55,13 +80,110 @@ def _is_old_scrape(f):
     return 'chamber' in argspec.args
 
 
-def _run_scraper(scraper_type, options, metadata):
+def _parse_since(value, abbr):
+    """
+        parse --changed-since: a UTC date or datetime, or 'last' for the
+        start of the jurisdiction's last successful run
+    """
+    if value == 'last':
+        runs = list(db.billy_runs.find({'abbr': abbr,
+                                        'failure': {'$exists': False},
+                                        'scraped.started': {'$exists': True}},
+                                       fields=['scraped.started']).sort(
+            'scraped.started', -1).limit(1))
+        if not runs:
+            raise ScrapeError('--changed-since last: no successful run of %s'
+                              % abbr)
+        return runs[0]['scraped']['started']
+
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return dt.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ScrapeError('--changed-since must be YYYY-MM-DD[THH:MM[:SS]] or '
+                      'last, not %r' % value)
+
+
+def _stale_bills(abbr, session, chambers, horizon, limit=None):
+    """
+        (chamber, bill_id) of the bills in session that weren't scraped
+        within horizon (a timedelta), most recently acted on first
+    """
+    cutoff = dt.datetime.utcnow() - horizon
+    fresh = set(entry['obj_id'] for entry in db.import_manifests.find(
+        {settings.LEVEL_FIELD: abbr, 'type': 'bill',
+         'scraped_at': {'$gte': cutoff}}, fields=['obj_id']))
+
+    stale = []
+    # bills changed within the horizon were scraped within it too
+    bills = db.bills.find({settings.LEVEL_FIELD: abbr, 'session': session,
+                           'chamber': {'$in': chambers},
+                           'updated_at': {'$lt': cutoff}},
+                          fields=['chamber', 'bill_id'])
+    for bill in bills.sort('action_dates.last', -1):
+        if bill['_id'] in fresh:
+            continue
+        stale.append((bill['chamber'], bill['bill_id']))
+        if limit and len(stale) >= limit:
+            break
+    return stale
+
+
+def _scrape_changed_bills(scraper, session, chambers, since, abbr):
+    """
+        scrape the bills of session that the scraper reports as changed
+        since since, plus those not scraped in BILLY_RESCRAPE_HORIZON days
+
+        returns the number of bills scraped, or None if the scraper can't
+        report changes and the whole session has to be scraped
+    """
+    logger = logging.getLogger('billy')
+    changed = scraper.changed_bills(session, since)
+    if changed is None:
+        logger.warning("%s can't report changed bills, scraping all of %s" %
+                       (scraper.__class__.__name__, session))
+        return None
+
+    targets = set((chamber, bill_id) for chamber, bill_id in changed
+                  if chamber in chambers)
+    num_changed = len(targets)
+    if settings.BILLY_RESCRAPE_HORIZON:
+        horizon = dt.timedelta(days=settings.BILLY_RESCRAPE_HORIZON)
+        targets.update(_stale_bills(abbr, session, chambers, horizon,
+                                    settings.BILLY_RESCRAPE_STALE_LIMIT))
+
+    logger.info('%s: scraping %s bills changed since %s and %s stale bills' %
+                (session, num_changed, since, len(targets) - num_changed))
+    for chamber, bill_id in sorted(targets):
+        scraper.scrape_bill(chamber, session, bill_id)
+    return len(targets)
+
+
+def _mark_scraped(abbr, filenames):
+    """
+        stamp scraped_at on the manifest entries of bill files that were
+        just scraped, imports stamp it too but runs that only scrape have
+        to keep those bills from looking stale
+    """
+    if filenames:
+        db.import_manifests.update(
+            {'_id': {'$in': ['%s/bills/%s' % (abbr, filename)
+                             for filename in filenames]}},
+            {'$set': {'scraped_at': dt.datetime.utcnow()}},
+            multi=True, safe=True)
+
+
+def _run_scraper(scraper_type, options, metadata, import_queue=None):
     """
         scraper_type: bills, legislators, committees, votes
+        import_queue: if set, saved objects are put on it to be imported
     """
     _clear_scraped_data(options.output_dir, scraper_type)
 
     scraper = _get_configured_scraper(scraper_type, options, metadata)
+    if scraper:
+        scraper.import_queue = import_queue
     ua_email = os.environ.get('BILLY_UA_EMAIL')
     if ua_email and scraper:
         scraper.user_agent += ' ({})'.format(ua_email)
@@ -91,23 +213,57 @@ def _run_scraper(scraper_type, options, metadata):
             scraper.validate_term(time, scraper.latest_only)
 
     # run scraper against year/session/term
-    for time in times:
-        # old style
-        chambers = options.chambers
-        if scraper_type == 'events' and len(options.chambers) == 2:
-            chambers.append('other')
-
-        if _is_old_scrape(scraper.scrape):
-            for chamber in chambers:
-                scraper.scrape(chamber, time)
-        else:
-            scraper.scrape(time, chambers=chambers)
-
-        # error out if events or votes don't scrape anything
-        if not scraper.object_count and scraper_type not in ('events',
-                                                             'votes'):
-            raise ScrapeError("%s scraper didn't save any objects" %
-                              scraper_type)
+    try:
+        for time in times:
+            # old style
+            chambers = options.chambers
+            if scraper_type == 'events' and len(options.chambers) == 2:
+                chambers.append('other')
+
+            if scraper_type == 'bills' and options.changed_since:
+                targeted = _scrape_changed_bills(
+                    scraper, time, chambers, options.changed_since,
+                    metadata['abbreviation'])
+                if targeted is not None:
+                    scrape['targeted'] = scrape.get('targeted', 0) + targeted
+                    continue
+
+            if _is_old_scrape(scraper.scrape):
+                for chamber in chambers:
+                    scraper.scrape(chamber, time)
+            else:
+                scraper.scrape(time, chambers=chambers)
+
+            # error out if events or votes don't scrape anything
+            # (targeted scrapes may rightly find nothing to scrape)
+            if (not scraper.object_count and 'targeted' not in scrape and
+                    scraper_type not in ('events', 'votes')):
+                raise ScrapeError("%s scraper didn't save any objects" %
+                                  scraper_type)
+    finally:
+        # keep whatever was scraped, even if the scrape failed
+        scraper.close_output()
+
+    if scraper_type == 'bills' and options.changed_since:
+        _mark_scraped(metadata['abbreviation'], scraper.output_names)
+
+    if scraper.background_validation:
+        scrape['validation_errors'] = len(scraper.finish_validation())
+
+    scrape['cache'] = scraper.report_cache()
+    scrape['stats'] = scraper.report_stats()
+    # both default to None, which Settings doesn't set
+    max_size = getattr(settings, 'BILLY_CACHE_MAX_SIZE', None)
+    max_age = getattr(settings, 'BILLY_CACHE_MAX_AGE', None)
+    if isinstance(scraper.cache_storage, ScrapeCache):
+        evicted = scraper.cache_storage.evict(max_size, max_age)
+        if evicted:
+            logging.getLogger('billy').info(
+                'evicted %s cached responses' % evicted)
+    evicted = evict_converted(max_size, max_age)
+    if evicted:
+        logging.getLogger('billy').info(
+            'evicted %s cached PDF conversions' % evicted)
 
     scrape['end_time'] = dt.datetime.utcnow()
     runs.append(scrape)
@@ -128,11 +284,47 @@ def _scrape_solo_bills(options, metadata):
     else:
         raise ScrapeError('must specify --session when providing a --bill')
 
-    for bill_id in options.solo_bills:
-        scraper.scrape_bill(chamber, session, bill_id)
+    try:
+        for bill_id in options.solo_bills:
+            scraper.scrape_bill(chamber, session, bill_id)
+    finally:
+        scraper.close_output()
+
+
+def _start_bill_stream(abbrev, args, report):
+    """
+        import what bills depend on and start importing bills as they are
+        scraped, legislators imported here are skipped by _do_imports
+
+        the import slot is held until the stream is closed with
+        _close_bill_stream
+    """
+    from billy.importers.metadata import import_metadata
+    from billy.importers.legislators import import_legislators
+    from billy.importers.bills import BillImportStream
+
+    _acquire_import_slot()
+    try:
+        import_metadata(abbrev)
+        if 'legislators' in args.types:
+            report['legislators'] = \
+                import_legislators(abbrev, settings.BILLY_DATA_DIR)
+
+        return BillImportStream(abbrev, settings.BILLY_DATA_DIR)
+    except Exception:
+        _release_import_slot()
+        raise
 
 
-def _do_imports(abbrev, args):
+def _close_bill_stream(stream):
+    """ import the rest of a stream's bills and give up its import slot """
+    try:
+        return stream.close()
+    finally:
+        _release_import_slot()
+
+
+def _do_imports(abbrev, args, report=None):
     # do imports here so that scrape doesn't depend on mongo
     from billy.importers.metadata import import_metadata
     from billy.importers.bills import import_bills
@@ -142,14 +334,17 @@ def _do_imports(abbrev, args):
 
     # always import metadata and districts
     import_metadata(abbrev)
-    report = {}
+    report = report or {}
 
-    if 'legislators' in args.types:
+    if 'legislators' in args.types and 'legislators' not in report:
         report['legislators'] = \
             import_legislators(abbrev, settings.BILLY_DATA_DIR)
 
     if 'bills' in args.types:
-        report['bills'] = import_bills(abbrev, settings.BILLY_DATA_DIR)
+        # bills already imported while streaming are skipped as unchanged
+        report['bills'] = import_bills(abbrev, settings.BILLY_DATA_DIR,
+                                       workers=args.workers,
+                                       full_import=args.full_import)
 
     if 'committees' in args.types:
         report['committees'] = \
@@ -194,6 +389,21 @@ def main():
             parser.add_argument('--' + arg, dest='actions',
                                 action="append_const", const=arg,
                                 help='only run %s step' % arg)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='number of processes to import bills with')
+        parser.add_argument('--full-import', action='store_true',
+                            dest='full_import', default=False,
+                            help='import all bills, even those unchanged '
+                            'since the last import')
+        what.add_argument('--changed-since', dest='changed_since',
+                          metavar='SINCE', default=None,
+                          help='only scrape bills changed since SINCE (UTC '
+                          'YYYY-MM-DD[THH:MM[:SS]], or "last" for the last '
+                          'successful run) and stale ones, for scrapers '
+                          'that can report changes')
+        parser.add_argument('--pipeline', action='store_true',
+                            default=False,
+                            help='import bills while they are being scraped')
 
         # special modes for debugging
         scrape.add_argument('--nonstrict', action='store_false', dest='strict',
@@ -287,6 +497,15 @@ def main():
             args.types = ['bills', 'legislators', 'votes', 'committees',
                           'alldata']
 
+        if args.changed_since and 'scrape' in args.actions:
+            args.changed_since = _parse_since(args.changed_since, abbrev)
+
+        if args.pipeline and getattr(settings, 'ENABLE_GIT', False):
+            logging.getLogger('billy').warning(
+                'git export is not supported by --pipeline, importing bills '
+                'after the scrape')
+            args.pipeline = False
+
 
         plan = """billy-update abbr=%s
     actions=%s
@@ -297,6 +516,7 @@ def main():
         logging.getLogger('billy').info(plan)
 
         scrape_data = {}
+        import_report = {}
 
         if 'scrape' in args.actions:
             _clear_scraped_data(args.output_dir)
@@ -334,14 +554,29 @@ def main():
             # scraper order matters
             order = ('legislators', 'committees', 'votes', 'bills', 'events')
             _traceback = None
+            stream = None
             try:
                 for stype in order:
                     if stype in args.types:
-                        run_record += _run_scraper(stype, args, metadata)
+                        if (stype == 'bills' and args.pipeline and
+                                'import' in args.actions):
+                            stream = _start_bill_stream(abbrev, args,
+                                                        import_report)
+                        run_record += _run_scraper(stype, args, metadata,
+                                                   stream)
+                        if stype == 'bills' and stream:
+                            import_report['bills_streamed'] = \
+                                _close_bill_stream(stream)
+                            stream = None
             except Exception as e:
                 _traceback = _, _, exc_traceback = sys.exc_info()
                 run_record += [{"exception": e, "type": stype}]
                 lex = e
+            finally:
+                # keep the bills imported before the scrape failed
+                if stream:
+                    import_report['bills_streamed'] = \
+                        _close_bill_stream(stream)
 
             exec_end = dt.datetime.utcnow()
             exec_record['started'] = exec_start
@@ -364,6 +599,8 @@ def main():
                     scrape_data['failure'] = True
             if lex:
                 if 'import' in args.actions:
+                    if import_report:
+                        scrape_data['imported'] = import_report
                     try:
                         db.billy_runs.save(scrape_data, safe=True)
                     except Exception as e:
@@ -382,7 +619,8 @@ def main():
 
         # imports
         if 'import' in args.actions:
-            import_report = _do_imports(abbrev, args)
+            with _import_slot():
+                import_report = _do_imports(abbrev, args, import_report)
             scrape_data['imported'] = import_report
             # We're tying the run-logging into the import stage - since import
             # already writes to the DB, we might as well throw this in too.
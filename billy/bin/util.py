@@ -13,6 +13,11 @@ COMMAND_MODULES = (
     'billy.bin.commands.dump',
     'billy.bin.commands.update_leg_ids',
     'billy.bin.commands.loaddistricts',
+    'billy.bin.commands.seed_id_counters',
+    'billy.bin.commands.fulltext',
+    'billy.bin.commands.bench_import',
+    'billy.bin.commands.search_index',
+    'billy.bin.commands.bench_emitter',
 )
 
 
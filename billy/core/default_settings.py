@@ -8,15 +8,25 @@ BOUNDARY_SERVICE_URL = 'http://localhost:8001/1.0/'
 BOUNDARY_SERVICE_SETS = 'sldl-17,sldu-17,nh-12'
 
 API_BASE_URL = 'http://127.0.0.1:8000/api/v1/'
+# most bills an unpaginated /v1/bills/ search may return (None for no limit)
+BILLY_API_MAX_RESULTS = 50000
 
 SCRAPER_PATHS = []
 
 BILLY_DATA_DIR = os.path.join(os.getcwd(), 'data')
 BILLY_CACHE_DIR = os.path.join(os.getcwd(), 'cache')
 BILLY_MANUAL_DATA_DIR = os.path.join(os.getcwd(), 'manual_data')
+# snapshots of learned legislator names, relative to BILLY_CACHE_DIR
+# ('' disables them)
+BILLY_NAME_MATCHER_DIR = 'name_matchers'
 
 ENABLE_DOCUMENT_VIEW = {}
 
+# number of writes the importers send to mongo in each bulk operation
+BILLY_IMPORT_BATCH_SIZE = 1000
+# number of object/vote/document ids reserved from a counter at once
+BILLY_ID_BLOCK_SIZE = 20
+
 BILL_FILTERS = {}
 LEGISLATOR_FILTERS = {}
 EVENT_FILTERS = {}
@@ -111,6 +121,41 @@ SCRAPELIB_RPM = 60
 SCRAPELIB_TIMEOUT = 60
 SCRAPELIB_RETRY_ATTEMPTS = 3
 SCRAPELIB_RETRY_WAIT_SECONDS = 20
+# requests per minute for specific hosts, others use SCRAPELIB_RPM
+SCRAPELIB_HOST_RPM = {}
+# number of threads Scraper.fetch_many uses
+SCRAPELIB_FETCH_WORKERS = 4
+# validate scraped objects on a background thread and report the errors
+# at the end of each scrape, ignored for strict (default) scrapes
+BILLY_BACKGROUND_VALIDATION = False
+# how scraped objects are written: 'json' (a file per object), 'jsonl' or
+# 'jsonl.gz' (segments of BILLY_SCRAPE_SEGMENT_SIZE objects per type)
+BILLY_SCRAPE_OUTPUT_FORMAT = 'json'
+BILLY_SCRAPE_SEGMENT_SIZE = 1000
+# scraper cache eviction after each scrape: entries not fetched or validated
+# for BILLY_CACHE_MAX_AGE seconds, then the oldest beyond BILLY_CACHE_MAX_SIZE
+# bytes are removed (None disables either)
+BILLY_CACHE_MAX_AGE = None
+BILLY_CACHE_MAX_SIZE = None
+# billy-update --changed-since also scrapes bills not scraped for this many
+# days (0 to only scrape changed bills), at most
+# BILLY_RESCRAPE_STALE_LIMIT of them per session per run
+BILLY_RESCRAPE_HORIZON = 7
+BILLY_RESCRAPE_STALE_LIMIT = 500
+# text extracted from PDFs, keyed by the PDF's contents, relative to
+# BILLY_CACHE_DIR ('' disables), evicted like the scraper cache
+BILLY_PDF_CACHE_DIR = 'pdf'
+# number of PDFs converted at once by convert_many, None for one per CPU
+BILLY_PDF_WORKERS = None
+# local store for billy-util fulltext when AWS_BUCKET isn't set
+BILLY_FULLTEXT_DIR = os.path.join(os.getcwd(), 'fulltext')
+BILLY_FULLTEXT_WORKERS = 8
+# billy-util search-index --fulltext indexes this many of the most common
+# terms of each version's text
+BILLY_SEARCH_TEXT_TERMS = 2000
+# sort=relevance ranks this many of the most recent matches of a search
+# (None ranks every match)
+BILLY_SEARCH_MAX_RANKED = 1000
 
 AWS_KEY = ''
 AWS_SECRET = ''
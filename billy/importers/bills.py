@@ -1,21 +1,29 @@
 from __future__ import print_function
 import os
-import glob
 import json
+import hashlib
 import logging
 import datetime
+import threading
+import multiprocessing
 from time import time
 from collections import defaultdict
+from six.moves import queue
 
 from billy.core import settings, db
 from billy.utils import (metadata, term_for_session, fix_bill_id,
                          JSONEncoderPlus)
-from billy.importers.names import get_legislator_id
+from billy.utils.search import set_search_fields
+from billy.importers.names import get_legislator_id, get_legislator_ids
 from billy.importers.filters import apply_filters
+from billy.scrape.output import iter_scraped, list_sources, read_source
 
 from billy.importers.subjects import SubjectCategorizer
+from billy.importers import utils
+from billy.importers.timing import stage
 from billy.importers.utils import (insert_with_id, update, prepare_obj,
-                                   next_big_id, get_committee_id)
+                                   next_seq, get_committee_id, BulkWriter,
+                                   pop_committee_stats, log_committee_stats)
 
 if hasattr(settings, "ENABLE_GIT") and settings.ENABLE_GIT:
     from dulwich.repo import Repo
@@ -43,22 +51,65 @@ def match_sponsor_ids(abbr, bill):
                                                        sponsor['name'])
 
 
-def load_standalone_votes(data_dir):
-    pattern = os.path.join(data_dir, 'votes', '*.json')
-    paths = glob.glob(pattern)
+class StandaloneVotes(object):
+    """
+    Index of the standalone vote files in a data directory.
+
+    Maps (bill_chamber, session, bill_id) keys to references to the votes
+    for that bill (a file, or a segment and line), votes are only read when
+    their key is popped so memory doesn't grow with the number of votes
+    scraped.
+    """
+
+    def __init__(self):
+        self._paths = defaultdict(list)
+
+    def add(self, key, scraped):
+        self._paths[key].append(scraped.reference())
+
+    def keys(self):
+        return list(self._paths.keys())
+
+    def _load(self, scraped):
+        data = prepare_obj(scraped.load())
+        data.pop('bill_id')
+        return data
+
+    def get(self, key, default=None):
+        if key not in self._paths:
+            return default
+        return [self._load(scraped) for scraped in self._paths[key]]
+
+    def pop(self, key, default=None):
+        votes = self.get(key, default)
+        self.discard(key)
+        return votes
+
+    def discard(self, key):
+        """ forget about key's votes without loading them """
+        self._paths.pop(key, None)
 
-    votes = defaultdict(list)
+    def hash(self, key):
+        """ hash of the contents of key's vote files, in any order """
+        digests = [hashlib.sha1(scraped.read()).hexdigest()
+                   for scraped in self._paths.get(key, [])]
+        return hashlib.sha1(''.join(sorted(digests)).encode()).hexdigest()
 
-    for path in paths:
-        with open(path) as f:
-            data = prepare_obj(json.load(f))
+
+def load_standalone_votes(data_dir):
+    votes = StandaloneVotes()
+    count = 0
+
+    for scraped in iter_scraped(os.path.join(data_dir, 'votes')):
+        data = scraped.load()
+        count += 1
 
         # need to match bill_id already in the database
-        bill_id = fix_bill_id(data.pop('bill_id'))
+        bill_id = fix_bill_id(data['bill_id'])
 
-        votes[(data['bill_chamber'], data['session'], bill_id)].append(data)
+        votes.add((data['bill_chamber'], data['session'], bill_id), scraped)
 
-    logger.info('imported %s vote files' % len(paths))
+    logger.info('indexed %s vote files' % count)
     return votes
 
 
@@ -172,13 +223,18 @@ def git_prelod(abbr):
     git_active_tree = tree
 
 
-def import_bill(data, standalone_votes, categorizer):
+def import_bill(data, standalone_votes, categorizer, bill_writer=None,
+                vote_writer=None, existing_votes=None):
     """
         insert or update a bill
 
         data - raw bill JSON
         standalone_votes - votes scraped separately
         categorizer - SubjectCategorizer (None - no categorization)
+        bill_writer, vote_writer - BulkWriters to queue bill/vote updates
+                                   on (None - write immediately)
+        existing_votes - ExistingVotes of the jurisdiction (None - query
+                         the bill's votes)
     """
     abbr = data[settings.LEVEL_FIELD]
 
@@ -198,37 +254,42 @@ def import_bill(data, standalone_votes, categorizer):
 
     # update categorized subjects
     if categorizer:
-        categorizer.categorize_bill(data)
+        with stage('categorize'):
+            categorizer.categorize_bill(data)
 
     # companions
-    for companion in data['companions']:
-        companion['bill_id'] = fix_bill_id(companion['bill_id'])
-        # query based on companion
-        spec = companion.copy()
-        spec[settings.LEVEL_FIELD] = abbr
-        if not spec['chamber']:
-            spec.pop('chamber')
-        companion_obj = db.bills.find_one(spec)
-        if companion_obj:
-            companion['internal_id'] = companion_obj['_id']
-        else:
-            logger.warning('Unknown companion: {chamber} {session} {bill_id}'
-                           .format(**companion))
+    with stage('companions'):
+        for companion in data['companions']:
+            companion['bill_id'] = fix_bill_id(companion['bill_id'])
+            # query based on companion
+            spec = companion.copy()
+            spec[settings.LEVEL_FIELD] = abbr
+            if not spec['chamber']:
+                spec.pop('chamber')
+            companion_obj = db.bills.find_one(spec)
+            if companion_obj:
+                companion['internal_id'] = companion_obj['_id']
+            else:
+                logger.warning('Unknown companion: {chamber} {session} '
+                               '{bill_id}'.format(**companion))
 
     # look for a prior version of this bill
-    bill = db.bills.find_one({settings.LEVEL_FIELD: abbr,
-                              'session': data['session'],
-                              'chamber': data['chamber'],
-                              'bill_id': data['bill_id']})
+    with stage('find_bill'):
+        bill = db.bills.find_one({settings.LEVEL_FIELD: abbr,
+                                  'session': data['session'],
+                                  'chamber': data['chamber'],
+                                  'bill_id': data['bill_id']})
 
     # keep doc ids consistent
-    doc_matcher = DocumentMatcher(abbr)
-    if bill:
-        doc_matcher.learn_ids(bill['versions'] + bill['documents'])
-    doc_matcher.set_ids(data['versions'] + data['documents'])
+    with stage('documents'):
+        doc_matcher = DocumentMatcher(abbr)
+        if bill:
+            doc_matcher.learn_ids(bill['versions'] + bill['documents'])
+        doc_matcher.set_ids(data['versions'] + data['documents'])
 
     # match sponsor leg_ids
-    match_sponsor_ids(abbr, data)
+    with stage('sponsors'):
+        match_sponsor_ids(abbr, data)
 
     # process votes ############
 
@@ -236,25 +297,19 @@ def import_bill(data, standalone_votes, categorizer):
     bill_votes = data.pop('votes', [])
 
     # grab the external bill votes if present
-    if metadata(abbr).get('_partial_vote_bill_id'):
-        # this is a hack initially added for Rhode Island where we can't
-        # determine the full bill_id, if this key is in the metadata
-        # we just use the numeric portion, not ideal as it won't work
-        # where HB/SBs overlap, but in RI they never do
-        # pull off numeric portion of bill_id
-        numeric_bill_id = data['bill_id'].split()[1]
-        bill_votes += standalone_votes.pop((data['chamber'], data['session'],
-                                            numeric_bill_id), [])
-    else:
-        # add loaded votes to data
-        bill_votes += standalone_votes.pop((data['chamber'], data['session'],
-                                            data['bill_id']), [])
+    # if _partial_vote_bill_id is in the metadata, votes are keyed by the
+    # numeric portion of the bill_id only, this is a hack initially added
+    # for Rhode Island where we can't determine the full bill_id, not ideal
+    # as it won't work where HB/SBs overlap, but in RI they never do
+    bill_votes += standalone_votes.pop(standalone_vote_key(data), [])
 
     # do id matching and other vote prep
-    if bill:
-        prepare_votes(abbr, data['session'], bill['_id'], bill_votes)
-    else:
-        prepare_votes(abbr, data['session'], None, bill_votes)
+    with stage('votes'):
+        if bill:
+            prepare_votes(abbr, data['session'], bill['_id'], bill_votes,
+                          existing_votes)
+        else:
+            prepare_votes(abbr, data['session'], None, bill_votes)
 
     # process actions ###########
 
@@ -276,80 +331,81 @@ def import_bill(data, standalone_votes, categorizer):
     already_linked = set()
     remove_vote = set()
 
-    for action in data['actions']:
-        adate = action['date']
-
-        def _match_committee(name):
-            return get_committee_id(abbr, action['actor'], name)
-
-        def _match_legislator(name):
-            return get_legislator_id(abbr,
-                                     data['session'],
-                                     action['actor'],
-                                     name)
-
-        resolvers = {
-            "committee": _match_committee,
-            "legislator": _match_legislator
-        }
-
-        if "related_entities" in action:
-            for entity in action['related_entities']:
-                try:
-                    resolver = resolvers[entity['type']]
-                except KeyError as e:
-                    # We don't know how to deal.
-                    logger.error("I don't know how to sort a %s" % e)
-                    continue
-
-                id = resolver(entity['name'])
-                entity['id'] = id
-
-        # first & last dates
-        if not dates['first'] or adate < dates['first']:
-            dates['first'] = adate
-        if not dates['last'] or adate > dates['last']:
-            dates['last'] = adate
-
-        # passed & signed dates
-        if (not dates['passed_upper'] and action['actor'] == 'upper'
-                and 'bill:passed' in action['type']):
-            dates['passed_upper'] = adate
-        elif (not dates['passed_lower'] and action['actor'] == 'lower'
-                and 'bill:passed' in action['type']):
-            dates['passed_lower'] = adate
-        elif (not dates['signed'] and 'governor:signed' in action['type']):
-            dates['signed'] = adate
-
-        # vote-action matching
-        action_attached = False
-        # only attempt vote matching if action has a date and is one of the
-        # designated vote action types
-        if set(action['type']).intersection(vote_flags) and action['date']:
-            for vote in bill_votes:
-                if not vote['date']:
-                    continue
-
-                delta = abs(vote['date'] - action['date'])
-                if (delta < datetime.timedelta(hours=20) and
-                        vote['chamber'] == action['actor']):
-                    if action_attached:
-                        # multiple votes match, we can't guess
-                        action.pop('related_votes', None)
-                    else:
-                        related_vote = vote['vote_id']
-                        if related_vote in already_linked:
-                            remove_vote.add(related_vote)
-
-                        already_linked.add(related_vote)
-                        action['related_votes'] = [related_vote]
-                        action_attached = True
-
-    # remove related_votes that we linked to multiple actions
-    for action in data['actions']:
-        for vote in remove_vote:
-            if vote in action.get('related_votes', []):
-                action['related_votes'].remove(vote)
+    with stage('actions'):
+        for action in data['actions']:
+            adate = action['date']
+
+            def _match_committee(name):
+                return get_committee_id(abbr, action['actor'], name)
+
+            def _match_legislator(name):
+                return get_legislator_id(abbr,
+                                         data['session'],
+                                         action['actor'],
+                                         name)
+
+            resolvers = {
+                "committee": _match_committee,
+                "legislator": _match_legislator
+            }
+
+            if "related_entities" in action:
+                for entity in action['related_entities']:
+                    try:
+                        resolver = resolvers[entity['type']]
+                    except KeyError as e:
+                        # We don't know how to deal.
+                        logger.error("I don't know how to sort a %s" % e)
+                        continue
+
+                    with stage('entities'):
+                        entity['id'] = resolver(entity['name'])
+
+            # first & last dates
+            if not dates['first'] or adate < dates['first']:
+                dates['first'] = adate
+            if not dates['last'] or adate > dates['last']:
+                dates['last'] = adate
+
+            # passed & signed dates
+            if (not dates['passed_upper'] and action['actor'] == 'upper'
+                    and 'bill:passed' in action['type']):
+                dates['passed_upper'] = adate
+            elif (not dates['passed_lower'] and action['actor'] == 'lower'
+                    and 'bill:passed' in action['type']):
+                dates['passed_lower'] = adate
+            elif (not dates['signed'] and 'governor:signed' in action['type']):
+                dates['signed'] = adate
+
+            # vote-action matching
+            action_attached = False
+            # only attempt vote matching if action has a date and is one of the
+            # designated vote action types
+            if set(action['type']).intersection(vote_flags) and action['date']:
+                for vote in bill_votes:
+                    if not vote['date']:
+                        continue
+
+                    delta = abs(vote['date'] - action['date'])
+                    if (delta < datetime.timedelta(hours=20) and
+                            vote['chamber'] == action['actor']):
+                        if action_attached:
+                            # multiple votes match, we can't guess
+                            action.pop('related_votes', None)
+                        else:
+                            related_vote = vote['vote_id']
+                            if related_vote in already_linked:
+                                remove_vote.add(related_vote)
+
+                            already_linked.add(related_vote)
+                            action['related_votes'] = [related_vote]
+                            action_attached = True
+
+        # remove related_votes that we linked to multiple actions
+        for action in data['actions']:
+            for vote in remove_vote:
+                if vote in action.get('related_votes', []):
+                    action['related_votes'].remove(vote)
 
     # save action dates to data
     data['action_dates'] = dates
@@ -371,54 +427,253 @@ def import_bill(data, standalone_votes, categorizer):
     except KeyError:
         pass
     data['alternate_titles'] = list(alt_titles)
-    data = apply_filters(filters, data)
+    with stage('filters'):
+        data = apply_filters(filters, data)
+
+    # text terms are only added by billy-util search-index, keep them
+    with stage('search'):
+        set_search_fields(data, bill.get('_text_terms') if bill else None)
+
+    with stage('save'):
+        if not bill:
+            insert_with_id(data)
+            git_add_bill(data)
+            save_votes(data, bill_votes, vote_writer, existing_votes)
+            return "insert"
+        else:
+            update(bill, data, bill_writer or db.bills)
+            git_add_bill(bill)
+            save_votes(bill, bill_votes, vote_writer, existing_votes)
+            return "update"
 
-    if not bill:
-        insert_with_id(data)
-        git_add_bill(data)
-        save_votes(data, bill_votes)
-        return "insert"
-    else:
-        update(bill, data, db.bills)
-        git_add_bill(bill)
-        save_votes(bill, bill_votes)
-        return "update"
+
+def standalone_vote_key(data):
+    """ key of the standalone votes that belong to a (fixed bill_id) bill """
+    if metadata(data[settings.LEVEL_FIELD]).get('_partial_vote_bill_id'):
+        # see import_bill for an explanation of this hack
+        return (data['chamber'], data['session'], data['bill_id'].split()[1])
+    return (data['chamber'], data['session'], data['bill_id'])
+
+
+def load_bill_manifest(abbr):
+    """
+        load the manifest of previously imported bill files
+
+        returns a dict mapping filename to manifest entry, entries whose bill
+        no longer exists are left out so that those files get reimported
+    """
+    bill_ids = set(bill['_id'] for bill in
+                   db.bills.find({settings.LEVEL_FIELD: abbr}, fields=[]))
+    return dict((entry['filename'], entry) for entry in
+                db.import_manifests.find({settings.LEVEL_FIELD: abbr,
+                                          'type': 'bill'})
+                if entry['obj_id'] in bill_ids)
+
+
+def save_bill_manifest(abbr, entries):
+    """ record the bill files imported by this run in the manifest """
+    bill_ids = {}
+    spec = {settings.LEVEL_FIELD: abbr,
+            'bill_id': {'$in': list(set(entry['bill_key'][2]
+                                        for entry in entries))}}
+    for bill in db.bills.find(spec, fields=['chamber', 'session', 'bill_id']):
+        bill_ids[(bill['chamber'], bill['session'], bill['bill_id'])] = \
+            bill['_id']
+
+    with BulkWriter(db.import_manifests) as writer:
+        for entry in entries:
+            entry['obj_id'] = bill_ids.get(entry.pop('bill_key'))
+            entry['_id'] = '%s/bills/%s' % (abbr, entry['filename'])
+            entry[settings.LEVEL_FIELD] = abbr
+            entry['type'] = 'bill'
+            writer.save(entry)
+
+
+def _import_bill_files(abbr, bill_files, votes, categorizer, manifest,
+                       existing_votes):
+    """
+        import ScrapedObjects of bills, skipping those that are unchanged
+        (along with their standalone votes) since they were last imported
+
+        existing_votes is the ExistingVotes of the whole import, so that the
+        votes of a session are only loaded once
+
+        returns a tuple of (counts, manifest entries for the imported files)
+    """
+    counts = defaultdict(int)
+    entries = []
+    skipped = []
+    now = datetime.datetime.utcnow()
+
+    with BulkWriter(db.bills) as bill_writer, \
+            BulkWriter(db.votes) as vote_writer:
+        for scraped in bill_files:
+            raw = scraped.read()
+
+            counts["total"] += 1
+            filename = scraped.name
+            file_hash = hashlib.sha1(raw).hexdigest()
+
+            entry = manifest.get(filename)
+            if entry and entry['hash'] == file_hash:
+                vote_key = tuple(entry['vote_key'])
+                if votes.hash(vote_key) == entry['votes_hash']:
+                    votes.discard(vote_key)
+                    counts["skipped"] += 1
+                    skipped.append('%s/bills/%s' % (abbr, filename))
+                    continue
+
+            with stage('parse'):
+                data = prepare_obj(json.loads(raw.decode('utf-8')))
+            data['bill_id'] = fix_bill_id(data['bill_id'])
+            vote_key = standalone_vote_key(data)
+            votes_hash = votes.hash(vote_key)
+
+            ret = import_bill(data, votes, categorizer, bill_writer,
+                              vote_writer, existing_votes)
+            counts[ret] += 1
+
+            entries.append({'filename': filename, 'hash': file_hash,
+                            'vote_key': list(vote_key),
+                            'votes_hash': votes_hash,
+                            'scraped_at': now,
+                            'bill_key': (data['chamber'], data['session'],
+                                         data['bill_id'])})
+
+    # unchanged bills were still scraped, targeted re-scrapes (see
+    # billy-update --changed-since) rely on scraped_at to find stale bills
+    if skipped:
+        db.import_manifests.update({'_id': {'$in': skipped}},
+                                   {'$set': {'scraped_at': now}},
+                                   multi=True, safe=True)
+
+    return counts, entries
+
+
+# number of bill files handed to a worker at a time by parallel imports
+IMPORT_CHUNK_SIZE = 100
+
+# per-process state for parallel import workers, set by _init_import_worker
+_worker_abbr = None
+_worker_votes = None
+_worker_categorizer = None
+_worker_manifest = None
+_worker_existing_votes = None
+
+
+def _init_import_worker(abbr, votes, categorizer, manifest):
+    global _worker_abbr
+    global _worker_votes
+    global _worker_categorizer
+    global _worker_manifest
+    global _worker_existing_votes
+    _worker_abbr = abbr
+    _worker_votes = votes
+    _worker_categorizer = categorizer
+    _worker_manifest = manifest
+    _worker_existing_votes = ExistingVotes(abbr)
+    # id blocks reserved by the parent (eg. by a BillImportStream) were
+    # copied into every worker, each has to reserve its own
+    utils._id_blocks.clear()
+
+
+def _import_bill_chunk(source):
+    """
+        import a source of bill files (see list_sources) within a worker
+        process
+
+        returns a tuple of (counts, manifest entries, keys of the standalone
+        votes consumed, committee lookup statistics)
+    """
+    vote_keys = set(_worker_votes.keys())
+    counts, entries = _import_bill_files(_worker_abbr, read_source(source),
+                                         _worker_votes, _worker_categorizer,
+                                         _worker_manifest,
+                                         _worker_existing_votes)
+    return (dict(counts), entries, vote_keys - set(_worker_votes.keys()),
+            pop_committee_stats(_worker_abbr))
+
+
+def _load_categorizer(abbr):
+    try:
+        return SubjectCategorizer(abbr)
+    except Exception as e:
+        logger.debug('Proceeding without subject categorizer: %s' % e)
+        return None
 
 
-def import_bills(abbr, data_dir):
+def import_bills(abbr, data_dir, workers=1, full_import=False):
+    """
+        import all scraped bills for a jurisdiction
+
+        abbr - jurisdiction abbreviation
+        data_dir - root data directory
+        workers - number of processes to import bill files with, bill files
+                  are split into chunks and imported in parallel if > 1
+        full_import - import every bill file, by default files that are
+                      unchanged since the last import are skipped
+    """
     data_dir = os.path.join(data_dir, abbr)
-    pattern = os.path.join(data_dir, 'bills', '*.json')
+    bills_dir = os.path.join(data_dir, 'bills')
+
+    if workers > 1 and getattr(settings, 'ENABLE_GIT', False):
+        logger.warning('git export is not supported by parallel imports, '
+                       'importing with a single process')
+        workers = 1
 
     git_prelod(abbr)
 
     counts = {
         "update": 0,
         "insert": 0,
+        "skipped": 0,
         "total": 0
     }
 
     votes = load_standalone_votes(data_dir)
-    try:
-        categorizer = SubjectCategorizer(abbr)
-    except Exception as e:
-        logger.debug('Proceeding without subject categorizer: %s' % e)
-        categorizer = None
-
-    paths = glob.glob(pattern)
-    for path in paths:
-        with open(path) as f:
-            data = prepare_obj(json.load(f))
-
-        counts["total"] += 1
-        ret = import_bill(data, votes, categorizer)
-        counts[ret] += 1
+    categorizer = _load_categorizer(abbr)
+
+    manifest = {} if full_import else load_bill_manifest(abbr)
+    entries = []
+    committee_stats = defaultdict(int)
+
+    if workers > 1:
+        chunks = list_sources(bills_dir, IMPORT_CHUNK_SIZE)
+        # workers get a copy of the standalone votes, the keys they used are
+        # removed here so that unmatched votes are still reported
+        pool = multiprocessing.Pool(workers, _init_import_worker,
+                                    (abbr, votes, categorizer, manifest))
+        try:
+            for chunk_counts, chunk_entries, used_keys, chunk_stats in \
+                    pool.imap_unordered(_import_bill_chunk, chunks):
+                for key, value in chunk_counts.items():
+                    counts[key] += value
+                for key, value in chunk_stats.items():
+                    committee_stats[key] += value
+                entries.extend(chunk_entries)
+                for key in used_keys:
+                    votes.discard(key)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        file_counts, entries = _import_bill_files(
+            abbr, iter_scraped(bills_dir), votes, categorizer, manifest,
+            ExistingVotes(abbr))
+        for key, value in file_counts.items():
+            counts[key] += value
+        committee_stats.update(pop_committee_stats(abbr))
 
-    logger.info('imported %s bill files' % len(paths))
+    logger.info('imported %s bill files (%s unchanged)' % (
+        counts["total"], counts["skipped"]))
+    log_committee_stats(abbr, committee_stats)
 
     for remaining in votes.keys():
         logger.debug('Failed to match vote %s %s %s' % tuple([
             r.encode('ascii', 'replace') for r in remaining]))
 
+    save_bill_manifest(abbr, entries)
+
     populate_current_fields(abbr)
 
     git_commit("Import Update")
@@ -426,6 +681,84 @@ def import_bills(abbr, data_dir):
     return counts
 
 
+class BillImportStream(object):
+    """
+    Imports bill files while the bill scraper is still writing them.
+
+    The scraper put()s a ScrapedObject for each bill it saves onto a bounded
+    queue (blocking when the importer falls behind), a background thread
+    imports them in batches and records each batch in the manifest.  The
+    import_bills run after the scrape then skips every file imported here,
+    and if the scrape fails the bills imported so far are kept.
+
+    Standalone votes and legislators must already have been scraped (and
+    legislators imported) when the stream is started.
+    """
+
+    def __init__(self, abbr, data_dir, maxsize=IMPORT_CHUNK_SIZE * 10):
+        self.abbr = abbr
+        self.data_dir = os.path.join(data_dir, abbr)
+        self.counts = defaultdict(int)
+        self.error = None
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, scraped):
+        self._queue.put(scraped)
+
+    def close(self):
+        """ import whatever is still queued, returns the import counts """
+        self._queue.put(None)
+        self._thread.join()
+        if self.error:
+            logger.warning('streaming import of %s bills failed (%s), they '
+                           'will be imported after the scrape' %
+                           (self.abbr, self.error))
+        else:
+            logger.info('imported %s bill files while scraping' %
+                        self.counts['total'])
+        return dict(self.counts)
+
+    def _batches(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while len(batch) < IMPORT_CHUNK_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                done = True
+            if batch:
+                yield batch
+
+    def _run(self):
+        batches = self._batches()
+        try:
+            votes = load_standalone_votes(self.data_dir)
+            categorizer = _load_categorizer(self.abbr)
+            manifest = load_bill_manifest(self.abbr)
+            existing_votes = ExistingVotes(self.abbr)
+            for batch in batches:
+                counts, entries = _import_bill_files(self.abbr, batch, votes,
+                                                     categorizer, manifest,
+                                                     existing_votes)
+                save_bill_manifest(self.abbr, entries)
+                for key, value in counts.items():
+                    self.counts[key] += value
+        except Exception as e:
+            logger.exception('streaming import of %s bills failed' %
+                             self.abbr)
+            self.error = e
+            # keep draining the queue so that the scraper never blocks
+            for batch in batches:
+                pass
+
+
 def populate_current_fields(abbr):
     """
     Set/update _current_term and _current_session fields on all bills
@@ -435,28 +768,77 @@ def populate_current_fields(abbr):
     current_term = meta['terms'][-1]
     current_session = current_term['sessions'][-1]
 
-    for bill in db.bills.find({settings.LEVEL_FIELD: abbr}):
-        if bill['session'] == current_session:
-            bill['_current_session'] = True
-        else:
-            bill['_current_session'] = False
+    # only bills whose flags actually change are matched
+    updates = [
+        ('_current_session', {'session': current_session}, True),
+        ('_current_session', {'session': {'$ne': current_session}}, False),
+        ('_current_term', {'session': {'$in': current_term['sessions']}},
+         True),
+        ('_current_term', {'session': {'$nin': current_term['sessions']}},
+         False),
+    ]
+
+    touched = 0
+    for field, spec, value in updates:
+        spec = dict(spec)
+        spec[settings.LEVEL_FIELD] = abbr
+        spec[field] = {'$ne': value}
+        result = db.bills.update(spec, {'$set': {field: value}}, multi=True,
+                                 safe=True)
+        touched += result['n']
 
-        if bill['session'] in current_term['sessions']:
-            bill['_current_term'] = True
-        else:
-            bill['_current_term'] = False
+    logger.info('updated current session/term on %s bills' % touched)
+    return touched
+
+
+class ExistingVotes(object):
+    """
+    Index of the vote ids already saved for a jurisdiction's bills.
+
+    Votes are loaded with a single query per session (on the votes'
+    abbr/session/bill_id index) instead of one query per bill, one index is
+    kept for a whole import and save_votes keeps it current as votes are
+    saved.
+    """
+
+    fields = ('bill_id', 'vote_id', 'motion', 'chamber', 'date',
+              'yes_count', 'no_count', 'other_count')
+
+    def __init__(self, abbr):
+        self.abbr = abbr
+        self._sessions = {}
+
+    def _votes_for_session(self, session):
+        if session not in self._sessions:
+            votes = defaultdict(list)
+            for vote in db.votes.find({settings.LEVEL_FIELD: self.abbr,
+                                       'session': session},
+                                      fields=self.fields):
+                votes[vote['bill_id']].append(vote)
+            self._sessions[session] = votes
+        return self._sessions[session]
 
-        db.bills.save(bill, safe=True)
+    def get(self, session, bill_id):
+        return self._votes_for_session(session).get(bill_id, [])
 
+    def set(self, session, bill_id, votes):
+        if session in self._sessions:
+            self._sessions[session][bill_id] = [
+                dict((field, vote.get(field)) for field in self.fields)
+                for vote in votes]
 
-def prepare_votes(abbr, session, bill_id, scraped_votes):
+
+def prepare_votes(abbr, session, bill_id, scraped_votes, existing_votes=None):
     # if bill already exists, try and preserve vote_ids
     vote_matcher = VoteMatcher(abbr)
 
     if bill_id:
-        existing_votes = list(db.votes.find({'bill_id': bill_id}))
-        if existing_votes:
-            vote_matcher.learn_ids(existing_votes)
+        if existing_votes is not None:
+            bill_votes = existing_votes.get(session, bill_id)
+        else:
+            bill_votes = list(db.votes.find({'bill_id': bill_id}))
+        if bill_votes:
+            vote_matcher.learn_ids(bill_votes)
 
     vote_matcher.set_ids(scraped_votes)
 
@@ -472,22 +854,19 @@ def prepare_votes(abbr, session, bill_id, scraped_votes):
         # vote leg_ids
         vote['_voters'] = []
         for vtype in ('yes_votes', 'no_votes', 'other_votes'):
-            svlist = []
-            for svote in vote[vtype]:
-                id = get_legislator_id(abbr, session, vote['chamber'], svote)
-                svlist.append({'name': svote, 'leg_id': id})
-                vote['_voters'].append(id)
-
-            vote[vtype] = svlist
+            ids = get_legislator_ids(abbr, session, vote['chamber'],
+                                     vote[vtype])
+            vote[vtype] = [{'name': svote, 'leg_id': id}
+                           for svote, id in zip(vote[vtype], ids)]
+            vote['_voters'].extend(ids)
 
 
-def save_votes(bill, votes):
+def save_votes(bill, votes, writer=None, existing_votes=None):
     # doesn't delete votes if none were scraped this time
     if not votes:
         return
 
-    # remove all existing votes for this bill
-    db.votes.remove({'bill_id': bill['_id']}, safe=True)
+    writer = writer or db.votes
 
     # save the votes
     for vote in votes:
@@ -495,7 +874,16 @@ def save_votes(bill, votes):
         vote['bill_id'] = bill['_id']
         vote[settings.LEVEL_FIELD] = bill[settings.LEVEL_FIELD]
         vote['session'] = bill['session']
-        db.votes.save(vote, safe=True)
+        writer.save(vote, safe=True)
+
+    # remove all other existing votes for this bill, excluding the saved ids
+    # keeps this correct when the writes are applied in any order
+    writer.remove({'bill_id': bill['_id'],
+                   '_id': {'$nin': [vote['_id'] for vote in votes]}},
+                  safe=True)
+
+    if existing_votes is not None:
+        existing_votes.set(bill['session'], bill['_id'], votes)
 
 
 class GenericIDMatcher(object):
@@ -508,7 +896,8 @@ class GenericIDMatcher(object):
         self.seq_for_key = defaultdict(int)
 
     def _get_next_id(self):
-        return next_big_id(self.abbr, self.id_letter, self.id_collection)
+        seq = next_seq(self.abbr, self.id_collection)
+        return "%s%s%08d" % (self.abbr.upper(), self.id_letter, seq)
 
     def nondup_key_for_item(self, item):
         # call user's key_for_item
@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 import os
-import glob
-import json
 import datetime
 import logging
 
 from billy.core import db
 from billy.core import settings
 from billy.importers.names import get_legislator_id
-from billy.importers.utils import prepare_obj, update, insert_with_id
+from billy.scrape.output import iter_scraped
+from billy.importers.utils import (prepare_obj, update, insert_with_id,
+                                   BulkWriter, reset_committee_resolver,
+                                   set_normalized_fields)
 
 logger = logging.getLogger('billy')
 
@@ -63,7 +64,14 @@ def import_committees_from_legislators(current_term, abbr):
         db.legislators.save(legislator, safe=True)
 
 
-def import_committee(data, current_session, current_term):
+def import_committee(data, current_session, current_term, writer=None):
+    """
+        insert or update a committee and the roles of its members
+
+        writer - BulkWriter to queue committee updates on
+                 (None - write immediately)
+    """
+    writer = writer or db.committees
     abbr = data[settings.LEVEL_FIELD]
     spec = {settings.LEVEL_FIELD: abbr,
             'chamber': data['chamber'],
@@ -81,11 +89,12 @@ def import_committee(data, current_session, current_term):
         committee = data
         committee_return_status = "insert"
     else:
-        update(committee, data, db.committees)
         committee_return_status = "update"
 
-    # deal with the members, add roles
-    for member in committee['members']:
+    # deal with the members, add roles (the scraped members are matched
+    # before an existing committee is updated with them so that each
+    # committee is only written once)
+    for member in data['members']:
         if not member['name']:
             continue
 
@@ -129,16 +138,19 @@ def import_committee(data, current_session, current_term):
             if 'subcommittee' in committee:
                 new_role['subcommittee'] = committee['subcommittee']
             legislator['roles'].append(new_role)
+            set_normalized_fields(legislator)
             legislator['updated_at'] = datetime.datetime.utcnow()
             db.legislators.save(legislator, safe=True)
 
-    db.committees.save(committee, safe=True)
+    if committee_return_status == "insert":
+        writer.save(committee, safe=True)
+    else:
+        update(committee, data, writer)
     return committee_return_status
 
 
 def import_committees(abbr, data_dir):
     data_dir = os.path.join(data_dir, abbr)
-    pattern = os.path.join(data_dir, 'committees', '*.json')
 
     counts = {
         "update": 0,
@@ -150,45 +162,50 @@ def import_committees(abbr, data_dir):
     current_term = meta['terms'][-1]['name']
     current_session = meta['terms'][-1]['sessions'][-1]
 
-    paths = glob.glob(pattern)
+    committee_files = list(iter_scraped(os.path.join(data_dir, 'committees')))
 
-    for committee in db.committees.find({settings.LEVEL_FIELD: abbr}):
-        committee['members'] = []
-        db.committees.save(committee, safe=True)
+    db.committees.update({settings.LEVEL_FIELD: abbr},
+                         {'$set': {'members': []}}, multi=True, safe=True)
 
     # import committees from legislator roles, no standalone committees scraped
-    if not paths:
+    if not committee_files:
         import_committees_from_legislators(current_term, abbr)
 
-    for path in paths:
-        with open(path) as f:
-            data = prepare_obj(json.load(f))
+    with BulkWriter(db.committees) as writer:
+        for scraped in committee_files:
+            data = prepare_obj(scraped.load())
 
-        counts["total"] += 1
-        ret = import_committee(data, current_session, current_term)
-        counts[ret] += 1
+            counts["total"] += 1
+            ret = import_committee(data, current_session, current_term,
+                                   writer)
+            counts[ret] += 1
 
-    logger.info('imported %s committee files' % len(paths))
+    logger.info('imported %s committee files' % len(committee_files))
 
     link_parents(abbr)
 
+    # committee lookups have to see the new committees
+    reset_committee_resolver(abbr)
+
     return counts
 
 
 def link_parents(abbr):
-    for comm in db.committees.find({settings.LEVEL_FIELD: abbr}):
-        sub = comm.get('subcommittee')
-        if not sub:
-            comm['parent_id'] = None
-        else:
-            parent = db.committees.find_one({settings.LEVEL_FIELD: abbr,
-                                             'chamber': comm['chamber'],
-                                             'committee': comm['committee'],
-                                             'subcommittee': None})
-            if not parent:
-                logger.warning("Failed finding parent for: %s" % sub)
+    with BulkWriter(db.committees) as writer:
+        for comm in db.committees.find({settings.LEVEL_FIELD: abbr}):
+            sub = comm.get('subcommittee')
+            if not sub:
                 comm['parent_id'] = None
             else:
-                comm['parent_id'] = parent['_id']
+                parent = db.committees.find_one({
+                    settings.LEVEL_FIELD: abbr,
+                    'chamber': comm['chamber'],
+                    'committee': comm['committee'],
+                    'subcommittee': None})
+                if not parent:
+                    logger.warning("Failed finding parent for: %s" % sub)
+                    comm['parent_id'] = None
+                else:
+                    comm['parent_id'] = parent['_id']
 
-        db.committees.save(comm, safe=True)
+            writer.save(comm)
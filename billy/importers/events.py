@@ -1,16 +1,16 @@
 #!/usr/bin/env python
 import os
-import glob
 import logging
 import datetime
-import json
 
 from billy.core import db, settings
 from billy.utils import fix_bill_id
 from billy.importers.filters import apply_filters
 from billy.importers.names import get_legislator_id
+from billy.scrape.output import iter_scraped
 from billy.importers.utils import (prepare_obj, update, next_big_id,
-                                   get_committee_id)
+                                   get_committee_id, BulkWriter,
+                                   pop_committee_stats, log_committee_stats)
 
 logger = logging.getLogger('billy')
 filters = settings.EVENT_FILTERS
@@ -29,11 +29,11 @@ def _insert_with_id(event):
 
 def import_events(abbr, data_dir, import_actions=False):
     data_dir = os.path.join(data_dir, abbr)
-    pattern = os.path.join(data_dir, 'events', '*.json')
 
-    for path in glob.iglob(pattern):
-        with open(path) as f:
-            data = prepare_obj(json.load(f))
+    writer = BulkWriter(db.events)
+
+    for scraped in iter_scraped(os.path.join(data_dir, 'events')):
+        data = prepare_obj(scraped.load())
 
         def _resolve_ctty(committee):
             return get_committee_id(data[settings.LEVEL_FIELD],
@@ -91,10 +91,13 @@ def import_events(abbr, data_dir, import_actions=False):
             # something like that.
             bill['id'] = db_bill['_id']
             bill['bill_id'] = bill_id
-        import_event(data)
+        import_event(data, writer)
+
+    writer.flush()
+    log_committee_stats(abbr, pop_committee_stats(abbr))
 
 
-def import_event(data):
+def _find_event(data):
     event = None
 
     if '_guid' in data:
@@ -109,6 +112,22 @@ def import_event(data):
                                     'end': data['end'],
                                     'type': data['type'],
                                     'description': data['description']})
+    return event
+
+
+def import_event(data, writer=None):
+    """
+        insert or update an event
+
+        writer - BulkWriter to queue event updates on (None - write
+        immediately), new events are always inserted immediately so that
+        later files for the same event find them
+    """
+    event = _find_event(data)
+    if event and writer and writer.is_pending(event['_id']):
+        # an earlier file in this run changed the event, update that
+        writer.flush()
+        event = _find_event(data)
 
     data = apply_filters(filters, data)
 
@@ -117,4 +136,4 @@ def import_event(data):
         data['updated_at'] = data['created_at']
         _insert_with_id(data)
     else:
-        update(event, data, db.events)
+        update(event, data, writer or db.events)
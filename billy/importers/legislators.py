@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 import os
-import glob
 import datetime
-import json
 import logging
 
 from billy.core import db
 from billy.core import settings
-from billy.importers.utils import insert_with_id, update, prepare_obj
+from billy.importers.utils import (insert_with_id, update, prepare_obj,
+                                   BulkWriter)
 from billy.importers.filters import apply_filters
+from billy.importers.names import reset_name_matchers
+from billy.scrape.output import iter_scraped
 
 filters = settings.LEGISLATOR_FILTERS
 logger = logging.getLogger('billy')
@@ -16,8 +17,6 @@ logger = logging.getLogger('billy')
 
 def import_legislators(abbr, data_dir):
     data_dir = os.path.join(data_dir, abbr)
-    pattern = os.path.join(data_dir, 'legislators', '*.json')
-    paths = glob.glob(pattern)
 
     counts = {
         "update": 0,
@@ -25,13 +24,14 @@ def import_legislators(abbr, data_dir):
         "total": 0
     }
 
-    for path in paths:
-        with open(path) as f:
+    with BulkWriter(db.legislators) as writer:
+        for scraped in iter_scraped(os.path.join(data_dir, 'legislators')):
             counts["total"] += 1
-            ret = import_legislator(json.load(f))
+            ret = import_legislator(scraped.load(), writer)
             counts[ret] += 1
 
-    logger.info('Finished importing {} legislator files.'.format(len(paths)))
+    logger.info('Finished importing {} legislator files.'.format(
+        counts["total"]))
 
     meta = db.metadata.find_one({'_id': abbr})
     current_term = meta['terms'][-1]['name']
@@ -39,6 +39,9 @@ def import_legislators(abbr, data_dir):
     activate_legislators(current_term, abbr)
     deactivate_legislators(current_term, abbr)
 
+    # matchers built before this import may not know the new names
+    reset_name_matchers(abbr)
+
     return counts
 
 
@@ -47,49 +50,52 @@ def activate_legislators(current_term, abbr):
     Sets the 'active' flag on legislators and populates top-level
     district/chamber/party fields for currently serving legislators.
     """
-    for legislator in db.legislators.find(
-        {'roles': {'$elemMatch':
-                   {settings.LEVEL_FIELD: abbr, 'term': current_term}}}):
-        active_role = legislator['roles'][0]
+    with BulkWriter(db.legislators) as writer:
+        for legislator in db.legislators.find(
+            {'roles': {'$elemMatch':
+                       {settings.LEVEL_FIELD: abbr, 'term': current_term}}}):
+            active_role = legislator['roles'][0]
 
-        if not active_role.get('end_date') and active_role['type'] == 'member':
-            legislator['active'] = True
-            legislator['party'] = active_role.get('party', None)
-            legislator['district'] = active_role.get('district', None)
-            legislator['chamber'] = active_role.get('chamber', None)
+            if (not active_role.get('end_date') and
+                    active_role['type'] == 'member'):
+                legislator['active'] = True
+                legislator['party'] = active_role.get('party', None)
+                legislator['district'] = active_role.get('district', None)
+                legislator['chamber'] = active_role.get('chamber', None)
 
-        legislator['updated_at'] = datetime.datetime.utcnow()
-        db.legislators.save(legislator, safe=True)
+            legislator['updated_at'] = datetime.datetime.utcnow()
+            writer.save(legislator)
 
 
 def deactivate_legislators(current_term, abbr):
 
     # legislators without a current term role or with an end_date
-    for leg in db.legislators.find(
-            {'$or': [
-                {'roles': {'$elemMatch': {
-                    'term': {'$ne': current_term},
-                    'type': 'member', settings.LEVEL_FIELD: abbr}}},
-                {'roles': {'$elemMatch': {
-                    'term': current_term,
-                    'type': 'member',
-                    settings.LEVEL_FIELD: abbr,
-                    'end_date': {'$ne': None}}}}
-            ]}):
-
-        if 'old_roles' not in leg:
-            leg['old_roles'] = {}
-
-        leg['old_roles'][leg['roles'][0]['term']] = leg['roles']
-        leg['roles'] = []
-        leg['active'] = False
-
-        for key in ('district', 'chamber', 'party'):
-            if key in leg:
-                del leg[key]
-
-        leg['updated_at'] = datetime.datetime.utcnow()
-        db.legislators.save(leg, safe=True)
+    with BulkWriter(db.legislators) as writer:
+        for leg in db.legislators.find(
+                {'$or': [
+                    {'roles': {'$elemMatch': {
+                        'term': {'$ne': current_term},
+                        'type': 'member', settings.LEVEL_FIELD: abbr}}},
+                    {'roles': {'$elemMatch': {
+                        'term': current_term,
+                        'type': 'member',
+                        settings.LEVEL_FIELD: abbr,
+                        'end_date': {'$ne': None}}}}
+                ]}):
+
+            if 'old_roles' not in leg:
+                leg['old_roles'] = {}
+
+            leg['old_roles'][leg['roles'][0]['term']] = leg['roles']
+            leg['roles'] = []
+            leg['active'] = False
+
+            for key in ('district', 'chamber', 'party'):
+                if key in leg:
+                    del leg[key]
+
+            leg['updated_at'] = datetime.datetime.utcnow()
+            writer.save(leg)
 
 
 def term_older_than(abbr, terma, termb):
@@ -98,7 +104,50 @@ def term_older_than(abbr, terma, termb):
     return names.index(terma) < names.index(termb)
 
 
-def import_legislator(data):
+def _find_legislator(data, spec):
+    """
+    find the legislator data was scraped for, returns (legislator, match)
+    where match is 'role', 'old_role' or 'other_term' (None if not found)
+    """
+    abbr = data[settings.LEVEL_FIELD]
+    scraped_term = spec['term']
+    spec = dict(spec)
+
+    # find matching legislator in current term
+    leg = db.legislators.find_one(
+        {settings.LEVEL_FIELD: abbr,
+         '_scraped_name': data['_scraped_name'],
+         'roles': {'$elemMatch': spec}})
+    if leg:
+        return leg, 'role'
+
+    # legislator with a matching old_role
+    spec.pop('term')
+    leg = db.legislators.find_one({
+        settings.LEVEL_FIELD: abbr,
+        '_scraped_name': data['_scraped_name'],
+        'old_roles.%s' % scraped_term: {'$elemMatch': spec}
+    })
+    if leg:
+        return leg, 'old_role'
+
+    # active matching legislator from different term
+    leg = db.legislators.find_one(
+        {settings.LEVEL_FIELD: abbr,
+         '_scraped_name': data['_scraped_name'],
+         'roles': {'$elemMatch': spec}})
+    if leg:
+        return leg, 'other_term'
+    return None, None
+
+
+def import_legislator(data, writer=None):
+    """
+        insert or update a legislator
+
+        data - raw legislator JSON
+        writer - BulkWriter to queue updates on (None - write immediately)
+    """
     data = prepare_obj(data)
 
     if data.get('_scraped_name') is None:
@@ -126,51 +175,37 @@ def import_legislator(data):
     if 'chamber' in scraped_role:
         spec['chamber'] = scraped_role['chamber']
 
-    # find matching legislator in current term
-    leg = db.legislators.find_one(
-        {settings.LEVEL_FIELD: abbr,
-         '_scraped_name': data['_scraped_name'],
-         'roles': {'$elemMatch': spec}})
-
-    # legislator with a matching old_role
-    if not leg:
-        spec.pop('term')
-        leg = db.legislators.find_one({
-            settings.LEVEL_FIELD: abbr,
-            '_scraped_name': data['_scraped_name'],
-            'old_roles.%s' % scraped_term: {'$elemMatch': spec}
-        })
-
-        if leg:
-            if 'old_roles' not in data:
-                data['old_roles'] = leg.get('old_roles', {})
-             # put scraped roles into their old_roles
+    leg, match = _find_legislator(data, spec)
+    if leg and writer and writer.is_pending(leg['_id']):
+        # an earlier file in this run (eg. for another term) changed leg,
+        # merge with that instead
+        writer.flush()
+        leg, match = _find_legislator(data, spec)
+
+    if match == 'old_role':
+        if 'old_roles' not in data:
+            # a copy, so that update() sees the added term as a change
+            data['old_roles'] = dict(leg.get('old_roles', {}))
+        # put scraped roles into their old_roles
+        data['old_roles'][scraped_term] = data['roles']
+        data['roles'] = leg['roles']  # don't overwrite their current roles
+
+    elif match == 'other_term':
+        if 'old_roles' not in data:
+            data['old_roles'] = dict(leg.get('old_roles', {}))
+
+        # scraped_term < leg's term
+        if term_older_than(abbr, scraped_term, leg['roles'][0]['term']):
+            # move scraped roles into old_roles
             data['old_roles'][scraped_term] = data['roles']
-            data['roles'] = leg['roles']  # don't overwrite their current roles
-
-    # active matching legislator from different term
-    if not leg:
-        spec.pop('term', None)
-        leg = db.legislators.find_one(
-            {settings.LEVEL_FIELD: abbr,
-             '_scraped_name': data['_scraped_name'],
-             'roles': {'$elemMatch': spec}})
-        if leg:
-            if 'old_roles' not in data:
-                data['old_roles'] = leg.get('old_roles', {})
-
-            # scraped_term < leg's term
-            if term_older_than(abbr, scraped_term, leg['roles'][0]['term']):
-                # move scraped roles into old_roles
-                data['old_roles'][scraped_term] = data['roles']
-                data['roles'] = leg['roles']
-            else:
-                data['old_roles'][leg['roles'][0]['term']] = leg['roles']
+            data['roles'] = leg['roles']
+        else:
+            data['old_roles'][leg['roles'][0]['term']] = leg['roles']
 
     data = apply_filters(filters, data)
 
     if leg:
-        update(leg, data, db.legislators)
+        update(leg, data, writer or db.legislators)
         return "update"
     else:
         insert_with_id(data)
@@ -1,6 +1,11 @@
+import os
 import re
+import json
+import hashlib
 import logging
 
+from six.moves import cPickle as pickle
+
 from billy.core import db
 from billy.core import settings
 
@@ -13,7 +18,7 @@ __com_matchers = {}
 logger = logging.getLogger('billy')
 
 
-def get_legislator_id(abbr, session, chamber, name):
+def _get_matcher(abbr, session):
     try:
         matcher = __matchers[(abbr, session)]
     except KeyError:
@@ -29,7 +34,23 @@ def get_legislator_id(abbr, session, chamber, name):
 
         __matchers[(abbr, session)] = matcher
 
-    return matcher.match(name, chamber)
+    return matcher
+
+
+def get_legislator_id(abbr, session, chamber, name):
+    return _get_matcher(abbr, session).match(name, chamber)
+
+
+def get_legislator_ids(abbr, session, chamber, names):
+    """ match a list of names (eg. a roll call) at once """
+    return _get_matcher(abbr, session).match_many(names, chamber)
+
+
+def reset_name_matchers(abbr):
+    """ discard abbr's NameMatchers, eg. after legislators changed """
+    for key in list(__matchers.keys()):
+        if key[0] == abbr:
+            del __matchers[key]
 
 
 def attempt_committee_match(abbr, chamber, name):
@@ -41,6 +62,12 @@ def attempt_committee_match(abbr, chamber, name):
     return matcher.match(name, chamber)
 
 
+_title_re = re.compile(
+    r'^(Senator|Representative|Sen\.?|Rep\.?|'
+    'Hon\.?|Right Hon\.?|Mr\.?|Mrs\.?|Ms\.?|L\'hon\.?|'
+    'Assembly(member|man|woman)) ')
+
+
 class NameMatcher(object):
     """
     Match various forms of a name, provided they uniquely identify
@@ -82,22 +109,88 @@ class NameMatcher(object):
         self._abbr = abbr
         self._term = term
 
-        roles_elemMatch = {settings.LEVEL_FIELD: abbr, 'type': 'member',
-                           'term': term}
-        old_roles_query = {'old_roles.%s' % term: {'$elemMatch':
-                                                   {settings.LEVEL_FIELD: abbr,
-                                                    'type': 'member'}}}
+        # the names learned from legislators are kept in a snapshot that is
+        # reused until legislators change, manual matches are always loaded
+        watermark = self._watermark()
+        if not self._load_snapshot(watermark):
+            self._learn_legislators()
+            self._save_snapshot(watermark)
 
-        for legislator in db.legislators.find({
-            '$or': [{'roles': {'$elemMatch': roles_elemMatch}},
-                    old_roles_query]}):
+        self._learn_manual_matches()
+
+    def _legislators_query(self):
+        roles_elemMatch = {settings.LEVEL_FIELD: self._abbr, 'type': 'member',
+                           'term': self._term}
+        old_roles_query = {'old_roles.%s' % self._term: {
+            '$elemMatch': {settings.LEVEL_FIELD: self._abbr,
+                           'type': 'member'}}}
+        return {'$or': [{'roles': {'$elemMatch': roles_elemMatch}},
+                        old_roles_query]}
+
+    def _learn_legislators(self):
+        for legislator in db.legislators.find(self._legislators_query()):
 
             if 'middle_name' not in legislator:
                 legislator['middle_name'] = ''
 
             self._learn(legislator)
 
-        self._learn_manual_matches()
+    def _watermark(self):
+        """
+        hash of the fields _learn uses of the term's legislators, so that
+        imports that only touch updated_at don't invalidate the snapshot
+        """
+        fields = ['full_name', '_scraped_name', 'first_name', 'middle_name',
+                  'last_name', '_code', 'roles',
+                  'old_roles.%s' % self._term]
+        digest = hashlib.sha1()
+        for legislator in db.legislators.find(self._legislators_query(),
+                                              fields=fields).sort('_id'):
+            digest.update(json.dumps(legislator, sort_keys=True,
+                                     default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _snapshot_path(self):
+        if not settings.BILLY_NAME_MATCHER_DIR:
+            return None
+        filename = re.sub(r'[^\w.-]', '_', '%s_%s.pickle' % (self._abbr,
+                                                              self._term))
+        # resolved on every use, so that it follows BILLY_CACHE_DIR
+        return os.path.join(settings.BILLY_CACHE_DIR,
+                            settings.BILLY_NAME_MATCHER_DIR, filename)
+
+    def _load_snapshot(self, watermark):
+        path = self._snapshot_path()
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            logger.warning('unreadable name matcher snapshot %s: %s' %
+                           (path, e))
+            return False
+        if snapshot['watermark'] != watermark:
+            return False
+        self._names = snapshot['names']
+        self._codes = snapshot['codes']
+        return True
+
+    def _save_snapshot(self, watermark):
+        path = self._snapshot_path()
+        if not path:
+            return
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(path, 'wb') as f:
+                pickle.dump({'watermark': watermark, 'names': self._names,
+                             'codes': self._codes}, f,
+                            pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            logger.warning('unable to save name matcher snapshot %s: %s' %
+                           (path, e))
 
     def _learn_manual_matches(self):
         rows = db.manual.name_matchers.find({
@@ -122,12 +215,7 @@ class NameMatcher(object):
         Normalizes a legislator name by stripping titles from the front,
         converting to lowercase and removing punctuation.
         """
-        name = re.sub(
-            r'^(Senator|Representative|Sen\.?|Rep\.?|'
-            'Hon\.?|Right Hon\.?|Mr\.?|Mrs\.?|Ms\.?|L\'hon\.?|'
-            'Assembly(member|man|woman)) ',
-            '',
-            name)
+        name = _title_re.sub('', name)
         return name.strip().lower().replace('.', '')
 
     def _learn(self, legislator):
@@ -245,6 +333,17 @@ class NameMatcher(object):
         name = self._normalize(name)
         return self._names[chamber].get(name, None)
 
+    def match_many(self, names, chamber=None):
+        """
+        Match a list of names, returns a list of ids (or None) in the same
+        order. Names that appear more than once are only matched once.
+        """
+        matched = {}
+        for name in names:
+            if name not in matched:
+                matched[name] = self.match(name, chamber)
+        return [matched[name] for name in names]
+
 
 class CommitteeNameMatcher(object):
     def __init__(self, abbr, term):
@@ -0,0 +1,64 @@
+"""
+Optional per-stage timing of imports, used by ``billy-util bench-import``.
+
+Importers wrap their stages in ``with stage('name'):``, which only measures
+anything between enable_stage_timing() and pop_stage_timings().  Stages may
+be nested (eg. 'entities' is part of 'actions') and are only collected in
+the current process, so time imports with a single worker.
+"""
+import time
+from collections import defaultdict
+
+_timings = None
+
+
+class _Stage(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # timing was stopped while the stage ran
+        if _timings is None:
+            return
+        timing = _timings[self.name]
+        timing[0] += 1
+        timing[1] += time.time() - self.start
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_null_stage = _NullStage()
+
+
+def stage(name):
+    """ context manager timing the name stage, if timing is enabled """
+    if _timings is None:
+        return _null_stage
+    return _Stage(name)
+
+
+def enable_stage_timing():
+    global _timings
+    _timings = defaultdict(lambda: [0, 0.0])
+
+
+def pop_stage_timings():
+    """ stop timing and return {stage: (calls, seconds)} """
+    global _timings
+    timings = dict((name, tuple(timing))
+                   for name, timing in (_timings or {}).items())
+    _timings = None
+    return timings
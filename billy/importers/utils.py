@@ -3,14 +3,21 @@ import re
 import time
 import json
 import copy
+import logging
 import datetime
+from collections import defaultdict
 
 from bson.son import SON
 import pymongo.errors
 import name_tools
 
 from billy.core import db, settings
+from billy.utils import (NORMALIZED_FIELDS, NORMALIZED_ROLE_FIELDS,
+                         normalize_value)
 from billy.importers.names import attempt_committee_match
+from billy.importers.timing import stage
+
+logger = logging.getLogger('billy')
 
 
 def _get_property_dict(schema):
@@ -34,6 +41,161 @@ for _type in ('bill', 'person', 'committee', 'metadata', 'vote',
     standard_fields[_type] = _get_property_dict(schema)
 
 
+class BulkWriter(object):
+    """
+    Accumulates writes to a collection and flushes them as unordered bulk
+    operations once batch_size writes are pending.
+
+    save/update/remove accept the same arguments as the Collection methods
+    so that a BulkWriter can be passed anywhere a collection is written to.
+
+    Writes within a batch may be applied in any order, callers must not
+    queue conflicting writes to the same document.  Callers that read a
+    document before writing it should check is_pending() and flush() first,
+    reads don't see queued writes.
+    """
+
+    def __init__(self, collection, batch_size=None):
+        self.collection = collection
+        self.batch_size = batch_size or settings.BILLY_IMPORT_BATCH_SIZE
+        self._bulk = None
+        self._pending = 0
+        self._pending_ids = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # don't mask the original exception with a flush error
+        if exc_type is None:
+            self.flush()
+
+    def _find(self, spec):
+        if self._bulk is None:
+            self._bulk = self.collection.initialize_unordered_bulk_op()
+        return self._bulk.find(spec)
+
+    def _track(self, spec):
+        # only writes to a single document by _id are tracked
+        _id = spec.get('_id')
+        if _id is not None and not isinstance(_id, dict):
+            self._pending_ids.add(_id)
+
+    def _queued(self):
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def save(self, doc, **kwargs):
+        self._pending_ids.add(doc['_id'])
+        self._find({'_id': doc['_id']}).upsert().replace_one(doc)
+        self._queued()
+        return doc['_id']
+
+    def update(self, spec, document, multi=False, **kwargs):
+        self._track(spec)
+        if multi:
+            self._find(spec).update(document)
+        else:
+            self._find(spec).update_one(document)
+        self._queued()
+
+    def remove(self, spec, **kwargs):
+        self._track(spec)
+        self._find(spec).remove()
+        self._queued()
+
+    def is_pending(self, _id):
+        """ whether a queued write to the document with _id isn't flushed """
+        return _id in self._pending_ids
+
+    def flush(self):
+        """ execute all pending writes, logging any errors at once """
+        if not self._pending:
+            return
+
+        bulk, pending = self._bulk, self._pending
+        self._bulk = None
+        self._pending = 0
+        self._pending_ids = set()
+
+        try:
+            with stage('bulk_write'):
+                bulk.execute()
+        except pymongo.errors.BulkWriteError as e:
+            errors = e.details['writeErrors']
+            logger.error('%s of %s writes to %s failed: %s' % (
+                len(errors), pending, self.collection.name,
+                '; '.join(err['errmsg'] for err in errors[:10])))
+            raise
+
+
+# collection : (id letter, counter collection, digits) for generated ids
+ID_COUNTERS = {
+    'bills': ('B', 'bill_ids', 8),
+    'legislators': ('L', 'legislator_ids', 6),
+    'committees': ('C', 'committee_ids', 6),
+}
+
+# (counter collection, abbr) : [next id, last reserved id]
+_id_blocks = {}
+
+
+def seed_id_counter(abbr, collection):
+    """
+    Raise the id counter for abbr's objects in collection to the largest id
+    already in use (counters never move backwards), returns the largest id.
+    """
+    letter, counter, digits = ID_COUNTERS[collection]
+    abbr = abbr.lower()
+    prefix = '%s%s' % (abbr.upper(), letter)
+
+    cursor = db[collection].find({'_id': re.compile('^%s' % prefix)},
+                                 fields=[]).sort('_id', -1).limit(1)
+    try:
+        seq = int(next(cursor)['_id'][len(prefix):])
+    except StopIteration:
+        seq = 0
+
+    db[counter].update({'_id': abbr}, {'$max': {'seq': seq}}, upsert=True,
+                       safe=True)
+    _id_blocks.pop((counter, abbr), None)
+    return seq
+
+
+def next_seq(abbr, counter):
+    """
+    Get the next sequence number from a counter collection.
+
+    Numbers are handed out from blocks of BILLY_ID_BLOCK_SIZE that are
+    reserved with a single findandmodify, so they are unique across
+    processes but unused numbers of a block are skipped when a process exits.
+    """
+    key = (counter, abbr)
+    block = _id_blocks.get(key)
+    if not block or block[0] > block[1]:
+        size = settings.BILLY_ID_BLOCK_SIZE
+        last = _reserve_ids(abbr, counter, size)
+        block = _id_blocks[key] = [last - size + 1, last]
+
+    seq = block[0]
+    block[0] += 1
+    return seq
+
+
+def next_object_id(abbr, collection):
+    """ get the next id for a bill/legislator/committee in collection """
+    letter, counter, digits = ID_COUNTERS[collection]
+    abbr = abbr.lower()
+
+    # counters that don't exist yet start after the largest existing id
+    if ((counter, abbr) not in _id_blocks and
+            not db[counter].find_one({'_id': abbr})):
+        seed_id_counter(abbr, collection)
+
+    return '%s%s%0*d' % (abbr.upper(), letter, digits, next_seq(abbr, counter))
+
+
 def insert_with_id(obj):
     """
     Generates a unique ID for the supplied legislator/committee/bill
@@ -42,50 +204,41 @@ def insert_with_id(obj):
     if '_id' in obj:
         raise ValueError("object already has '_id' field")
 
+    set_normalized_fields(obj)
+
     # add created_at/updated_at on insert
     obj['created_at'] = datetime.datetime.utcnow()
     obj['updated_at'] = obj['created_at']
 
     if obj['_type'] == 'person' or obj['_type'] == 'legislator':
-        collection = db.legislators
-        id_type = 'L'
+        collection = 'legislators'
     elif obj['_type'] == 'committee':
-        collection = db.committees
-        id_type = 'C'
+        collection = 'committees'
     elif obj['_type'] == 'bill':
-        collection = db.bills
-        id_type = 'B'
+        collection = 'bills'
     else:
         raise ValueError("unknown _type for object")
 
-    # get abbr
-    abbr = obj[settings.LEVEL_FIELD].upper()
-
-    id_reg = re.compile('^%s%s' % (abbr, id_type))
-
-    # Find the next available _id and insert
-    id_prefix = '%s%s' % (abbr, id_type)
-    cursor = collection.find({'_id': id_reg}).sort('_id', -1).limit(1)
-
-    try:
-        new_id = int(next(cursor)['_id'][len(abbr) + 1:]) + 1
-    except StopIteration:
-        new_id = 1
+    abbr = obj[settings.LEVEL_FIELD]
 
     while True:
-        if obj['_type'] == 'bill':
-            obj['_id'] = '%s%08d' % (id_prefix, new_id)
-        else:
-            obj['_id'] = '%s%06d' % (id_prefix, new_id)
+        obj['_id'] = next_object_id(abbr, collection)
         obj['_all_ids'] = [obj['_id']]
 
         if obj['_type'] in ['person', 'legislator']:
             obj['leg_id'] = obj['_id']
 
         try:
-            return collection.insert(obj, safe=True)
+            return db[collection].insert(obj, safe=True)
         except pymongo.errors.DuplicateKeyError:
-            new_id += 1
+            # duplicates on other unique indexes can't be fixed by a new id
+            if not db[collection].find_one({'_id': obj['_id']}, fields=[]):
+                raise
+            # counter is behind the ids in use (eg. objects were inserted
+            # with explicit ids), catch it up and try again
+            logger.warning('id %s already in use, reseeding %s id counter'
+                           % (obj['_id'], collection))
+            seed_id_counter(abbr, collection)
 
 
 def _timestamp_to_dt(timestamp):
@@ -96,37 +249,75 @@ def _timestamp_to_dt(timestamp):
     return dt
 
 
+_ctty_junk_words = [re.compile(junk) for junk in (
+    "(\s+|^)standing(\s+|$)",
+    "(\s+|^)committee(\s+|$)",
+    "(\s+|^)on(\s+|$)",
+    "(\s+|^)joint(\s+|$)",
+    "(\s+|^)house(\s+|$)",
+    "(\s+|^)senate(\s+|$)",
+    "[,\.\!\+\/]"
+)]
+_whitespace_re = re.compile(r'\s+')
+_nonword_re = re.compile(r'\W+')
+
+
+def _cleanup_committee_name(obj):
+    """ normalize a committee name for comparison """
+    obj = obj.strip().lower()
+    for junk in _ctty_junk_words:
+        obj = junk.sub(" ", obj).strip()
+    obj = _whitespace_re.sub(" ", obj)
+    obj = _whitespace_re.sub(' ', _nonword_re.sub(' ', obj)).strip()
+    return obj
+
+
+# replacements applied to both names before comparing them
+_ctty_check_both = [
+    ("", ""),
+    ("&", "and")
+]
+
+
 def compare_committee(ctty1, ctty2):
-    def _cleanup(obj):
-        ctty_junk_words = [
-            "(\s+|^)standing(\s+|$)",
-            "(\s+|^)committee(\s+|$)",
-            "(\s+|^)on(\s+|$)",
-            "(\s+|^)joint(\s+|$)",
-            "(\s+|^)house(\s+|$)",
-            "(\s+|^)senate(\s+|$)",
-            "[,\.\!\+\/]"
-        ]
-        obj = obj.strip().lower()
-        for junk in ctty_junk_words:
-            obj = re.sub(junk, " ", obj).strip()
-        obj = re.sub("\s+", " ", obj)
-        obj = re.sub(r'\s+', ' ', re.sub(r'\W+', ' ', obj)).strip()
-        return obj
-    check_both = [
-        ("", ""),
-        ("&", "and")
-    ]
-    for old, new in check_both:
+    for old, new in _ctty_check_both:
         c1 = ctty1.replace(old, new)
         c2 = ctty2.replace(old, new)
-        c1 = _cleanup(c1)
-        c2 = _cleanup(c2)
+        c1 = _cleanup_committee_name(c1)
+        c2 = _cleanup_committee_name(c2)
         if c1 == c2:
             return True
     return False
 
 
+def _normalized_fields(obj, fields):
+    return dict((field, normalize_value(obj[field])) for field in fields
+                if field in obj)
+
+
+def set_normalized_fields(obj):
+    """
+    Set the '_normalized' copies of a legislator's or committee's
+    NORMALIZED_FIELDS (and of its roles' fields), returns True if they
+    changed.
+    """
+    fields = NORMALIZED_FIELDS.get(obj.get('_type'))
+    if fields is None:
+        return False
+
+    changed = False
+    normalized = _normalized_fields(obj, fields)
+    if obj.get('_normalized') != normalized:
+        obj['_normalized'] = normalized
+        changed = True
+    for role in obj.get('roles', []):
+        normalized = _normalized_fields(role, NORMALIZED_ROLE_FIELDS)
+        if role.get('_normalized') != normalized:
+            role['_normalized'] = normalized
+            changed = True
+    return changed
+
+
 def update(old, new, collection, sneaky_update_filter=None):
     """
         update an existing object with a new one, only saving it and
@@ -137,7 +328,7 @@ def update(old, new, collection, sneaky_update_filter=None):
         new
             new object
         collection
-            collection to save changed object to
+            collection (or BulkWriter) to save changed object to
         sneaky_update_filter
             a filter for updates to object that should be ignored
             format is a dict mapping field names to a comparison function
@@ -148,10 +339,14 @@ def update(old, new, collection, sneaky_update_filter=None):
 
     locked_fields = old.get('_locked_fields', [])
 
+    # so that new roles compare equal to unchanged old ones
+    set_normalized_fields(new)
+
     for key, value in new.items():
 
-        # don't update locked fields
-        if key in locked_fields:
+        # don't update locked fields, _normalized is redone below as it
+        # depends on them
+        if key in locked_fields or key == '_normalized':
             continue
 
         if old.get(key) != value:
@@ -169,6 +364,9 @@ def update(old, new, collection, sneaky_update_filter=None):
             del old[plus_key]
             need_save = True
 
+    if set_normalized_fields(old):
+        need_save = True
+
     if need_save:
         old['updated_at'] = datetime.datetime.utcnow()
         collection.save(old, safe=True)
@@ -254,14 +452,19 @@ def prepare_obj(obj):
     return make_plus_fields(obj)
 
 
-def next_big_id(abbr, letter, collection):
+def _reserve_ids(abbr, collection, count):
+    """ atomically reserve count ids, returns the last id reserved """
     query = SON([('_id', abbr)])
-    update = SON([('$inc', SON([('seq', 1)]))])
-    seq = db.command(SON([('findandmodify', collection),
-                          ('query', query),
-                          ('update', update),
-                          ('new', True),
-                          ('upsert', True)]))['value']['seq']
+    update = SON([('$inc', SON([('seq', count)]))])
+    return db.command(SON([('findandmodify', collection),
+                           ('query', query),
+                           ('update', update),
+                           ('new', True),
+                           ('upsert', True)]))['value']['seq']
+
+
+def next_big_id(abbr, letter, collection):
+    seq = _reserve_ids(abbr, collection, 1)
     return "%s%s%08d" % (abbr.upper(), letter, seq)
 
 
@@ -340,62 +543,129 @@ def merge_legislators(leg1, leg2):
 
     return (leg1, leg2['_id'])
 
-__committee_ids = {}
 
+class CommitteeResolver(object):
+    """
+    Resolves committee names to ids for a jurisdiction.
 
-def get_committee_id(abbr, chamber, committee):
+    The jurisdiction's committees are loaded once and indexed both by exact
+    name and by the normalized forms compare_committee matches on, so each
+    lookup is a few dictionary accesses instead of several queries.
+    """
 
-    manual = attempt_committee_match(abbr,
-                                     chamber,
-                                     committee)
+    def __init__(self, abbr):
+        self.abbr = abbr
+        self.stats = defaultdict(int)
+        self._cache = {}
+        # (chamber, committee) : ids of committees without a subcommittee
+        self._exact = defaultdict(list)
+        # one index per _ctty_check_both replacement,
+        # (chamber or None for any chamber, normalized name) : ids
+        self._normalized = [defaultdict(set) for _ in _ctty_check_both]
+
+        for committee in db.committees.find(
+                {settings.LEVEL_FIELD: abbr},
+                fields=['chamber', 'committee', 'subcommittee']):
+            chamber = committee.get('chamber')
+            name = committee['committee']
+            if committee.get('subcommittee') is None:
+                self._exact[(chamber, name)].append(committee['_id'])
+            else:
+                name += " %s" % (committee['subcommittee'])
 
-    if manual:
-        return manual
+            for index, (old, new) in zip(self._normalized, _ctty_check_both):
+                key = _cleanup_committee_name(name.replace(old, new))
+                index[(chamber, key)].add(committee['_id'])
+                if chamber is not None:
+                    index[(None, key)].add(committee['_id'])
 
-    key = (abbr, chamber, committee)
-    if key in __committee_ids:
-        return __committee_ids[key]
+    def _match_exact(self, chamber, committee):
+        ids = self._exact.get((chamber, committee), [])
 
-    spec = {settings.LEVEL_FIELD: abbr, 'chamber': chamber,
-            'committee': committee, 'subcommittee': None}
+        if len(ids) != 1:
+            flag = 'Committee on'
+            if flag not in committee:
+                committee = 'Committee on ' + committee
+            else:
+                committee = committee.replace(flag, "").strip()
+            ids = self._exact.get((chamber, committee), [])
+
+        if len(ids) == 1:
+            return ids[0]
+
+    def _match_normalized(self, chamber, committee):
+        matches = set()
+        for index, (old, new) in zip(self._normalized, _ctty_check_both):
+            key = _cleanup_committee_name(committee.replace(old, new))
+            matches |= index.get((chamber, key), set())
+
+        if len(matches) > 1:
+            # In the event we match more then one committee.
+            return None
+        elif matches:
+            return matches.pop()
+        elif chamber is not None:
+            return self._match_normalized(None, committee)
+
+    def resolve(self, chamber, committee):
+        key = (chamber, committee)
+        if key in self._cache:
+            self.stats['cached'] += 1
+            return self._cache[key]
+
+        comm_id = self._match_exact(chamber, committee)
+        if comm_id:
+            self.stats['exact'] += 1
+        else:
+            # last resort :(
+            comm_id = self._match_normalized(chamber, committee)
+            self.stats['normalized' if comm_id else 'unmatched'] += 1
 
-    comms = db.committees.find(spec)
+        self._cache[key] = comm_id
+        return comm_id
 
-    if comms.count() != 1:
-        flag = 'Committee on'
-        if flag not in committee:
-            spec['committee'] = 'Committee on ' + committee
-        else:
-            spec['committee'] = committee.replace(flag, "").strip()
-        comms = db.committees.find(spec)
+    def pop_stats(self):
+        """ return the lookup statistics and reset them """
+        stats, self.stats = dict(self.stats), defaultdict(int)
+        return stats
 
-    if comms and comms.count() == 1:
-        __committee_ids[key] = comms[0]['_id']
-    else:
-        # last resort :(
-        comm_id = get_committee_id_alt(abbr, committee, chamber)
-        __committee_ids[key] = comm_id
 
-    return __committee_ids[key]
+# abbr : CommitteeResolver
+_committee_resolvers = {}
+
+
+def committee_resolver(abbr):
+    try:
+        return _committee_resolvers[abbr]
+    except KeyError:
+        resolver = _committee_resolvers[abbr] = CommitteeResolver(abbr)
+        return resolver
+
 
+def reset_committee_resolver(abbr):
+    """ discard abbr's CommitteeResolver, eg. after committees changed """
+    _committee_resolvers.pop(abbr, None)
 
-def get_committee_id_alt(abbr, name, chamber):
-    matched_committee = None
-    spec = {settings.LEVEL_FIELD: abbr, "chamber": chamber}
-    if chamber is None:
-        del(spec['chamber'])
-    comms = db.committees.find(spec)
-    for committee in comms:
-        c = committee['committee']
-        if committee['subcommittee'] is not None:
-            c += " %s" % (committee['subcommittee'])
 
-        if compare_committee(name, c):
-            if not matched_committee is None:
-                return None  # In the event we match more then one committee.
-            matched_committee = committee['_id']
+def pop_committee_stats(abbr):
+    """ return and reset the lookup statistics for abbr's committees """
+    resolver = _committee_resolvers.get(abbr)
+    return resolver.pop_stats() if resolver else {}
 
-    if matched_committee is None and not chamber is None:
-        matched_committee = get_committee_id_alt(abbr, name, None)
 
-    return matched_committee
+def log_committee_stats(abbr, stats):
+    logger.info('committee lookups for %s: %s' % (abbr, ', '.join(
+        '%s %s' % (stats.get(kind, 0), kind) for kind in
+        ('exact', 'normalized', 'unmatched', 'cached'))))
+
+
+def get_committee_id(abbr, chamber, committee):
+
+    manual = attempt_committee_match(abbr,
+                                     chamber,
+                                     committee)
+
+    if manual:
+        return manual
+
+    return committee_resolver(abbr).resolve(chamber, committee)
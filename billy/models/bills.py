@@ -1,14 +1,18 @@
 import re
+import json
 import math
+import base64
+import calendar
 import operator
 import collections
+import datetime
 import itertools
 
 from django.core import urlresolvers
 from django.core.exceptions import PermissionDenied
 import pymongo
 
-from billy.utils import parse_param_dt, fix_bill_id
+from billy.utils import parse_param_dt, fix_bill_id, search
 from billy.core import mdb as db, settings
 from .base import (Document, RelatedDocument, RelatedDocuments,
                    ListManager, AttrManager, take)
@@ -323,20 +327,105 @@ class BillVote(Document):
             return self['chamber'].title()
 
 
-class BillSearchResults(object):
+def _encode_cursor(value, _id):
+    if isinstance(value, datetime.datetime):
+        value = {'ms': calendar.timegm(value.utctimetuple()) * 1000 +
+                 value.microsecond // 1000}
+    # without padding, so cursors don't need escaping in urls
+    return base64.urlsafe_b64encode(
+        json.dumps([value, _id]).encode('utf8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        cursor = cursor.encode('utf8')
+        value, _id = json.loads(base64.urlsafe_b64decode(
+            cursor + b'=' * (-len(cursor) % 4)).decode('utf8'))
+        if isinstance(value, dict):
+            value = (datetime.datetime(1970, 1, 1) +
+                     datetime.timedelta(milliseconds=value['ms']))
+    except (TypeError, ValueError, KeyError):
+        raise ValueError('invalid cursor')
+    return value, _id
+
+
+def _and(query, conditions):
+    """ query with conditions added, in an $and only if keys overlap """
+    if any(key in query for key in conditions):
+        return {'$and': [query, conditions]}
+    return dict(query, **conditions)
+
+
+def _rarest_first(terms, abbr=None):
+    """
+    terms ordered by the number of bills containing them, mongo only uses
+    the first term of an $all for index bounds
+    """
+    if len(terms) < 2:
+        return terms
+
+    def count(term):
+        spec = {'_search_terms': term}
+        if abbr:
+            spec[settings.LEVEL_FIELD] = abbr
+        return db.bills.find(spec).count()
+    return sorted(terms, key=count)
+
+
+def _get_path(obj, path):
+    for key in path.split('.'):
+        obj = (obj or {}).get(key)
+    return obj
+
 
-    def __init__(self, es_search, mongo_query, sort, fields):
-        self.es_search = es_search
+class BillSearchResults(object):
+    """
+    Bills matching mongo_query, sorted by the sort field (descending).  If
+    search_terms are given the query must require them all, and a sort of
+    'relevance' ranks the matches by search.score.
+    """
+
+    def __init__(self, search_terms, mongo_query, sort, fields):
+        self.search_terms = search_terms
         self.mongo_query = mongo_query
         self.sort = sort
         self.fields = fields
         self._len = None
+        self._ranked_ids = None
 
     def __len__(self):
         if self._len is None:
-            self._len = db.bills.find(self.mongo_query).count()
+            if self._ranked_ids is not None:
+                self._len = len(self._ranked_ids)
+            else:
+                self._len = db.bills.find(self.mongo_query).count()
+                if (self.sort == 'relevance' and
+                        settings.BILLY_SEARCH_MAX_RANKED is not None):
+                    self._len = min(self._len,
+                                    settings.BILLY_SEARCH_MAX_RANKED)
         return self._len
 
+    def _ranked(self):
+        """
+        ids of the matches, most relevant (then most recent) first, only
+        the BILLY_SEARCH_MAX_RANKED most recent matches are ranked so that a
+        broad search doesn't score every bill
+        """
+        if self._ranked_ids is None:
+            matches = db.bills.find(self.mongo_query,
+                                    fields=['_search_weights',
+                                            'action_dates.last']).sort(
+                [('action_dates.last', pymongo.DESCENDING)])
+            if settings.BILLY_SEARCH_MAX_RANKED is not None:
+                matches = matches.limit(settings.BILLY_SEARCH_MAX_RANKED)
+            ranked = sorted(
+                matches, reverse=True,
+                key=lambda bill: (search.score(bill, self.search_terms),
+                                  bill.get('action_dates', {}).get('last') or
+                                  datetime.datetime.min))
+            self._ranked_ids = [bill['_id'] for bill in ranked]
+        return self._ranked_ids
+
     def __getitem__(self, key):
         start = 0
         if isinstance(key, slice):
@@ -348,10 +437,93 @@ class BillSearchResults(object):
             start = key
             stop = key + 1
 
+        if self.sort == 'relevance':
+            ids = self._ranked()[start:stop]
+            bills = dict((bill['_id'], bill) for bill in
+                         db.bills.find({'_id': {'$in': ids}},
+                                       fields=self.fields))
+            return [bills[_id] for _id in ids if _id in bills]
+
         return db.bills.find(self.mongo_query, fields=self.fields).sort(
             [(self.sort, pymongo.DESCENDING)]
         ).skip(start).limit(stop - start)
 
+    def __iter__(self):
+        """ every result, without counting them first """
+        if self.sort == 'relevance':
+            return self._iter_ranked()
+        return iter(db.bills.find(self.mongo_query, fields=self.fields).sort(
+            [(self.sort, pymongo.DESCENDING)]))
+
+    def _iter_ranked(self, batch_size=100):
+        # ranked bills are fetched a batch at a time, not in one huge $in
+        for start in range(0, len(self._ranked()), batch_size):
+            for bill in self[start:start + batch_size]:
+                yield bill
+
+    def page(self, cursor, limit):
+        """
+        Returns the limit bills following cursor (None for the first page)
+        and the cursor of the next page, None after the last page.
+
+        Cursors hold the sort value and _id of the last bill returned, so
+        unlike slicing no earlier results are skipped over and walking
+        every page is linear in the number of results.
+        """
+        if self.sort == 'relevance':
+            raise ValueError('cursors cannot be used with sort=relevance')
+
+        # descending order, bills without a sort value come last and are
+        # paged separately so that every query is bounded on the sort field
+        # itself (an $or of ranges isn't turned into index bounds by mongo
+        # before 3.6)
+        queries = [self.mongo_query]
+        if cursor:
+            value, last_id = _decode_cursor(cursor)
+            if value is None:
+                queries = [_and(self.mongo_query, {self.sort: None,
+                                                   '_id': {'$lt': last_id}})]
+            else:
+                queries = [
+                    _and(self.mongo_query, {
+                        self.sort: {'$lte': value},
+                        '$or': [{self.sort: {'$lt': value}},
+                                {'_id': {'$lt': last_id}}]}),
+                    _and(self.mongo_query, {self.sort: None}),
+                ]
+
+        # the sort value is needed for the next cursor
+        fields = self.fields
+        sort_key = self.sort.split('.')[0]
+        added_sort = (fields and all(fields.values()) and
+                      self.sort not in fields and sort_key not in fields)
+        if added_sort:
+            fields = dict(fields, **{self.sort: 1})
+
+        bills = []
+        for query in queries:
+            bills += db.bills.find(query, fields=fields).sort(
+                [(self.sort, pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]
+            ).limit(limit - len(bills))
+            if len(bills) == limit:
+                break
+
+        next_cursor = None
+        if len(bills) == limit:
+            last = bills[-1]
+            next_cursor = _encode_cursor(_get_path(last, self.sort),
+                                         last['_id'])
+        if added_sort:
+            for bill in bills:
+                if sort_key == self.sort:
+                    bill.pop(sort_key, None)
+                elif sort_key in bill:
+                    # eg. action_dates.first may have been requested
+                    bill[sort_key].pop(self.sort.split('.', 1)[1], None)
+                    if not bill[sort_key]:
+                        del bill[sort_key]
+        return bills, next_cursor
+
 
 class Bill(Document):
 
@@ -484,6 +656,7 @@ class Bill(Document):
                sort=None, limit=None):
 
         numeric_query = False
+        search_terms = None
         mongo_filter = {}
 
         if status is None:
@@ -566,13 +739,23 @@ class Bill(Document):
         if status_spec:
             mongo_filter.update(**status_spec)
 
-        # preprocess sort
+        if query and not numeric_query:
+            search_terms = search.query_terms(query)
+            if search_terms:
+                mongo_filter['_search_terms'] = {
+                    '$all': _rarest_first(search_terms, abbr)}
+            else:
+                # nothing but stopwords and punctuation
+                mongo_filter['title'] = {'$regex': re.escape(query),
+                                         '$options': 'i'}
+
+        # preprocess sort, only text queries can be ranked by relevance
         if sort in ('first', 'last', 'signed', 'passed_lower', 'passed_upper'):
             sort = 'action_dates.' + sort
-        elif sort not in ('updated_at', 'created_at'):
+        elif sort == 'relevance' and not search_terms:
+            sort = 'action_dates.last'
+        elif sort not in ('updated_at', 'created_at', 'relevance'):
             sort = 'action_dates.last'
 
-        if query and not numeric_query:
-            mongo_filter['title'] = {'$regex': query, '$options': 'i'}
-
-        return BillSearchResults(None, mongo_filter, sort, bill_fields)
+        return BillSearchResults(search_terms, mongo_filter, sort,
+                                 bill_fields)
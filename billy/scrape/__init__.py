@@ -1,14 +1,23 @@
 import os
+import time
 import logging
 import importlib
+import threading
 import json
 import six
+from six.moves import queue
+from six.moves.urllib.parse import urlparse
+from multiprocessing.pool import ThreadPool
 
-from billy.scrape.validator import DatetimeValidator
+from billy.scrape.validator import DatetimeValidator, compile_schema
+from billy.scrape.output import ScrapeOutput
+from billy.scrape.cache import ScrapeCache
+from billy.scrape.stats import ScrapeStats
 
 from billy.core import settings
 from billy.utils import JSONEncoderPlus
 
+import requests
 import scrapelib
 
 
@@ -39,7 +48,37 @@ class NoDataForPeriod(ScrapeError):
         return 'No data exists for %s' % self.period
 
 
-class Scraper(scrapelib.Scraper):
+class _InstrumentedSession(requests.Session):
+    """
+    Times every attempt at a request for Scraper.scrape_stats.  It comes
+    after scrapelib's sessions in Scraper's MRO, so it sits inside the retry
+    loop and sees each retry, while responses from the cache never reach it.
+    """
+
+    def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        local = self._request_host
+        local.attempts = getattr(local, 'attempts', 0) + 1
+        if local.attempts > 1:
+            self.scrape_stats.record_retry(host)
+
+        start = time.time()
+        try:
+            resp = super(_InstrumentedSession, self).request(method, url,
+                                                             **kwargs)
+        except Exception:
+            self.scrape_stats.record_error(host)
+            raise
+
+        if kwargs.get('stream'):
+            nbytes = int(resp.headers.get('content-length') or 0)
+        else:
+            nbytes = len(resp.content)
+        self.scrape_stats.record_request(host, time.time() - start, nbytes)
+        return resp
+
+
+class Scraper(scrapelib.Scraper, _InstrumentedSession):
     """ Base class for all Scrapers
 
     Provides several useful methods for retrieving URLs and checking
@@ -48,6 +87,13 @@ class Scraper(scrapelib.Scraper):
 
     latest_only = False
 
+    # queue that a ScrapedObject for each saved object is put onto, if set
+    import_queue = None
+
+    # what _throttle reads the time from and waits with
+    _clock = staticmethod(time.time)
+    _sleep = staticmethod(time.sleep)
+
     def __init__(self, metadata, output_dir=None, strict_validation=None,
                  fastmode=False):
         """
@@ -61,27 +107,50 @@ class Scraper(scrapelib.Scraper):
 
         # scrapelib overrides
         self.timeout = settings.SCRAPELIB_TIMEOUT
-        self.cache_storage = scrapelib.FileCache(settings.BILLY_CACHE_DIR)
+        self.cache_storage = ScrapeCache(settings.BILLY_CACHE_DIR)
         self.requests_per_minute = settings.SCRAPELIB_RPM
         self.retry_attempts = settings.SCRAPELIB_RETRY_ATTEMPTS
         self.retry_wait_seconds = settings.SCRAPELIB_RETRY_WAIT_SECONDS
 
+        self.host_requests_per_minute = dict(settings.SCRAPELIB_HOST_RPM)
+        self.fetch_workers = settings.SCRAPELIB_FETCH_WORKERS
+
         if fastmode:
             self.requests_per_minute = 0
+            self.host_requests_per_minute = {}
             self.cache_write_only = False
 
+        self.cache_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+        self._cache_stats_lock = threading.Lock()
+        self.scrape_stats = ScrapeStats()
+
+        # requests are throttled per host, see _throttle
+        self._request_host = threading.local()
+        self._throttle_lock = threading.Lock()
+        self._host_next_request = {}
+
         self.metadata = metadata
         self.output_dir = output_dir
         self.output_names = set()
 
         # make output_dir
         os.path.isdir(self.output_dir) or os.path.makedirs(self.output_dir)
+        self.output = ScrapeOutput(self.output_dir,
+                                   settings.BILLY_SCRAPE_OUTPUT_FORMAT,
+                                   settings.BILLY_SCRAPE_SEGMENT_SIZE)
 
         # validation
         self.strict_validation = strict_validation
         self.validator = DatetimeValidator()
         self._schema = {}
         self._load_schemas()
+        # strict validation has to fail in save_object, so it is never
+        # moved to the background
+        self.background_validation = (settings.BILLY_BACKGROUND_VALIDATION
+                                       and not strict_validation)
+        self._validation_queue = None
+        self._validation_thread = None
+        self.validation_errors = []
 
         # logging convenience methods
         self.logger = logging.getLogger("billy")
@@ -92,6 +161,156 @@ class Scraper(scrapelib.Scraper):
         self.error = self.logger.error
         self.critical = self.logger.critical
 
+    def request(self, method, url, **kwargs):
+        # remember the host so _throttle can apply its rate limit
+        self._request_host.host = urlparse(url).netloc
+        self._request_host.attempts = 0
+
+        if not self.cache_storage:
+            return super(Scraper, self).request(method, url, **kwargs)
+
+        # when the cache isn't read from (ie. not in fastmode) ask the server
+        # whether cached pages changed, and reuse them if they didn't
+        validators = {}
+        if self.cache_write_only and isinstance(self.cache_storage,
+                                                ScrapeCache):
+            key = self.key_for_request(method.lower(), url, **kwargs)
+            if key:
+                validators = self.cache_storage.validators(key)
+
+        if validators:
+            conditional = dict(kwargs)
+            conditional['headers'] = dict(kwargs.get('headers') or {})
+            conditional['headers'].update(validators)
+            resp = super(Scraper, self).request(method, url, **conditional)
+            if resp.status_code == 304:
+                cached = self.cache_storage.get(key)
+                if cached is not None:
+                    self.cache_storage.touch(key)
+                    cached.fromcache = True
+                    self._count_cache('not_modified')
+                    return cached
+                # evicted in the meantime, fetch it again
+                self._request_host.attempts = 0
+                resp = super(Scraper, self).request(method, url, **kwargs)
+        else:
+            resp = super(Scraper, self).request(method, url, **kwargs)
+
+        if resp.fromcache and isinstance(self.cache_storage, ScrapeCache):
+            # pages read from the cache (in fastmode) count as used too, so
+            # they aren't evicted as stale
+            self.cache_storage.touch(
+                self.key_for_request(method.lower(), url, **kwargs))
+        self._count_cache('hits' if resp.fromcache else 'misses')
+        return resp
+
+    def _count_cache(self, stat):
+        # fetch_many requests from several threads
+        with self._cache_stats_lock:
+            self.cache_stats[stat] += 1
+
+    def report_cache(self):
+        """ log and return the cache hit/miss/304 counts of this scraper """
+        stats = dict(self.cache_stats)
+        total = sum(stats.values())
+        if total:
+            self.info('cache: %s hits, %s misses, %s not modified '
+                      '(%.1f%% not downloaded)' % (
+                          stats['hits'], stats['misses'],
+                          stats['not_modified'],
+                          100.0 * (stats['hits'] + stats['not_modified']) /
+                          total))
+        return stats
+
+    def report_stats(self):
+        """
+        log and return this scraper's requests, objects and timings (see
+        ScrapeStats.summary), including its cache counts
+        """
+        stats = self.scrape_stats.summary()
+        stats['cache'] = dict(self.cache_stats)
+        self.info('%s requests (%s retries, %s errors), %.1f KB, '
+                  '%s objects in %.1fs (%.1f objects/minute)' % (
+                      stats['requests'], stats['retries'], stats['errors'],
+                      stats['bytes'] / 1024.0, stats['objects'],
+                      stats['seconds'], stats['objects_per_minute']))
+        for host in stats['hosts']:
+            latency = host['latency']
+            if latency['p50'] is None:
+                continue
+            self.info('  %s: %s requests, latency p50 %.3fs p90 %.3fs '
+                      'p99 %.3fs' % (host['host'], host['requests'],
+                                     latency['p50'], latency['p90'],
+                                     latency['p99']))
+        for name, timing in sorted(stats['timings'].items()):
+            self.info('  %s: %.2fs in %s calls' % (name, timing['seconds'],
+                                                   timing['count']))
+        return stats
+
+    @property
+    def _throttled(self):
+        # scrapelib only calls _throttle when requests_per_minute is set,
+        # hosts may be limited without it
+        return bool(self.requests_per_minute or
+                    getattr(self, 'host_requests_per_minute', None))
+
+    @_throttled.setter
+    def _throttled(self, value):
+        # scrapelib sets this from requests_per_minute, see above
+        pass
+
+    def _throttle(self):
+        """
+        Throttle requests to each host separately (scrapelib throttles
+        all requests together), so that a slow host doesn't hold back the
+        others and concurrent fetches to one host still respect its limit.
+        """
+        host = getattr(self._request_host, 'host', None)
+        rpm = self.host_requests_per_minute.get(host,
+                                                self.requests_per_minute)
+        if not rpm:
+            return
+
+        # reserve the host's next free slot, then wait for it outside the lock
+        with self._throttle_lock:
+            now = self._clock()
+            slot = max(now, self._host_next_request.get(host, 0))
+            self._host_next_request[host] = slot + 60.0 / rpm
+
+        if slot > now:
+            self.debug('sleeping for %fs before requesting from %s' %
+                       (slot - now, host))
+            self._sleep(slot - now)
+
+    def fetch_many(self, urls, method='GET', workers=None, **kwargs):
+        """
+        Request many URLs concurrently, yields (url, response) pairs as
+        the requests complete.
+
+        Each host's rate limit and the retry policy still apply to every
+        request, as does the cache.  If a request fails its exception is
+        raised and the remaining requests are abandoned.
+
+        :param urls: URLs to request
+        :param method: HTTP method to use for all requests
+        :param workers: number of threads (default SCRAPELIB_FETCH_WORKERS)
+        """
+        def fetch(url):
+            try:
+                return url, self.request(method, url, **kwargs), None
+            except Exception as e:
+                return url, None, e
+
+        pool = ThreadPool(workers or self.fetch_workers)
+        try:
+            for url, response, exception in pool.imap_unordered(fetch, urls):
+                if exception is not None:
+                    raise exception
+                yield url, response
+        finally:
+            pool.terminate()
+            pool.join()
+
     def _load_schemas(self):
         """ load all schemas into schema dict """
 
@@ -116,6 +335,10 @@ class Scraper(scrapelib.Scraper):
         self._schema['person']['properties']['roles'][
             'items']['properties']['term']['enum'] = terms
 
+        # compile once, every saved object is validated against these
+        for type in types:
+            self._schema[type] = compile_schema(self._schema[type])
+
     @property
     def object_count(self):
         # number of distinct output filenames
@@ -123,12 +346,56 @@ class Scraper(scrapelib.Scraper):
 
     def validate_json(self, obj):
         try:
-            self.validator.validate(obj, self._schema[obj['_type']])
+            with self.scrape_stats.timed('validate_json'):
+                self.validator.validate(obj, self._schema[obj['_type']])
         except ValueError as ve:
             self.warning(str(ve))
             if self.strict_validation:
                 raise ve
 
+    def _validate_in_background(self):
+        while True:
+            obj = self._validation_queue.get()
+            if obj is None:
+                break
+            try:
+                with self.scrape_stats.timed('validate_json'):
+                    self.validator.validate(obj, self._schema[obj['_type']])
+            except ValueError as ve:
+                self.validation_errors.append(
+                    (obj['_type'], obj.get_filename(), str(ve)))
+
+    def validate_later(self, obj):
+        """ queue obj to be validated by a background thread """
+        if self._validation_thread is None:
+            self._validation_queue = queue.Queue(1000)
+            self._validation_thread = threading.Thread(
+                target=self._validate_in_background)
+            self._validation_thread.daemon = True
+            self._validation_thread.start()
+        self._validation_queue.put(obj)
+
+    def finish_validation(self):
+        """
+        Wait for background validation to finish and report its errors,
+        returns the list of (type, filename, error) tuples.
+        """
+        if self._validation_thread is not None:
+            self._validation_queue.put(None)
+            self._validation_thread.join()
+            self._validation_thread = None
+
+        if self.validation_errors:
+            for obj_type, filename, error in self.validation_errors:
+                self.warning('%s %s: %s' % (obj_type, filename, error))
+            self.warning('%s objects failed validation' %
+                         len(self.validation_errors))
+        return self.validation_errors
+
+    def close_output(self):
+        """ finish writing scraped objects, called when the scrape is done """
+        self.output.close()
+
     def all_sessions(self):
         sessions = []
         for t in self.metadata['terms']:
@@ -173,6 +440,11 @@ class Scraper(scrapelib.Scraper):
         raise NoDataForPeriod(term)
 
     def save_object(self, obj):
+        with self.scrape_stats.timed('save_object'):
+            self._save_object(obj)
+        self.scrape_stats.record_object()
+
+    def _save_object(self, obj):
         self.log('Save %s %s', obj['_type'], six.text_type(obj))
 
         # copy jurisdiction to LEVEL_FIELD
@@ -191,12 +463,19 @@ class Scraper(scrapelib.Scraper):
         else:
             data_dir = obj['_type'] + 's'
 
-        with open(os.path.join(self.output_dir, data_dir, filename),
-                  'w') as f:
-            json.dump(obj, f, cls=JSONEncoderPlus)
+        with self.scrape_stats.timed('write_json'):
+            scraped = self.output.save(
+                data_dir, filename,
+                json.dumps(obj, cls=JSONEncoderPlus).encode('utf-8'))
 
         # validate after writing, allows for inspection
-        self.validate_json(obj)
+        if self.background_validation:
+            self.validate_later(obj)
+        else:
+            self.validate_json(obj)
+
+        if self.import_queue is not None:
+            self.import_queue.put(scraped)
 
 
 class SourcedObject(dict):
@@ -20,6 +20,26 @@ class BillScraper(Scraper):
         """
         raise NotImplementedError('BillScrapers must define a scrape method')
 
+    def changed_bills(self, session, since):
+        """
+        Report the bills of a session that changed since a datetime (eg.
+        from an RSS feed or a recent actions page) as (chamber, bill_id)
+        pairs, each of which is scraped with scrape_bill by
+        ``billy-update --changed-since``.
+
+        May be overridden by subclasses, returns None if the scraper can't
+        tell, in which case the whole session is scraped.
+        """
+        return None
+
+    def scrape_bill(self, chamber, session, bill_id):
+        """
+        Scrape a single bill, needed by targeted scrapes.  Must be
+        overridden by subclasses that implement changed_bills.
+        """
+        raise NotImplementedError('BillScrapers must define a scrape_bill '
+                                  'method for targeted scrapes')
+
     save_bill = Scraper.save_object
 
 
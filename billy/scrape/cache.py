@@ -0,0 +1,173 @@
+"""
+HTTP cache for scrapers.
+
+Responses are stored gzip compressed, one file per URL, in directories
+sharded by the first characters of the URL's md5.  Each file starts with a
+JSON line holding the status, encoding, url and headers, followed by the
+body.  The ETag / Last-Modified headers kept there let the scraper make
+conditional requests and reuse the cached body when the server answers
+304 Not Modified.
+"""
+import os
+import re
+import json
+import gzip
+import time
+import hashlib
+import tempfile
+
+import requests
+
+
+def evict_entries(entries, max_size=None, max_age=None):
+    """
+    Remove the (path, size, mtime) entries not modified within max_age
+    seconds, then the least recently modified ones until at most max_size
+    bytes remain.  Returns the number of entries removed.
+    """
+    if max_size is None and max_age is None:
+        return 0
+
+    removed = 0
+    now = time.time()
+    kept = []
+    for path, size, mtime in entries:
+        if max_age is not None and now - mtime > max_age:
+            os.remove(path)
+            removed += 1
+        else:
+            kept.append((mtime, size, path))
+
+    if max_size is not None:
+        total = sum(size for _, size, _ in kept)
+        for mtime, size, path in sorted(kept):
+            if total <= max_size:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+
+    return removed
+
+
+def walk_entries(cache_dir, shard_re, filename_re):
+    """ (path, size, mtime) of the files matching filename_re in shards """
+    for dirpath, dirnames, filenames in os.walk(cache_dir):
+        # only descend into shard directories, the cache directory may hold
+        # other things
+        dirnames[:] = [d for d in dirnames if shard_re.match(d)]
+        for filename in filenames:
+            if filename_re.match(filename):
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+
+class ScrapeCache(object):
+    """
+    Sharded, compressed cache storage for scrapelib.
+
+    :param cache_dir: directory for storing responses
+    :param shard_depth: number of directory levels to spread files over
+    """
+
+    _filename_re = re.compile(r'^[0-9a-f]{32}\.gz$')
+    _shard_re = re.compile(r'^[0-9a-f]{2}$')
+
+    def __init__(self, cache_dir, shard_depth=2):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.shard_depth = shard_depth
+        os.path.isdir(self.cache_dir) or os.makedirs(self.cache_dir)
+
+    def _path(self, key):
+        digest = hashlib.md5(key.encode('utf8')).hexdigest()
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.cache_dir, *(shards + [digest + '.gz']))
+
+    def _read_header(self, f):
+        return json.loads(f.readline().decode('utf8'))
+
+    def get(self, key):
+        """Get cache entry for key, or return None."""
+        try:
+            with gzip.open(self._path(key), 'rb') as f:
+                header = self._read_header(f)
+                content = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        resp = requests.Response()
+        resp.status_code = header['status']
+        resp.encoding = header['encoding']
+        resp.url = header['url']
+        resp.headers.update(header['headers'])
+        resp._content = content
+        return resp
+
+    def validators(self, key):
+        """
+        Headers for a conditional request for key (If-None-Match and/or
+        If-Modified-Since), empty if key isn't cached or can't be validated.
+        """
+        try:
+            with gzip.open(self._path(key), 'rb') as f:
+                headers = self._read_header(f)['headers']
+        except (IOError, OSError, ValueError):
+            return {}
+
+        headers = requests.structures.CaseInsensitiveDict(headers)
+        validators = {}
+        if 'etag' in headers:
+            validators['If-None-Match'] = headers['etag']
+        if 'last-modified' in headers:
+            validators['If-Modified-Since'] = headers['last-modified']
+        return validators
+
+    def set(self, key, response):
+        """Set cache entry for key with contents of response."""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.path.isdir(directory) or os.makedirs(directory)
+
+        header = {'status': response.status_code,
+                  'encoding': response.encoding,
+                  'url': response.url or key,
+                  'headers': dict(response.headers)}
+
+        # write to a temporary file first so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    f.write(json.dumps(header).encode('utf8') + b'\n')
+                    f.write(response.content)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def touch(self, key):
+        """ mark key's entry as fresh, eg. after a 304 """
+        try:
+            os.utime(self._path(key), None)
+        except OSError:
+            pass
+
+    def _entries(self):
+        return walk_entries(self.cache_dir, self._shard_re,
+                            self._filename_re)
+
+    def evict(self, max_size=None, max_age=None):
+        """
+        Remove entries not fetched or validated within max_age seconds,
+        then the least recently fetched ones until the cache holds at most
+        max_size bytes.  Returns the number of entries removed.
+        """
+        return evict_entries(self._entries(), max_size, max_age)
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            os.remove(path)
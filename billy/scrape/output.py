@@ -0,0 +1,275 @@
+"""
+Storage for scraped objects.
+
+Scrapers write each object either to its own JSON file (the 'json'
+format) or, to avoid tens of thousands of tiny files, append it to JSONL
+segments of up to BILLY_SCRAPE_SEGMENT_SIZE objects ('jsonl', or gzip
+compressed 'jsonl.gz').  Segment lines are the object's filename, a tab and
+the object's JSON.  Each type directory also gets an index.jsonl listing
+the segment and line every name was written to, a name written more than
+once (like a file that's overwritten) resolves to its last line.
+
+Readers detect the format of a directory themselves, so importers handle
+either regardless of the current setting.
+"""
+import os
+import glob
+import gzip
+import json
+import threading
+from collections import defaultdict
+
+import six
+
+INDEX_FILENAME = 'index.jsonl'
+SEGMENT_PATTERN = 'segment-*.jsonl*'
+FORMATS = ('json', 'jsonl', 'jsonl.gz')
+
+
+class ScrapedObject(object):
+    """
+    A scraped object, either a JSON file or a line read from a segment.
+
+    Objects read from a segment know their path and the offset of their
+    line (in the uncompressed segment), so a reference to one can be kept
+    without its JSON (see reference()).
+    """
+    __slots__ = ('name', 'path', 'raw', 'offset')
+
+    def __init__(self, name, path=None, raw=None, offset=None):
+        self.name = name
+        self.path = path
+        self.raw = raw
+        self.offset = offset
+
+    def read(self):
+        """ the object's JSON, as bytes """
+        if self.raw is not None:
+            return self.raw
+        if self.offset is not None:
+            return _read_segment_line(self.path, self.offset)
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def reference(self):
+        """ a copy that reads the object from disk when needed """
+        if self.path is None:
+            return self
+        return ScrapedObject(self.name, path=self.path, offset=self.offset)
+
+    def load(self):
+        return json.loads(self.read().decode('utf-8'))
+
+
+def _open_segment(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+# (path, stat, file) of the last compressed segment read from, gzip files
+# seek forward by decompressing, so objects read in order only decompress
+# the segment once
+_gz_reader = None
+_gz_reader_lock = threading.Lock()
+
+
+def _read_segment_line(path, offset):
+    global _gz_reader
+    if not path.endswith('.gz'):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+    else:
+        with _gz_reader_lock:
+            stat = os.stat(path)
+            stat = (stat.st_ino, stat.st_mtime, stat.st_size)
+            if _gz_reader is None or _gz_reader[:2] != (path, stat):
+                if _gz_reader is not None:
+                    _gz_reader[2].close()
+                _gz_reader = (path, stat, gzip.open(path, 'rb'))
+            f = _gz_reader[2]
+            # seeking back rewinds to the start of the segment
+            f.seek(offset)
+            line = f.readline()
+    return line.rstrip(b'\n').split(b'\t', 1)[1]
+
+
+def _truncate_partial_line(path):
+    """ drop a last line left unfinished (eg. by a crashed scrape) """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        while pos > 0:
+            size = min(4096, pos)
+            f.seek(pos - size)
+            chunk = f.read(size)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                pos = pos - size + newline + 1
+                break
+            pos -= size
+        if pos != end:
+            f.truncate(pos)
+
+
+class SegmentWriter(object):
+    """ appends objects to the JSONL segments of a type directory """
+
+    def __init__(self, type_dir, compress=False, segment_size=1000):
+        self.type_dir = type_dir
+        self.compress = compress
+        self.segment_size = segment_size
+        # continue after segments left by an earlier scraper, never append
+        # to them
+        self._next_segment = len(glob.glob(os.path.join(type_dir,
+                                                        SEGMENT_PATTERN))) + 1
+        self._segment = None
+        self._segment_name = None
+        self._lines = 0
+        index_path = os.path.join(type_dir, INDEX_FILENAME)
+        _truncate_partial_line(index_path)
+        self._index = open(index_path, 'ab')
+
+    def _start_segment(self):
+        self._segment_name = 'segment-%05d.jsonl%s' % (
+            self._next_segment, '.gz' if self.compress else '')
+        self._next_segment += 1
+        self._segment = _open_segment(
+            os.path.join(self.type_dir, self._segment_name), 'wb')
+        self._lines = 0
+
+    def write(self, name, raw):
+        if self._segment is None:
+            self._start_segment()
+        if not isinstance(name, six.text_type):
+            name = name.decode('utf-8')
+        name = name.replace(u'\t', u' ').replace(u'\n', u' ')
+        self._segment.write(name.encode('utf-8') + b'\t' + raw + b'\n')
+        self._index.write(json.dumps([self._segment_name, self._lines,
+                                      name]).encode('utf-8') + b'\n')
+        self._lines += 1
+        if self._lines >= self.segment_size:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def close(self):
+        self._close_segment()
+        self._index.close()
+
+
+class ScrapeOutput(object):
+    """
+    Writes a scraper's objects to output_dir/<type dir>/ in the given
+    format, close() must be called once the scrape is done.
+    """
+
+    def __init__(self, output_dir, format='json', segment_size=1000):
+        if format not in FORMATS:
+            raise ValueError('unknown scrape output format %r' % format)
+        self.output_dir = output_dir
+        self.format = format
+        self.segment_size = segment_size
+        self._writers = {}
+
+    def save(self, data_dir, filename, raw):
+        """ store raw JSON as filename, returns a ScrapedObject for it """
+        if self.format == 'json':
+            path = os.path.join(self.output_dir, data_dir, filename)
+            with open(path, 'wb') as f:
+                f.write(raw)
+            return ScrapedObject(filename, path=path)
+
+        if data_dir not in self._writers:
+            self._writers[data_dir] = SegmentWriter(
+                os.path.join(self.output_dir, data_dir),
+                compress=self.format == 'jsonl.gz',
+                segment_size=self.segment_size)
+        self._writers[data_dir].write(filename, raw)
+        return ScrapedObject(filename, raw=raw)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def list_sources(type_dir, chunk_size=None):
+    """
+    Split the objects stored in type_dir into sources that read_source can
+    read independently (eg. in another process).  JSON files are split
+    into chunks of chunk_size files (all in one chunk if None), segments
+    are a source each.
+    """
+    index_path = os.path.join(type_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        paths = sorted(glob.glob(os.path.join(type_dir, '*.json')))
+        chunk_size = chunk_size or len(paths) or 1
+        return [('json', paths[i:i + chunk_size])
+                for i in range(0, len(paths), chunk_size)]
+
+    # the last line written for each name wins
+    last = {}
+    written = defaultdict(int)
+    with open(index_path, 'rb') as f:
+        for line in f:
+            try:
+                segment, lineno, name = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # partially written by an interrupted scrape
+                continue
+            last[name] = (segment, lineno)
+            written[segment] += 1
+
+    live = defaultdict(set)
+    for segment, lineno in last.values():
+        live[segment].add(lineno)
+
+    sources = []
+    for segment in sorted(written):
+        lines = live.get(segment, set())
+        sources.append(('jsonl', os.path.join(type_dir, segment),
+                        None if len(lines) == written[segment]
+                        else frozenset(lines)))
+    return sources
+
+
+def read_source(source):
+    """ yields the ScrapedObjects of a source returned by list_sources """
+    if source[0] == 'json':
+        for path in source[1]:
+            yield ScrapedObject(os.path.basename(path), path=path)
+        return
+
+    _, path, lines = source
+    offset = 0
+    with _open_segment(path, 'rb') as f:
+        for lineno, line in enumerate(f):
+            line_offset = offset
+            offset += len(line)
+            if lines is not None and lineno not in lines:
+                continue
+            name, raw = line.rstrip(b'\n').split(b'\t', 1)
+            yield ScrapedObject(name.decode('utf-8'), path=path, raw=raw,
+                                offset=line_offset)
+
+
+def iter_scraped(type_dir):
+    """ yields every ScrapedObject stored in type_dir """
+    for source in list_sources(type_dir):
+        for obj in read_source(source):
+            yield obj
+
+
+def clear_scraped(type_dir):
+    """ remove everything scraped into type_dir, in any format """
+    for pattern in ('*.json', SEGMENT_PATTERN, INDEX_FILENAME):
+        for path in glob.glob(os.path.join(type_dir, pattern)):
+            os.remove(path)
@@ -0,0 +1,113 @@
+"""
+Instrumentation for scrapers.
+
+Every Scraper keeps a ScrapeStats that counts the requests made to each host
+(with their latency, bytes received, retries and errors), the objects saved
+and the time spent in named steps such as validate_json and save_object.
+summary() returns them in a form that can be stored in billy_runs, host
+names contain dots so hosts are stored as a list rather than as keys.
+"""
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """ nearest-rank percentile of sorted values """
+    if not values:
+        return None
+    # pct * n first, so that eg. 7% of 100 doesn't round up to 7.000...1
+    index = int(math.ceil(pct * len(values) / 100.0)) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+class HostStats(object):
+    __slots__ = ('requests', 'bytes', 'retries', 'errors', 'latencies')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.latencies = []
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {'requests': self.requests,
+                'bytes': self.bytes,
+                'retries': self.retries,
+                'errors': self.errors,
+                'latency': {'p50': percentile(latencies, 50),
+                            'p90': percentile(latencies, 90),
+                            'p99': percentile(latencies, 99),
+                            'max': latencies[-1] if latencies else None}}
+
+
+class ScrapeStats(object):
+    """ thread-safe counters for one scraper """
+
+    def __init__(self):
+        self.started = time.time()
+        self.hosts = {}
+        self.objects = 0
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostStats()
+        return self.hosts[host]
+
+    def record_request(self, host, seconds, nbytes):
+        """ a response was received from host after seconds """
+        with self._lock:
+            stats = self._host(host)
+            stats.requests += 1
+            stats.bytes += nbytes
+            stats.latencies.append(seconds)
+
+    def record_error(self, host):
+        """ a request to host raised an exception """
+        with self._lock:
+            self._host(host).errors += 1
+
+    def record_retry(self, host):
+        with self._lock:
+            self._host(host).retries += 1
+
+    def record_object(self):
+        with self._lock:
+            self.objects += 1
+
+    @contextmanager
+    def timed(self, name):
+        """ add the time spent in the with block to the name timing """
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                count, seconds = self.timings.get(name, (0, 0.0))
+                self.timings[name] = (count + 1, seconds + elapsed)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.time() - self.started
+            hosts = [dict(stats.summary(), host=host)
+                     for host, stats in sorted(self.hosts.items())]
+            timings = dict((name, {'count': count, 'seconds': seconds})
+                           for name, (count, seconds) in self.timings.items())
+            objects = self.objects
+
+        return {'seconds': elapsed,
+                'requests': sum(h['requests'] for h in hosts),
+                'bytes': sum(h['bytes'] for h in hosts),
+                'retries': sum(h['retries'] for h in hosts),
+                'errors': sum(h['errors'] for h in hosts),
+                'objects': objects,
+                'objects_per_minute': (objects * 60.0 / elapsed
+                                       if elapsed else 0),
+                'hosts': hosts,
+                'timings': timings}
@@ -1,25 +1,172 @@
+import os
 import re
+import gzip
+import hashlib
+import tempfile
 import itertools
 import subprocess
 import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
+from billy.core import settings
+from billy.scrape.cache import evict_entries, walk_entries
 
-def convert_pdf(filename, type='xml'):
+_converted_re = re.compile(r'^[0-9a-f]{40}\.[a-z-]+\.gz$')
+_shard_re = re.compile(r'^[0-9a-f]{2}$')
+
+
+def _run_converter(filename, type):
+    """ returns the converter's output and whether it succeeded """
     commands = {'text': ['pdftotext', '-layout', filename, '-'],
                 'text-nolayout': ['pdftotext', filename, '-'],
                 'xml': ['pdftohtml', '-xml', '-stdout', filename],
                 'html': ['pdftohtml', '-stdout', filename]}
     try:
-        pipe = subprocess.Popen(commands[type], stdout=subprocess.PIPE,
-                                close_fds=True).stdout
+        proc = subprocess.Popen(commands[type], stdout=subprocess.PIPE,
+                                close_fds=True)
     except OSError as e:
         raise EnvironmentError("error running %s, missing executable? [%s]" %
-                               ' '.join(commands[type]), e)
-    data = pipe.read()
-    pipe.close()
+                               (' '.join(commands[type]), e))
+    data = proc.communicate()[0]
+    return data, proc.returncode == 0 and bool(data)
+
+
+def _pdf_cache_dir():
+    # resolved on every use, so that it follows BILLY_CACHE_DIR
+    if not settings.BILLY_PDF_CACHE_DIR:
+        return None
+    return os.path.join(settings.BILLY_CACHE_DIR,
+                        settings.BILLY_PDF_CACHE_DIR)
+
+
+def _converted_path(digest, type):
+    return os.path.join(_pdf_cache_dir(), digest[:2],
+                        '%s.%s.gz' % (digest, type))
+
+
+def _get_converted(digest, type):
+    if not _pdf_cache_dir():
+        return None
+    path = _converted_path(digest, type)
+    try:
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    # recently used conversions are the last to be evicted
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
     return data
 
 
+def _set_converted(digest, type, data):
+    if not _pdf_cache_dir():
+        return
+    path = _converted_path(digest, type)
+    directory = os.path.dirname(path)
+    os.path.isdir(directory) or os.makedirs(directory)
+    # write to a temporary file first so readers never see partial files
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(data)
+    os.rename(tmp_path, path)
+
+
+def _convert(digest, filename, type):
+    # failed (or empty) conversions aren't cached, they're retried next time
+    data, ok = _run_converter(filename, type)
+    if ok:
+        _set_converted(digest, type, data)
+    return data
+
+
+def evict_converted(max_size=None, max_age=None):
+    """
+    Remove cached conversions not used within max_age seconds, then the
+    least recently used ones until at most max_size bytes remain.  Returns
+    the number of conversions removed.
+    """
+    cache_dir = _pdf_cache_dir()
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    return evict_entries(walk_entries(cache_dir, _shard_re, _converted_re),
+                         max_size, max_age)
+
+
+def convert_pdf(filename, type='xml'):
+    """
+    Extract text/xml/html from a PDF.  Results are cached by the PDF's
+    contents in BILLY_PDF_CACHE_DIR, so a PDF is only converted once.
+    """
+    with open(filename, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+
+    data = _get_converted(digest, type)
+    if data is None:
+        data = _convert(digest, filename, type)
+    return data
+
+
+def convert_pdf_data(pdf_data, type='xml'):
+    """ convert_pdf for PDF contents instead of a filename """
+    digest = hashlib.sha1(pdf_data).hexdigest()
+
+    data = _get_converted(digest, type)
+    if data is None:
+        with tempfile.NamedTemporaryFile(delete=True) as tmpf:
+            tmpf.write(pdf_data)
+            tmpf.flush()
+            data = _convert(digest, tmpf.name, type)
+    return data
+
+
+def convert_many(filenames, type='xml', workers=None):
+    """
+    convert_pdf a list of PDFs on a pool of workers (BILLY_PDF_WORKERS,
+    or one per CPU), returns the results in the same order as filenames.
+
+    Each distinct PDF is converted only once.
+    """
+    digests = []
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            digests.append(hashlib.sha1(f.read()).hexdigest())
+
+    # one filename for each distinct PDF that isn't already cached
+    results = {}
+    todo = {}
+    for filename, digest in zip(filenames, digests):
+        if digest in results or digest in todo:
+            continue
+        data = _get_converted(digest, type)
+        if data is None:
+            todo[digest] = filename
+        else:
+            results[digest] = data
+
+    def convert(item):
+        digest, filename = item
+        return digest, _convert(digest, filename, type)
+
+    if todo:
+        workers = (workers or getattr(settings, 'BILLY_PDF_WORKERS', None) or
+                   multiprocessing.cpu_count())
+        pool = ThreadPool(min(workers, len(todo)))
+        try:
+            # converters are subprocesses, threads are enough to use all cores
+            for digest, data in pool.imap_unordered(convert, todo.items()):
+                results[digest] = data
+        finally:
+            pool.terminate()
+            pool.join()
+
+    return [results[digest] for digest in digests]
+
+
 def clean_spaces(s):
     return re.sub('\s+', ' ', s, flags=re.U).strip()
 
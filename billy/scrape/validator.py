@@ -9,3 +9,60 @@ class DatetimeValidator(SchemaValidator):
 
     def validate_type_datetime(self, x):
         return isinstance(x, (datetime.date, datetime.datetime))
+
+    def validate_enum(self, x, fieldname, schema, path, options=None):
+        # compiled schemas (see compile_schema) have a set of the options
+        # to check first, the list is still used for the error message
+        enum_set = schema.get('_enum_set')
+        if enum_set is not None:
+            try:
+                if x.get(fieldname) in enum_set:
+                    return
+            except TypeError:
+                pass
+        super(DatetimeValidator, self).validate_enum(x, fieldname, schema,
+                                                     path, options)
+
+
+# keys whose values are (lists or dicts of) schemas
+_SUBSCHEMA_KEYS = ('items', 'type', 'additionalProperties', 'additionalItems',
+                   'disallow')
+_SCHEMA_DICT_KEYS = ('properties', 'patternProperties')
+
+
+def compile_schema(schema, required_by_default=True, blank_by_default=False):
+    """
+    Return a copy of schema prepared for validating many objects.
+
+    validictory copies every (sub)schema that doesn't say whether it is
+    required or may be blank each time it is validated, and checks enums
+    by scanning a list.  The compiled copy spells out 'required' and
+    'blank' everywhere and adds a frozenset of each enum's options for
+    DatetimeValidator to check, it validates exactly the same data.
+    """
+    if isinstance(schema, (list, tuple)):
+        return [compile_schema(s, required_by_default, blank_by_default)
+                for s in schema]
+    elif not isinstance(schema, dict):
+        return schema
+
+    compiled = {}
+    for key, value in schema.items():
+        if key == 'enum' and isinstance(value, (list, tuple)):
+            value = list(value)
+            try:
+                compiled['_enum_set'] = frozenset(value)
+            except TypeError:
+                pass
+        elif key in _SCHEMA_DICT_KEYS and isinstance(value, dict):
+            value = dict((k, compile_schema(v, required_by_default,
+                                            blank_by_default))
+                         for k, v in value.items())
+        elif key in _SUBSCHEMA_KEYS:
+            value = compile_schema(value, required_by_default,
+                                   blank_by_default)
+        compiled[key] = value
+
+    compiled.setdefault('required', required_by_default)
+    compiled.setdefault('blank', blank_by_default)
+    return compiled
@@ -1,5 +1,6 @@
 from billy.core import settings, _configure_db
 settings.MONGO_DATABASE += '_test'
+settings.BILLY_NAME_MATCHER_DIR = None
 _configure_db(settings.MONGO_HOST, settings.MONGO_PORT,
               settings.MONGO_DATABASE)
 import pymongo
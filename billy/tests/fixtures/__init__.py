@@ -2,6 +2,7 @@ import os
 import sys
 from billy.core import db
 from billy.importers.metadata import import_metadata
+from billy.importers.utils import set_normalized_fields
 
 
 def load_metadata():
@@ -22,9 +23,11 @@ def load_legislators():
     db.legislators.drop()
     from .ex import legislators
     for legislator in legislators.legislators:
+        set_normalized_fields(legislator)
         db.legislators.save(legislator)
     from .yz import legislators
     for legislator in legislators.legislators:
+        set_normalized_fields(legislator)
         db.legislators.save(legislator)
 
 
@@ -32,6 +35,7 @@ def load_committees():
     db.committees.drop()
     from .ex import committees
     for committee in committees.committees:
+        set_normalized_fields(committee)
         db.committees.save(committee)
 
 
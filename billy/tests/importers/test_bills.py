@@ -1,6 +1,11 @@
+import os
 import copy
+import json
+import shutil
+import tempfile
 from billy.core import db
-from billy.importers import bills, names
+from billy.importers import bills, names, utils
+from billy.scrape.output import ScrapeOutput, ScrapedObject
 
 from nose.tools import with_setup, assert_equal
 
@@ -14,6 +19,10 @@ def setup_func():
     db.document_ids.drop()
     db.vote_ids.drop()
     db.committees.drop()
+    db.import_manifests.drop()
+    db.bill_ids.drop()
+    utils._id_blocks.clear()
+    utils._committee_resolvers.clear()
     names.__matchers = {}
 
     fixtures.load_metadata()
@@ -160,6 +169,32 @@ def test_import_bill():
     assert bill['documents'][0]['doc_id'] == 'EXD00000003'
 
 
+@with_setup(setup_func)
+def test_import_bill_search_fields():
+    data = {'_type': 'bill', 'state': 'ex', 'bill_id': 'S1',
+            'chamber': 'upper', 'session': 'S1',
+            'title': 'An act relating to taxes', 'subjects': ['Agriculture'],
+            'alternate_titles': ['Farm taxes'], 'sponsors': [],
+            'versions': [], 'documents': [], 'votes': [], 'actions': [],
+            'companions': []}
+    bills.import_bill(copy.deepcopy(data), {}, None)
+
+    bill = db.bills.find_one()
+    assert_equal(bill['_search_terms'],
+                 ['act', 'agriculture', 'farm', 'relating', 'tax'])
+    assert_equal(bill['_search_weights']['tax'], 4)
+    assert_equal(bill['_search_weights']['farm'], 2)
+
+    # terms of the versions' text (added by search-index) are kept
+    db.bills.update({}, {'$set': {'_text_terms': ['wheat']}})
+    data['title'] = 'An act relating to fees'
+    bills.import_bill(copy.deepcopy(data), {}, None)
+    bill = db.bills.find_one()
+    assert 'fee' in bill['_search_terms']
+    assert 'wheat' in bill['_search_terms']
+    assert 'wheat' not in bill['_search_weights']
+
+
 @with_setup(setup_func)
 def test_import_bill_with_partial_bill_vote_id():
     # test a hack added for Rhode Island where vote bill_ids are missing
@@ -195,6 +230,178 @@ def test_import_bill_with_partial_bill_vote_id():
     assert vote['chamber'] == 'lower'
 
 
+def _write_bill_files(data_dir, format='json'):
+    os.makedirs(os.path.join(data_dir, 'ex', 'bills'))
+    os.makedirs(os.path.join(data_dir, 'ex', 'votes'))
+    output = ScrapeOutput(os.path.join(data_dir, 'ex'), format, 2)
+    for n in range(1, 6):
+        bill = {'_type': 'bill', 'state': 'ex', 'bill_id': 'HB %s' % n,
+                'chamber': 'lower', 'session': 'S1',
+                'title': 'bill %s' % n, 'sponsors': [], 'versions': [],
+                'documents': [], 'votes': [], 'actions': [],
+                'companions': []}
+        output.save('bills', 'lower_S1_HB%s.json' % n,
+                    json.dumps(bill).encode('utf-8'))
+    for bill_id in ('HB 1', 'HB 99'):
+        vote = {'_type': 'vote', 'bill_id': bill_id, 'bill_chamber': 'lower',
+                'session': 'S1', 'motion': 'passage', 'chamber': 'lower',
+                'date': None, 'yes_count': 0, 'no_count': 0,
+                'other_count': 0, 'yes_votes': [], 'no_votes': [],
+                'other_votes': []}
+        output.save('votes', '%s.json' % bill_id,
+                    json.dumps(vote).encode('utf-8'))
+    output.close()
+
+
+def test_load_standalone_votes():
+    data_dir = tempfile.mkdtemp()
+    try:
+        _write_bill_files(data_dir)
+        votes = bills.load_standalone_votes(os.path.join(data_dir, 'ex'))
+        assert_equal(sorted(votes.keys()), [('lower', 'S1', 'HB 1'),
+                                            ('lower', 'S1', 'HB 99')])
+        assert votes.get(('lower', 'S1', 'HB 2')) is None
+
+        vote_hash = votes.hash(('lower', 'S1', 'HB 1'))
+        assert vote_hash != votes.hash(('lower', 'S1', 'HB 99'))
+
+        hb1_votes = votes.pop(('lower', 'S1', 'HB 1'))
+        assert_equal(len(hb1_votes), 1)
+        assert_equal(hb1_votes[0]['motion'], 'passage')
+        assert 'bill_id' not in hb1_votes[0]
+        assert_equal(votes.keys(), [('lower', 'S1', 'HB 99')])
+        assert_equal(votes.pop(('lower', 'S1', 'HB 1'), []), [])
+    finally:
+        shutil.rmtree(data_dir)
+
+
+@with_setup(setup_func)
+def test_import_bills_parallel():
+    data_dir = tempfile.mkdtemp()
+    try:
+        _write_bill_files(data_dir)
+        counts = bills.import_bills('ex', data_dir, workers=2)
+        assert_equal(counts, {'insert': 5, 'update': 0, 'skipped': 0,
+                              'total': 5})
+        assert db.bills.find({'state': 'ex'}).count() == 5
+        assert db.votes.find({'bill_id': db.bills.find_one(
+            {'bill_id': 'HB 1'})['_id']}).count() == 1
+
+        counts = bills.import_bills('ex', data_dir, workers=2,
+                                    full_import=True)
+        assert_equal(counts, {'insert': 0, 'update': 5, 'skipped': 0,
+                              'total': 5})
+        assert db.bills.find({'state': 'ex'}).count() == 5
+    finally:
+        shutil.rmtree(data_dir)
+
+
+@with_setup(setup_func)
+def test_import_bills_skips_unchanged():
+    db.import_manifests.drop()
+    data_dir = tempfile.mkdtemp()
+    try:
+        _write_bill_files(data_dir)
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts, {'insert': 5, 'update': 0, 'skipped': 0,
+                              'total': 5})
+
+        scraped_at = dict((entry['_id'], entry['scraped_at'])
+                          for entry in db.import_manifests.find())
+
+        # nothing changed, everything is skipped
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts, {'insert': 0, 'update': 0, 'skipped': 5,
+                              'total': 5})
+        # but still recorded as scraped
+        for entry in db.import_manifests.find():
+            assert entry['scraped_at'] >= scraped_at[entry['_id']]
+
+        # a changed bill file and a changed standalone vote are reimported
+        path = os.path.join(data_dir, 'ex', 'bills', 'lower_S1_HB2.json')
+        bill = json.load(open(path))
+        bill['title'] = 'new title'
+        json.dump(bill, open(path, 'w'))
+        path = os.path.join(data_dir, 'ex', 'votes', 'HB 1.json')
+        vote = json.load(open(path))
+        vote['yes_count'] = 10
+        json.dump(vote, open(path, 'w'))
+
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts, {'insert': 0, 'update': 2, 'skipped': 3,
+                              'total': 5})
+        assert db.bills.find_one({'bill_id': 'HB 2'})['title'] == 'new title'
+        assert db.votes.find_one({'bill_id': db.bills.find_one(
+            {'bill_id': 'HB 1'})['_id']})['yes_count'] == 10
+    finally:
+        shutil.rmtree(data_dir)
+
+
+@with_setup(setup_func)
+def test_bill_import_stream():
+    data_dir = tempfile.mkdtemp()
+    try:
+        _write_bill_files(data_dir)
+        stream = bills.BillImportStream('ex', data_dir)
+        for n in range(1, 4):
+            filename = 'lower_S1_HB%s.json' % n
+            stream.put(ScrapedObject(filename, path=os.path.join(
+                data_dir, 'ex', 'bills', filename)))
+        counts = stream.close()
+        assert_equal(counts['insert'], 3)
+        assert db.bills.find({'state': 'ex'}).count() == 3
+        assert db.votes.find().count() == 1
+
+        # the import after the scrape only handles the rest
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts, {'insert': 2, 'update': 0, 'skipped': 3,
+                              'total': 5})
+    finally:
+        shutil.rmtree(data_dir)
+
+
+@with_setup(setup_func)
+def test_bill_import_stream_parallel():
+    # --pipeline --workers: the stream reserves id blocks in this process
+    # before the workers are forked to import the rest
+    data_dir = tempfile.mkdtemp()
+    chunk_size = bills.IMPORT_CHUNK_SIZE
+    bills.IMPORT_CHUNK_SIZE = 1
+    try:
+        _write_bill_files(data_dir)
+        stream = bills.BillImportStream('ex', data_dir)
+        filename = 'lower_S1_HB1.json'
+        stream.put(ScrapedObject(filename, path=os.path.join(
+            data_dir, 'ex', 'bills', filename)))
+        stream.close()
+
+        counts = bills.import_bills('ex', data_dir, workers=2)
+        assert_equal(counts, {'insert': 4, 'update': 0, 'skipped': 1,
+                              'total': 5})
+        ids = [bill['_id'] for bill in db.bills.find({'state': 'ex'})]
+        assert_equal(len(ids), 5)
+        assert_equal(len(set(ids)), 5)
+    finally:
+        bills.IMPORT_CHUNK_SIZE = chunk_size
+        shutil.rmtree(data_dir)
+
+
+@with_setup(setup_func)
+def test_import_bills_segments():
+    data_dir = tempfile.mkdtemp()
+    try:
+        _write_bill_files(data_dir, 'jsonl.gz')
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts, {'insert': 5, 'update': 0, 'skipped': 0,
+                              'total': 5})
+        assert db.votes.find().count() == 1
+
+        counts = bills.import_bills('ex', data_dir)
+        assert_equal(counts['skipped'], 5)
+    finally:
+        shutil.rmtree(data_dir)
+
+
 def test_fix_bill_id():
     expect = 'AB 74'
     bill_ids = ['A.B. 74', 'A.B.74', 'AB74', 'AB 0074',
@@ -219,7 +426,9 @@ def test_populate_current_fields():
                      'title': 'current everything'})
     db.bills.insert({'state': 'ex', 'session': 'S0', 'title': 'not current'})
 
-    bills.populate_current_fields('ex')
+    assert bills.populate_current_fields('ex') == 6
+    # nothing changed, nothing is written
+    assert bills.populate_current_fields('ex') == 0
 
     b = db.bills.find_one({'title': 'current everything'})
     assert b['_current_session']
@@ -269,6 +478,34 @@ def test_votematcher():
     assert votes[3]['vote_id'] == 'EXV00000003'
 
 
+@with_setup(setup_func)
+def test_existing_votes():
+    data = {'_type': 'bill', 'state': 'ex', 'bill_id': 'S1',
+            'chamber': 'upper', 'session': 'S1', 'title': 'title',
+            'sponsors': [], 'versions': [], 'documents': [], 'actions': [],
+            'companions': [],
+            'votes': [{'motion': 'passage', 'chamber': 'upper', 'date': None,
+                       'yes_count': 1, 'no_count': 0, 'other_count': 0,
+                       'yes_votes': [], 'no_votes': [], 'other_votes': []}]}
+
+    bills.import_bill(copy.deepcopy(data), {}, None)
+    existing = bills.ExistingVotes('ex')
+    assert_equal(existing.get('S1', 'EXB00000001')[0]['vote_id'],
+                 'EXV00000001')
+
+    # a second vote gets a new id, the first keeps its id
+    data['votes'].append({'motion': 'reconsider', 'chamber': 'upper',
+                          'date': None, 'yes_count': 0, 'no_count': 1,
+                          'other_count': 0, 'yes_votes': [], 'no_votes': [],
+                          'other_votes': []})
+    bills.import_bill(copy.deepcopy(data), {}, None,
+                      existing_votes=existing)
+    assert_equal(sorted(v['vote_id'] for v in
+                        existing.get('S1', 'EXB00000001')),
+                 ['EXV00000001', 'EXV00000002'])
+    assert_equal(db.votes.count(), 2)
+
+
 @with_setup(setup_func)
 def test_get_committee_id():
     # 2 committees with the same name, different chamber
@@ -297,3 +534,38 @@ def test_get_committee_id():
     assert (bills.get_committee_id('ex', 'upper', 'Science') ==
             'EXC000004')
     assert bills.get_committee_id('ex', 'upper', 'Nothing') is None
+
+
+@with_setup(setup_func)
+def test_committee_resolver():
+    db.committees.insert({'state': 'ex', 'chamber': 'upper',
+                          'committee': 'Ways & Means', 'subcommittee': None,
+                          '_id': 'EXC000001'})
+    db.committees.insert({'state': 'ex', 'chamber': 'lower',
+                          'committee': 'Standing Committee on Rules',
+                          'subcommittee': None, '_id': 'EXC000002'})
+    db.committees.insert({'state': 'ex', 'chamber': 'upper',
+                          'committee': 'Rules', 'subcommittee': None,
+                          '_id': 'EXC000003'})
+    db.committees.insert({'state': 'ex', 'chamber': 'upper',
+                          'committee': 'Finance', 'subcommittee': 'Taxes',
+                          '_id': 'EXC000004'})
+
+    resolver = utils.CommitteeResolver('ex')
+    assert resolver.resolve('upper', 'Rules') == 'EXC000003'
+    # matches after normalization, including & -> and
+    assert resolver.resolve('upper', 'Senate Ways and Means') == 'EXC000001'
+    assert resolver.resolve('lower', 'Rules') == 'EXC000002'
+    assert resolver.resolve('upper', 'Finance, Taxes') == 'EXC000004'
+    # no match in chamber, falls back to any chamber
+    assert resolver.resolve('lower', 'ways & means') == 'EXC000001'
+    # ambiguous without a chamber
+    assert resolver.resolve(None, 'Rules') is None
+    assert resolver.resolve('lower', 'Rules') == 'EXC000002'
+
+    # every match agrees with compare_committee
+    assert utils.compare_committee('Senate Ways and Means', 'Ways & Means')
+
+    assert_equal(resolver.pop_stats(), {'exact': 1, 'normalized': 4,
+                                        'unmatched': 1, 'cached': 1})
+    assert_equal(resolver.pop_stats(), {})
@@ -3,6 +3,7 @@ from nose.tools import with_setup
 from billy.core import db
 from billy.importers import committees
 from billy.importers import names
+from billy.importers import utils
 
 from .. import fixtures
 
@@ -10,6 +11,8 @@ from .. import fixtures
 def setup_func():
     db.legislators.drop()
     db.committees.drop()
+    db.committee_ids.drop()
+    utils._id_blocks.clear()
     names.__matchers = {}
 
     fixtures.load_metadata()
@@ -137,3 +140,29 @@ def test_import_committee():
                                 'committee': 'Reptilian Task Force',
                                 'position': 'Vice-Chair'
                                }
+
+
+@with_setup(setup_func)
+def test_import_committee_one_write():
+    saved = []
+
+    class Writer(object):
+        def save(self, doc, **kwargs):
+            saved.append(doc['_id'])
+            return db.committees.save(doc, **kwargs)
+
+    data = {'_type': 'committee', 'state': 'ex', 'chamber': 'joint',
+            'committee': 'Reptilian Task Force',
+            'members': [{'name': 'Richard Feynman', 'role': 'Chair'}]}
+    committees.import_committee(dict(data), 'S1', 'T1', Writer())
+    assert saved == ['EXC000001']
+
+    # re-importing with a new member writes the committee once
+    data['members'] = [{'name': 'Richard Feynman', 'role': 'Chair'},
+                       {'name': 'A. Einstein', 'role': 'Member'}]
+    assert committees.import_committee(dict(data), 'S1', 'T1',
+                                       Writer()) == 'update'
+    assert saved == ['EXC000001', 'EXC000001']
+    com = db.committees.find_one()
+    assert com['members'][0]['leg_id'] == 'EXL000001'
+    assert len(com['members']) == 2
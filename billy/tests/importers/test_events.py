@@ -1,5 +1,9 @@
+import os
+import json
+import shutil
+import tempfile
 import datetime as dt
-from nose.tools import with_setup
+from nose.tools import with_setup, assert_equal
 
 from billy.core import db
 from billy.importers import events
@@ -56,3 +60,26 @@ def test_import_event_no_guid():
     event['description'] = 'break this thing'
     events.import_event(event)
     assert db.events.count() == 2
+
+
+@with_setup(setup_func)
+def test_import_events_same_event():
+    data_dir = tempfile.mkdtemp()
+    try:
+        events_dir = os.path.join(data_dir, 'ex', 'events')
+        os.makedirs(events_dir)
+        # three files describing the same event, changed each time
+        for n, description in enumerate(['TBD', 'Determined.', 'Moved.']):
+            event = {'_type': 'event', 'state': 'ex', 'session': 'S1',
+                     'when': 1357000000,
+                     'end': None, 'type': 'committee:meeting',
+                     'description': description, '_guid': 'xx-yy-zz',
+                     'participants': [], 'related_bills': []}
+            with open(os.path.join(events_dir, '%s.json' % n), 'w') as f:
+                json.dump(event, f)
+
+        events.import_events('ex', data_dir)
+        assert_equal(db.events.count(), 1)
+        assert_equal(db.events.find_one()['description'], 'Moved.')
+    finally:
+        shutil.rmtree(data_dir)
@@ -206,3 +206,24 @@ def test_import_legislator():
     for l in [leg1, leg2, leg3, leg4, leg5, leg6]:
         legislators.import_legislator(l)
         assert db.legislators.count() == 4
+
+
+@with_setup(setup_func)
+def test_import_legislator_terms_in_one_run():
+    def leg(term):
+        return {'_type': 'person', 'state': 'ex', 'full_name': 'Bob Dold',
+                'roles': [{'role': 'member', 'chamber': 'upper',
+                           'state': 'ex', 'term': term, 'district': '2',
+                           'party': 'Democrat',
+                           'start_date': None, 'end_date': None}]}
+
+    legislators.import_legislator(leg('T2'))
+    # both earlier terms are merged, the second one with the first's update
+    with utils.BulkWriter(db.legislators) as writer:
+        assert legislators.import_legislator(leg('T0'), writer) == 'update'
+        assert legislators.import_legislator(leg('T1'), writer) == 'update'
+
+    assert db.legislators.count() == 1
+    dold = db.legislators.find_one()
+    assert sorted(dold['old_roles']) == ['T0', 'T1']
+    assert dold['roles'][0]['term'] == 'T2'
@@ -1,11 +1,31 @@
+import os
+import shutil
+import datetime
+import tempfile
+
 from nose.tools import with_setup
 
 from billy.core import db
+from billy.core import settings
 from billy.importers import names
 
 from .. import fixtures
 
 
+IRON_CLOUD = {'_id': 'EXL000042',
+              'state': 'ex',
+              'full_name': 'Ed Iron Cloud III',
+              '_scraped_name': 'Ed Iron Cloud III',
+              'first_name': 'Ed',
+              'last_name': 'Iron Cloud',
+              'suffixes': 'III',
+              'roles': [{'type': 'member',
+                         'state': 'ex',
+                         'term': 'T1',
+                         'chamber': 'upper',
+                         'district': '10'}]}
+
+
 def setup_func():
     fixtures.load_metadata()
     db.legislators.drop()
@@ -35,3 +55,62 @@ def test_get_legislator_id():
     assert names.get_legislator_id('ex', 'S1',
                                    'upper', 'E. Iron Cloud') == 'EXL000042'
     assert not names.get_legislator_id('ex', 'S1', 'lower', 'Ed Iron Cloud')
+
+
+@with_setup(setup_func)
+def test_get_legislator_ids():
+    db.legislators.insert(IRON_CLOUD)
+
+    assert names.get_legislator_ids(
+        'ex', 'S1', 'upper', ['Iron Cloud', 'Nobody', 'Ed Iron Cloud',
+                              'Iron Cloud']) == ['EXL000042', None,
+                                                 'EXL000042', 'EXL000042']
+    assert names.get_legislator_ids('ex', 'S1', 'upper', []) == []
+
+
+@with_setup(setup_func)
+def test_name_matcher_snapshot():
+    db.legislators.insert(IRON_CLOUD)
+    cache_dir = settings.BILLY_CACHE_DIR
+    settings.BILLY_CACHE_DIR = tempfile.mkdtemp()
+    snapshot_dir = os.path.join(settings.BILLY_CACHE_DIR, 'name_matchers')
+    settings.BILLY_NAME_MATCHER_DIR = 'name_matchers'
+    try:
+        matcher = names.NameMatcher('ex', 'T1')
+        assert os.listdir(snapshot_dir) == ['ex_T1.pickle']
+
+        # legislators are unchanged, names come from the snapshot
+        learn = names.NameMatcher._learn_legislators
+        names.NameMatcher._learn_legislators = None
+        try:
+            matcher = names.NameMatcher('ex', 'T1')
+        finally:
+            names.NameMatcher._learn_legislators = learn
+        assert matcher.match('Iron Cloud', 'upper') == 'EXL000042'
+
+        # still the case after imports that only set updated_at and such
+        # (eg. activate_legislators)
+        db.legislators.update({'_id': 'EXL000042'},
+                              {'$set': {'updated_at': datetime.datetime.now(),
+                                        'active': True}})
+        names.NameMatcher._learn_legislators = None
+        try:
+            matcher = names.NameMatcher('ex', 'T1')
+        finally:
+            names.NameMatcher._learn_legislators = learn
+
+        # a new legislator invalidates the snapshot
+        db.legislators.insert({'_id': 'EXL000043', 'state': 'ex',
+                               'full_name': 'Jane Doe',
+                               '_scraped_name': 'Jane Doe',
+                               'first_name': 'Jane', 'last_name': 'Doe',
+                               'roles': [{'type': 'member', 'state': 'ex',
+                                          'term': 'T1', 'chamber': 'upper',
+                                          'district': '11'}]})
+        matcher = names.NameMatcher('ex', 'T1')
+        assert matcher.match('Doe', 'upper') == 'EXL000043'
+        assert matcher.match('Iron Cloud', 'upper') == 'EXL000042'
+    finally:
+        settings.BILLY_NAME_MATCHER_DIR = None
+        shutil.rmtree(settings.BILLY_CACHE_DIR)
+        settings.BILLY_CACHE_DIR = cache_dir
@@ -0,0 +1,47 @@
+from nose.tools import assert_equal
+
+from billy.importers import timing
+from billy.bin.commands.bench_import import compare_to_baseline
+
+
+def test_stage_timing():
+    # not timing, stages are ignored
+    with timing.stage('parse'):
+        pass
+    assert_equal(timing.pop_stage_timings(), {})
+
+    timing.enable_stage_timing()
+    for _ in range(3):
+        with timing.stage('parse'):
+            with timing.stage('votes'):
+                pass
+    timings = timing.pop_stage_timings()
+    assert_equal(sorted(timings), ['parse', 'votes'])
+    assert_equal(timings['parse'][0], 3)
+    assert timings['parse'][1] >= timings['votes'][1]
+
+    # popping stops timing
+    with timing.stage('parse'):
+        pass
+    assert_equal(timing.pop_stage_timings(), {})
+
+    # popping while a stage runs doesn't break it
+    timing.enable_stage_timing()
+    with timing.stage('parse'):
+        assert_equal(timing.pop_stage_timings(), {})
+    assert_equal(timing.pop_stage_timings(), {})
+
+
+def test_compare_to_baseline():
+    baseline = {'stages': {'parse': {'calls': 5, 'seconds': 1.0},
+                           'votes': {'calls': 5, 'seconds': 2.0}},
+                'counts': {'import_bills': {'insert': 5}}}
+    results = {'stages': {'parse': {'calls': 5, 'seconds': 1.005},
+                          'votes': {'calls': 5, 'seconds': 3.0},
+                          'new': {'calls': 1, 'seconds': 9.0}},
+               'counts': {'import_bills': {'insert': 5}}}
+    assert_equal(compare_to_baseline(results, baseline, 0.05),
+                 ['votes: 2.000s -> 3.000s (+50%)'])
+
+    results['counts']['import_bills']['insert'] = 4
+    assert_equal(len(compare_to_baseline(results, baseline, 0.6)), 1)
@@ -13,6 +13,10 @@ def drop_everything():
     db.legislators.drop()
     db.bills.drop()
     db.committees.drop()
+    db.legislator_ids.drop()
+    db.bill_ids.drop()
+    db.committee_ids.drop()
+    utils._id_blocks.clear()
 
 
 def test_insert_with_id_duplicate_id():
@@ -116,6 +120,38 @@ def test_update_sneaky_filter():
     assert obj['updated_at'] > obj['created_at']
 
 
+@with_setup(drop_everything)
+def test_normalized_fields():
+    leg = {'_type': 'person', 'state': 'ex', 'full_name': 'Jo  ANN Smith',
+           'first_name': 'Jo Ann', 'last_name': 'Smith',
+           '_locked_fields': ['last_name'],
+           'roles': [{'term': 'T1', 'district': 12, 'party': 'Democratic'}]}
+    id = utils.insert_with_id(leg)
+    leg = db.legislators.find_one(id)
+    assert leg['_normalized'] == {'full_name': 'jo  ann smith',
+                                  'first_name': 'jo ann',
+                                  'last_name': 'smith'}
+    assert leg['roles'][0]['_normalized'] == {'term': 't1', 'district': '12',
+                                              'party': 'democratic'}
+
+    # unchanged scraped data doesn't cause a save
+    scraped = {'_type': 'person', 'full_name': 'Jo  ANN Smith',
+               'roles': [{'term': 'T1', 'district': 12,
+                          'party': 'Democratic'}]}
+    assert not utils.update(leg, scraped, db.legislators)
+
+    # normalized copies follow changes, but not to locked fields
+    scraped = {'_type': 'person', 'full_name': 'Jo Ann  Smith-Jones',
+               'last_name': 'Smith-Jones',
+               'roles': [{'term': 'T1', 'district': 12,
+                          'party': 'Republican'}]}
+    assert utils.update(leg, scraped, db.legislators)
+    leg = db.legislators.find_one(id)
+    assert leg['_normalized']['full_name'] == 'jo ann  smith-jones'
+    assert leg['_normalized']['last_name'] == 'smith'
+    assert leg['roles'][0]['_normalized']['party'] == 'republican'
+
+
 def test_convert_timestamps():
     dt = datetime.datetime.now().replace(microsecond=0)
     ts = time.mktime(dt.utctimetuple())
@@ -175,6 +211,46 @@ def test_make_plus_fields():
     assert plussed == expect
 
 
+@with_setup(drop_everything)
+def test_next_object_id():
+    # counters start after the largest id already in use
+    db.bills.insert({'_id': 'EXB00000007', 'state': 'ex'})
+    assert utils.next_object_id('ex', 'bills') == 'EXB00000008'
+    assert utils.next_object_id('ex', 'bills') == 'EXB00000009'
+    assert utils.next_object_id('ex', 'committees') == 'EXC000001'
+
+    # a single counter update reserves a whole block of ids
+    assert (db.bill_ids.find_one('ex')['seq'] ==
+            7 + utils.settings.BILLY_ID_BLOCK_SIZE)
+
+
+@with_setup(drop_everything)
+def test_insert_with_id_reseeds():
+    utils.insert_with_id({'_type': 'bill', 'state': 'ex'})
+    # an id inserted behind the counter's back
+    db.bills.insert({'_id': 'EXB00000050', 'state': 'ex'})
+    utils._id_blocks.clear()
+    db.bill_ids.update({'_id': 'ex'}, {'$set': {'seq': 49}})
+
+    # the next reserved block starts at the taken id, a new block is used
+    new_id = utils.insert_with_id({'_type': 'bill', 'state': 'ex'})
+    assert new_id > 'EXB00000050'
+    assert db.bills.find_one(new_id)
+
+
+@with_setup(drop_everything)
+def test_seed_id_counter():
+    db.legislators.insert({'_id': 'EXL000012', 'state': 'ex'})
+    db.legislators.insert({'_id': 'EXL000003', 'state': 'ex'})
+    assert utils.seed_id_counter('ex', 'legislators') == 12
+    assert db.legislator_ids.find_one('ex')['seq'] == 12
+
+    # never moves a counter backwards
+    db.legislator_ids.update({'_id': 'ex'}, {'$set': {'seq': 40}})
+    utils.seed_id_counter('ex', 'legislators')
+    assert db.legislator_ids.find_one('ex')['seq'] == 40
+
+
 def test_next_big_id():
     db.test_ids.drop()
     db.vote_ids.drop()
@@ -185,3 +261,29 @@ def test_next_big_id():
     db.test_ids.drop()
     assert utils.next_big_id('xy', 'D', 'test_ids') == 'XYD00000001'
     assert utils.next_big_id('xy', 'V', 'vote_ids') == 'XYV00000002'
+
+
+@with_setup(drop_everything)
+def test_bulk_writer():
+    db.bills.insert({'_id': 'EXB00000001', 'title': 'old'})
+    db.bills.insert({'_id': 'EXB00000002', 'title': 'remove me'})
+
+    writer = utils.BulkWriter(db.bills, batch_size=3)
+    writer.save({'_id': 'EXB00000001', 'title': 'new'})
+    writer.remove({'_id': 'EXB00000002'})
+    # nothing is written until the batch fills up or is flushed
+    assert db.bills.find_one('EXB00000001')['title'] == 'old'
+    assert writer.is_pending('EXB00000001')
+    assert not writer.is_pending('EXB00000003')
+
+    # third write fills the batch
+    writer.update({'_id': 'EXB00000003'}, {'$set': {'title': 'upd'}})
+    assert not writer.is_pending('EXB00000001')
+    assert db.bills.find_one('EXB00000001')['title'] == 'new'
+    assert db.bills.find_one('EXB00000002') is None
+    # update doesn't upsert
+    assert db.bills.find_one('EXB00000003') is None
+
+    with writer:
+        writer.save({'_id': 'EXB00000003', 'title': 'inserted'})
+    assert db.bills.find_one('EXB00000003')['title'] == 'inserted'
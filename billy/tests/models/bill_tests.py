@@ -0,0 +1,51 @@
+import datetime
+
+from nose.tools import with_setup, eq_
+
+from billy.core import settings
+from billy.models import db
+from billy.models.bills import Bill
+from billy.utils.search import set_search_fields
+
+
+def setup_func():
+    assert db.name.endswith('_test')
+    db.bills.drop()
+    titles = ['Farm taxes', 'Property taxes', 'Sales taxes on farms',
+              'Income taxes']
+    for n, title in enumerate(titles):
+        bill = {'_id': 'EXB0000000%s' % n, 'state': 'ex',
+                'bill_id': 'HB %s' % n, 'title': title,
+                'action_dates': {'last': datetime.datetime(2013, 1, n + 1)}}
+        set_search_fields(bill)
+        db.bills.insert(bill)
+
+
+@with_setup(setup_func)
+def test_search_rarest_term_first():
+    # every bill has 'tax', only two have 'farm'
+    results = Bill.search('taxes on farms', abbr='ex')
+    eq_(results.mongo_query['_search_terms'], {'$all': ['farm', 'tax']})
+    eq_(results.search_terms, ['tax', 'farm'])
+    eq_(len(results), 2)
+
+
+@with_setup(setup_func)
+def test_search_max_ranked():
+    max_ranked = settings.BILLY_SEARCH_MAX_RANKED
+    settings.BILLY_SEARCH_MAX_RANKED = 2
+    try:
+        # only the two most recent matches are ranked
+        results = Bill.search('taxes', abbr='ex', sort='relevance')
+        eq_(len(results), 2)
+        eq_([bill['title'] for bill in results[0:2]],
+            ['Income taxes', 'Sales taxes on farms'])
+    finally:
+        settings.BILLY_SEARCH_MAX_RANKED = max_ranked
+
+
+@with_setup(setup_func)
+def test_search_iter_relevance():
+    results = Bill.search('taxes', abbr='ex', sort='relevance')
+    eq_([bill['_id'] for bill in results._iter_ranked(batch_size=3)],
+        [bill['_id'] for bill in results[0:4]])
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import with_setup, assert_equal, assert_raises
+
+from billy.scrape import output
+
+data_dir = None
+
+
+def setup_func():
+    global data_dir
+    data_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(data_dir, 'bills'))
+
+
+def teardown_func():
+    shutil.rmtree(data_dir)
+
+
+def _scraped(type_dir):
+    return [(obj.name, obj.read()) for obj in output.iter_scraped(type_dir)]
+
+
+@with_setup(setup_func, teardown_func)
+def test_json_output():
+    out = output.ScrapeOutput(data_dir)
+    scraped = out.save('bills', 'HB1.json', b'{"a": 1}')
+    out.save('bills', 'HB2.json', b'{"a": 2}')
+    out.close()
+
+    assert_equal(scraped.load(), {'a': 1})
+    assert_equal(sorted(os.listdir(os.path.join(data_dir, 'bills'))),
+                 ['HB1.json', 'HB2.json'])
+    assert_equal(_scraped(os.path.join(data_dir, 'bills')),
+                 [('HB1.json', b'{"a": 1}'), ('HB2.json', b'{"a": 2}')])
+
+
+@with_setup(setup_func, teardown_func)
+def test_segment_output():
+    for format in ('jsonl', 'jsonl.gz'):
+        bills_dir = os.path.join(data_dir, 'bills')
+        out = output.ScrapeOutput(data_dir, format, segment_size=2)
+        for n in range(5):
+            out.save('bills', 'HB%s.json' % n, ('{"n": %s}' % n).encode())
+        # saving a name again replaces it, like overwriting a file
+        out.save('bills', 'HB1.json', b'{"n": "one"}')
+        out.close()
+
+        assert_equal(len(output.list_sources(bills_dir)), 3)
+        assert_equal(sorted(_scraped(bills_dir)),
+                     [('HB0.json', b'{"n": 0}'), ('HB1.json', b'{"n": "one"}'),
+                      ('HB2.json', b'{"n": 2}'), ('HB3.json', b'{"n": 3}'),
+                      ('HB4.json', b'{"n": 4}')])
+
+        output.clear_scraped(bills_dir)
+        assert_equal(os.listdir(bills_dir), [])
+
+
+@with_setup(setup_func, teardown_func)
+def test_segment_reference():
+    for format in ('jsonl', 'jsonl.gz'):
+        bills_dir = os.path.join(data_dir, 'bills')
+        out = output.ScrapeOutput(data_dir, format, segment_size=2)
+        for n in range(3):
+            out.save('bills', 'HB%s.json' % n, ('{"n": %s}' % n).encode())
+        out.close()
+
+        # references keep the segment and offset, not the JSON
+        refs = [obj.reference() for obj in output.iter_scraped(bills_dir)]
+        assert_equal([ref.raw for ref in refs], [None, None, None])
+        assert_equal([(ref.name, ref.load()) for ref in refs],
+                     [('HB0.json', {'n': 0}), ('HB1.json', {'n': 1}),
+                      ('HB2.json', {'n': 2})])
+        # in any order
+        assert_equal([ref.load() for ref in reversed(refs)],
+                     [{'n': 2}, {'n': 1}, {'n': 0}])
+        output.clear_scraped(bills_dir)
+
+
+@with_setup(setup_func, teardown_func)
+def test_segment_partial_index_line():
+    bills_dir = os.path.join(data_dir, 'bills')
+    out = output.ScrapeOutput(data_dir, 'jsonl')
+    out.save('bills', 'HB0.json', b'{"n": 0}')
+    out.close()
+    # a scrape that crashed while writing the index
+    with open(os.path.join(bills_dir, output.INDEX_FILENAME), 'ab') as f:
+        f.write(b'["segment-00002.jsonl", 0, "HB')
+
+    out = output.ScrapeOutput(data_dir, 'jsonl')
+    out.save('bills', 'HB1.json', b'{"n": 1}')
+    out.close()
+    assert_equal(_scraped(bills_dir), [('HB0.json', b'{"n": 0}'),
+                                       ('HB1.json', b'{"n": 1}')])
+
+
+def test_unknown_format():
+    assert_raises(ValueError, output.ScrapeOutput, '/tmp', 'xml')
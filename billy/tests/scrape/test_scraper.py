@@ -0,0 +1,286 @@
+import os
+import time
+import shutil
+import tempfile
+
+import requests
+from nose.tools import with_setup, assert_raises, assert_equal
+
+from billy.scrape import Scraper
+from billy.scrape.bills import Bill
+from billy.scrape.cache import ScrapeCache
+from billy.scrape.stats import percentile
+from billy.scrape.validator import DatetimeValidator, compile_schema
+
+metadata = {'abbreviation': 'ex',
+            'terms': [{'name': 'T1', 'sessions': ['S1']}]}
+output_dir = None
+
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+    """ answers every request with its own URL, 404 for /missing """
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 404 if request.url.endswith('/missing') else 200
+        response._content = request.url.encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def setup_func():
+    global output_dir
+    output_dir = tempfile.mkdtemp()
+
+
+def teardown_func():
+    shutil.rmtree(output_dir)
+
+
+def make_scraper(rpm):
+    scraper = Scraper(metadata, output_dir=output_dir)
+    scraper.cache_storage = None
+    scraper.retry_attempts = 0
+    scraper.requests_per_minute = rpm
+    scraper.mount('http://', FakeAdapter())
+    return scraper
+
+
+@with_setup(setup_func, teardown_func)
+def test_fetch_many():
+    scraper = make_scraper(0)
+    urls = ['http://example.com/%s' % n for n in range(10)]
+    fetched = dict(scraper.fetch_many(urls))
+    assert_equal(sorted(fetched), sorted(urls))
+    for url, response in fetched.items():
+        assert_equal(response.text, url)
+
+    with assert_raises(Exception):
+        list(scraper.fetch_many(['http://example.com/missing']))
+
+
+def throttled_scraper(rpm):
+    """ a scraper whose throttle records its waits instead of sleeping """
+    scraper = make_scraper(rpm)
+    scraper.waits = []
+    # the clock stands still, so every wait is from the same moment
+    scraper._clock = lambda: 1000.0
+    scraper._sleep = lambda seconds: scraper.waits.append(
+        (scraper._request_host.host, round(seconds, 3)))
+    return scraper
+
+
+@with_setup(setup_func, teardown_func)
+def test_throttle_per_host():
+    # 600 rpm: one request every 0.1s per host
+    scraper = throttled_scraper(600)
+    scraper.host_requests_per_minute['slow.example.com'] = 120
+
+    list(scraper.fetch_many(['http://a.example.com/%s' % n for n in range(3)]
+                            + ['http://b.example.com/%s' % n
+                               for n in range(3)], workers=6))
+    # hosts are throttled separately
+    assert_equal(sorted(scraper.waits),
+                 [('a.example.com', 0.1), ('a.example.com', 0.2),
+                  ('b.example.com', 0.1), ('b.example.com', 0.2)])
+
+    del scraper.waits[:]
+    list(scraper.fetch_many(['http://slow.example.com/%s' % n
+                             for n in range(3)], workers=3))
+    # concurrent requests to one host still respect its limit
+    assert_equal(sorted(scraper.waits),
+                 [('slow.example.com', 0.5), ('slow.example.com', 1.0)])
+
+
+@with_setup(setup_func, teardown_func)
+def test_throttle_host_without_rpm():
+    # only the limited host is throttled when SCRAPELIB_RPM is 0
+    scraper = throttled_scraper(0)
+    scraper.host_requests_per_minute['slow.example.com'] = 120
+    for url in ('http://slow.example.com/1', 'http://slow.example.com/2',
+                'http://a.example.com/1', 'http://a.example.com/2'):
+        scraper.get(url)
+    assert_equal(scraper.waits, [('slow.example.com', 0.5)])
+
+
+@with_setup(setup_func, teardown_func)
+def test_fetch_many_cache_stats():
+    scraper = make_scraper(0)
+    urls = ['http://example.com/%s' % n for n in range(200)]
+    scraper.cache_storage = ScrapeCache(os.path.join(output_dir, 'cache'))
+    list(scraper.fetch_many(urls, workers=8))
+    assert_equal(scraper.cache_stats['misses'], 200)
+
+
+def test_compile_schema():
+    schema = {'properties': {'session': {'enum': ['S1', 'S2']},
+                             'tags': {'items': {'type': 'string'},
+                                      'required': False}}}
+    compiled = compile_schema(schema)
+    assert_equal(compiled['required'], True)
+    assert_equal(compiled['properties']['session']['enum'], ['S1', 'S2'])
+    assert_equal(compiled['properties']['session']['_enum_set'],
+                 frozenset(['S1', 'S2']))
+    assert_equal(compiled['properties']['tags']['required'], False)
+    assert_equal(compiled['properties']['tags']['items'],
+                 {'type': 'string', 'required': True, 'blank': False})
+    # the original is untouched
+    assert_equal(schema['properties']['session']['enum'], ['S1', 'S2'])
+
+    validator = DatetimeValidator()
+    validator.validate({'session': 'S1', 'tags': ['a']}, compiled)
+    with assert_raises(ValueError) as cm:
+        validator.validate({'session': 'S3'}, compiled)
+    # the message lists the options as the schema does
+    assert "['S1', 'S2']" in str(cm.exception)
+    assert_raises(ValueError, validator.validate, {'session': 'S1',
+                                                   'tags': ['']}, compiled)
+
+
+@with_setup(setup_func, teardown_func)
+def test_background_validation():
+    scraper = make_scraper(0)
+    scraper.background_validation = True
+    os.makedirs(os.path.join(output_dir, 'bills'))
+    scraper.jurisdiction = 'ex'
+
+    bill = Bill('S1', 'upper', 'HB 1', 'a bill')
+    bill.add_source('http://example.com')
+    scraper.save_object(bill)
+    bad = Bill('S9', 'upper', 'HB 2', 'a bill from a bad session')
+    bad.add_source('http://example.com')
+    scraper.save_object(bad)
+
+    errors = scraper.finish_validation()
+    assert_equal(len(errors), 1)
+    assert_equal(errors[0][:2], ('bill', 'S9_upper_HB 2.json'))
+
+
+class ConditionalAdapter(FakeAdapter):
+    """ answers with an ETag, 304 if the client already has it """
+
+    def send(self, request, **kwargs):
+        response = super(ConditionalAdapter, self).send(request, **kwargs)
+        response.headers['ETag'] = '"v1"'
+        if request.headers.get('If-None-Match') == '"v1"':
+            response.status_code = 304
+            response._content = b''
+        return response
+
+
+@with_setup(setup_func, teardown_func)
+def test_conditional_requests():
+    scraper = make_scraper(0)
+    scraper.cache_storage = ScrapeCache(os.path.join(output_dir, 'cache'))
+    scraper.mount('http://', ConditionalAdapter())
+
+    url = 'http://example.com/page'
+    assert_equal(scraper.get(url).text, url)
+    response = scraper.get(url)
+    assert_equal(response.text, url)
+    assert response.fromcache
+    assert_equal(scraper.report_cache(),
+                 {'hits': 0, 'misses': 1, 'not_modified': 1})
+
+
+@with_setup(setup_func, teardown_func)
+def test_cache_hits_touch():
+    scraper = make_scraper(0)
+    scraper.cache_storage = ScrapeCache(os.path.join(output_dir, 'cache'))
+    scraper.cache_write_only = False
+
+    url = 'http://example.com/page'
+    scraper.get(url)
+    old = time.time() - 1000
+    os.utime(scraper.cache_storage._path(url), (old, old))
+    assert scraper.get(url).fromcache
+    # read from the cache, so not evicted as unused
+    assert_equal(scraper.cache_storage.evict(max_age=500), 0)
+    assert_equal(scraper.report_cache(),
+                 {'hits': 1, 'misses': 1, 'not_modified': 0})
+
+
+@with_setup(setup_func, teardown_func)
+def test_cache_eviction():
+    cache = ScrapeCache(os.path.join(output_dir, 'cache'))
+    adapter = FakeAdapter()
+    for n in range(4):
+        url = 'http://example.com/%s' % n
+        request = requests.Request('GET', url).prepare()
+        cache.set(url, adapter.send(request))
+        old = time.time() - (4 - n) * 100
+        os.utime(cache._path(url), (old, old))
+
+    assert_equal(cache.get('http://example.com/3').text,
+                 'http://example.com/3')
+    assert_equal(cache.validators('http://example.com/3'), {})
+
+    # too old
+    assert_equal(cache.evict(max_age=350), 1)
+    assert cache.get('http://example.com/0') is None
+    # least recently used go first
+    size = os.path.getsize(cache._path('http://example.com/3'))
+    assert_equal(cache.evict(max_size=size * 2), 1)
+    assert cache.get('http://example.com/1') is None
+    assert cache.get('http://example.com/2') is not None
+
+
+class FlakyAdapter(FakeAdapter):
+    """ fails the first request for each URL with a 500 """
+
+    def __init__(self):
+        super(FlakyAdapter, self).__init__()
+        self.seen = set()
+
+    def send(self, request, **kwargs):
+        response = super(FlakyAdapter, self).send(request, **kwargs)
+        if request.url not in self.seen:
+            self.seen.add(request.url)
+            response.status_code = 500
+        return response
+
+
+def test_percentile():
+    values = list(range(1, 11))
+    assert_equal(percentile(values, 50), 5)
+    assert_equal(percentile(values, 90), 9)
+    assert_equal(percentile(values, 99), 10)
+    assert_equal(percentile(values, 0), 1)
+    assert_equal(percentile(list(range(1, 101)), 7), 7)
+    assert_equal(percentile([3], 50), 3)
+    assert_equal(percentile([], 50), None)
+
+
+@with_setup(setup_func, teardown_func)
+def test_stats():
+    scraper = make_scraper(0)
+    scraper.retry_attempts = 1
+    scraper.retry_wait_seconds = 0
+    scraper.mount('http://', FlakyAdapter())
+    os.makedirs(os.path.join(output_dir, 'bills'))
+    scraper.jurisdiction = 'ex'
+
+    scraper.get('http://a.example.com/1')
+    scraper.get('http://a.example.com/1')
+    scraper.get('http://b.example.com/22')
+    bill = Bill('S1', 'upper', 'HB 1', 'a bill')
+    bill.add_source('http://example.com')
+    scraper.save_object(bill)
+
+    stats = scraper.report_stats()
+    # the first request for each URL was retried
+    assert_equal(stats['requests'], 5)
+    assert_equal(stats['retries'], 2)
+    assert_equal(stats['objects'], 1)
+    assert_equal([h['host'] for h in stats['hosts']],
+                 ['a.example.com', 'b.example.com'])
+    assert_equal(stats['hosts'][0]['bytes'],
+                 3 * len('http://a.example.com/1'))
+    assert stats['hosts'][0]['latency']['p99'] is not None
+    for name in ('save_object', 'validate_json', 'write_json'):
+        assert_equal(stats['timings'][name]['count'], 1)
+    assert 'cache' in stats
@@ -0,0 +1,108 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from nose.tools import with_setup, assert_equal
+
+from billy.core import settings
+from billy.scrape import utils
+
+tmp_dir = None
+converted = []
+
+
+def fake_converter(filename, type):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    converted.append(data)
+    # 'fail' can't be converted
+    return data.upper() + b' ' + type.encode(), data != b'fail'
+
+
+def setup_func():
+    global tmp_dir, run_converter, pdf_cache_dir
+    tmp_dir = tempfile.mkdtemp()
+    pdf_cache_dir = settings.BILLY_PDF_CACHE_DIR
+    settings.BILLY_PDF_CACHE_DIR = os.path.join(tmp_dir, 'pdf')
+    run_converter = utils._run_converter
+    utils._run_converter = fake_converter
+    del converted[:]
+
+
+def teardown_func():
+    utils._run_converter = run_converter
+    settings.BILLY_PDF_CACHE_DIR = pdf_cache_dir
+    shutil.rmtree(tmp_dir)
+
+
+def _write_pdf(name, data):
+    path = os.path.join(tmp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+@with_setup(setup_func, teardown_func)
+def test_convert_pdf_cached():
+    path = _write_pdf('a.pdf', b'roll call')
+    assert_equal(utils.convert_pdf(path, 'text'), b'ROLL CALL text')
+    assert_equal(utils.convert_pdf(path, 'text'), b'ROLL CALL text')
+    assert_equal(utils.convert_pdf_data(b'roll call', 'text'),
+                 b'ROLL CALL text')
+    assert_equal(len(converted), 1)
+
+    # other types are converted separately
+    assert_equal(utils.convert_pdf(path, 'xml'), b'ROLL CALL xml')
+    assert_equal(len(converted), 2)
+
+
+@with_setup(setup_func, teardown_func)
+def test_convert_many():
+    paths = [_write_pdf('a.pdf', b'a'), _write_pdf('b.pdf', b'b'),
+             _write_pdf('a-again.pdf', b'a'), _write_pdf('c.pdf', b'c')]
+    utils.convert_pdf(paths[3], 'text')
+
+    assert_equal(utils.convert_many(paths, 'text', workers=2),
+                 [b'A text', b'B text', b'A text', b'C text'])
+    # duplicates and cached PDFs aren't converted again
+    assert_equal(sorted(converted), [b'a', b'b', b'c'])
+
+
+@with_setup(setup_func, teardown_func)
+def test_failed_conversion_not_cached():
+    path = _write_pdf('a.pdf', b'fail')
+    assert_equal(utils.convert_pdf(path, 'text'), b'FAIL text')
+    assert_equal(utils.convert_pdf(path, 'text'), b'FAIL text')
+    assert_equal(len(converted), 2)
+
+
+@with_setup(setup_func, teardown_func)
+def test_pdf_cache_dir():
+    # relative to BILLY_CACHE_DIR when it's used
+    cache_dir = settings.BILLY_CACHE_DIR
+    settings.BILLY_PDF_CACHE_DIR = 'pdf'
+    settings.BILLY_CACHE_DIR = tmp_dir
+    try:
+        utils.convert_pdf(_write_pdf('a.pdf', b'a'), 'text')
+    finally:
+        settings.BILLY_CACHE_DIR = cache_dir
+    assert_equal(os.listdir(os.path.join(tmp_dir, 'pdf')),
+                 ['86'])
+
+
+@with_setup(setup_func, teardown_func)
+def test_evict_converted():
+    paths = [_write_pdf('a.pdf', b'a'), _write_pdf('b.pdf', b'b')]
+    utils.convert_many(paths, 'text')
+    old = time.time() - 500
+    converted_path = utils._converted_path(
+        hashlib.sha1(b'a').hexdigest(), 'text')
+    os.utime(converted_path, (old, old))
+
+    assert_equal(utils.evict_converted(max_age=300), 1)
+    assert not os.path.exists(converted_path)
+    # b is still cached
+    utils.convert_pdf(paths[1], 'text')
+    assert_equal(len(converted), 2)
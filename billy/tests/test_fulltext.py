@@ -0,0 +1,90 @@
+import sys
+import types
+import shutil
+import tempfile
+
+import requests
+from nose.tools import with_setup, assert_equal
+
+from billy.core import settings
+from billy.utils import fulltext
+
+tmp_dir = None
+
+
+class FakeSession(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+        self.timeouts = set()
+
+    def get(self, url, timeout=None):
+        self.requested.append(url)
+        self.timeouts.add(timeout)
+        response = requests.Response()
+        response.url = url
+        if url in self.pages:
+            response.status_code = 200
+            response._content = self.pages[url]
+        else:
+            response.status_code = 404
+            response._content = b''
+        return response
+
+
+def extract_text(doc, data):
+    return data.decode('utf8').upper()
+
+
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+    module = types.ModuleType('zz')
+    module.extract_text = extract_text
+    sys.modules['zz'] = module
+
+
+def teardown_func():
+    del sys.modules['zz']
+    shutil.rmtree(tmp_dir)
+
+
+@with_setup(setup_func, teardown_func)
+def test_local_blob_store():
+    store = fulltext.LocalBlobStore(tmp_dir)
+    assert not store.exists('text/zz/ZZD00001.txt')
+    assert store.get('text/zz/ZZD00001.txt') is None
+    store.put('text/zz/ZZD00001.txt', b'some text')
+    assert store.exists('text/zz/ZZD00001.txt')
+    assert_equal(store.get('text/zz/ZZD00001.txt'), b'some text')
+
+
+@with_setup(setup_func, teardown_func)
+def test_pipeline():
+    store = fulltext.LocalBlobStore(tmp_dir)
+    session = FakeSession({'http://example.com/1': b'first, bill',
+                           'http://example.com/2%20a': b'second'})
+    docs = [{'doc_id': 'ZZD00001', 'url': 'http://example.com/1'},
+            {'doc_id': 'ZZD00002', 'url': 'http://example.com/2 a'},
+            {'doc_id': 'ZZD00003', 'url': 'http://example.com/3'}]
+
+    pipeline = fulltext.FulltextPipeline('zz', store, workers=2,
+                                         session=session)
+    counts = pipeline.run(docs)
+    assert_equal(counts['fetched'], 2)
+    assert_equal(counts['extracted'], 2)
+    assert_equal(counts['failed'], 1)
+    assert_equal(store.get('text/zz/ZZD00001.txt'), b'FIRST BILL')
+    assert_equal(session.timeouts, set([settings.SCRAPELIB_TIMEOUT]))
+    assert_equal(store.get('documents/zz/ZZD00002'), b'second')
+    assert 'http://example.com/2%20a' in session.requested
+
+    # text that's already stored is skipped, stored documents aren't fetched
+    # again
+    session.requested = []
+    pipeline = fulltext.FulltextPipeline('zz', store, workers=2,
+                                         session=session)
+    counts = pipeline.run(docs)
+    assert_equal(counts['skipped'], 2)
+    assert_equal(counts['failed'], 1)
+    assert_equal(session.requested, ['http://example.com/3'])
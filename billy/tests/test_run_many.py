@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from nose.tools import with_setup, assert_equal
+
+from billy.bin import run_many, update
+
+tmp_dir = None
+real_main = update.main
+real_output = None
+# shared with the forked billy-update processes
+active = multiprocessing.Value('i', 0)
+most_active = multiprocessing.Value('i', 0)
+
+
+def setup_func():
+    global tmp_dir, real_output
+    tmp_dir = tempfile.mkdtemp()
+    active.value = most_active.value = 0
+    # _update_one redirects the real stdout/stderr, not nose's capture
+    real_output = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+
+
+def teardown_func():
+    sys.stdout, sys.stderr = real_output
+    update.main = real_main
+    update._import_slots = None
+    shutil.rmtree(tmp_dir)
+
+
+@with_setup(setup_func, teardown_func)
+def test_find_jurisdictions():
+    for name in ('nc', 'ex', '_private', '.hidden'):
+        os.makedirs(os.path.join(tmp_dir, name))
+        open(os.path.join(tmp_dir, name, '__init__.py'), 'w').close()
+    # not a package
+    os.makedirs(os.path.join(tmp_dir, 'data'))
+    open(os.path.join(tmp_dir, 'setup.py'), 'w').close()
+
+    assert_equal(run_many.find_jurisdictions(
+        [tmp_dir, os.path.join(tmp_dir, 'missing')]), ['ex', 'nc'])
+
+
+def _print_args():
+    print(' '.join(sys.argv))
+    print(update._import_slots is not None)
+
+
+@with_setup(setup_func, teardown_func)
+def test_update_one():
+    update.main = _print_args
+    log_path = os.path.join(tmp_dir, 'ex.log')
+    proc = multiprocessing.Process(
+        target=run_many._update_one,
+        args=('ex', ['--scrape'], log_path,
+              multiprocessing.BoundedSemaphore(1)))
+    proc.start()
+    proc.join()
+
+    assert_equal(proc.exitcode, 0)
+    with open(log_path) as f:
+        assert_equal(f.read(), 'billy-update ex --scrape\nTrue\n')
+
+
+def _import():
+    with update._import_slot():
+        with active.get_lock():
+            active.value += 1
+            most_active.value = max(most_active.value, active.value)
+        time.sleep(0.1)
+        with active.get_lock():
+            active.value -= 1
+    if sys.argv[1] == 'zz':
+        sys.exit(2)
+
+
+@with_setup(setup_func, teardown_func)
+def test_import_slots():
+    update.main = _import
+    results = run_many.run_many(['ex', 'yz', 'zz'], [], jobs=3,
+                                import_jobs=1, log_dir=tmp_dir,
+                                poll_interval=0.01)
+    assert_equal(results, {'ex': 0, 'yz': 0, 'zz': 2})
+    # all three could run at once, but only one imported at a time
+    assert_equal(most_active.value, 1)
@@ -0,0 +1,42 @@
+from nose.tools import assert_equal
+
+from billy.utils import search
+
+
+def test_tokenize():
+    assert_equal(search.tokenize(u'An Act relating to TAXES; H.B. 12'),
+                 ['act', 'relating', 'tax', '12'])
+    assert_equal(search.tokenize(b'state agencies and businesses'),
+                 ['state', 'agency', 'business'])
+    assert_equal(search.tokenize(None), [])
+
+
+def test_query_terms():
+    assert_equal(search.query_terms('taxes on tax'), ['tax'])
+    assert_equal(search.query_terms('the of'), [])
+
+
+def test_text_terms():
+    text = 'wheat corn wheat barley wheat corn'
+    assert_equal(search.text_terms(text, 2), ['wheat', 'corn'])
+    assert_equal(sorted(search.text_terms(text)), ['barley', 'corn', 'wheat'])
+
+
+def test_search_fields():
+    bill = {'title': 'Farm taxes', 'alternate_titles': ['Taxes on farms'],
+            'scraped_subjects': ['Agriculture']}
+    fields = search.search_fields(bill, ['wheat', 'farm'])
+    assert_equal(fields['_search_terms'],
+                 ['agriculture', 'farm', 'tax', 'wheat'])
+    assert_equal(fields['_search_weights'],
+                 {'farm': 4, 'tax': 4, 'agriculture': 2})
+
+    assert search.set_search_fields(bill)
+    assert not search.set_search_fields(bill)
+
+
+def test_score():
+    bill = {'_search_weights': {'farm': 4, 'agriculture': 2}}
+    assert_equal(search.score(bill, ['farm', 'agriculture']), 6)
+    # terms only found in the text
+    assert_equal(search.score(bill, ['farm', 'wheat']), 5)
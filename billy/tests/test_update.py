@@ -0,0 +1,132 @@
+import datetime as dt
+
+from nose.tools import with_setup, assert_equal, assert_raises
+
+from billy.core import db, settings
+from billy.bin import update
+from billy.scrape import ScrapeError
+
+# whole seconds, mongo stores milliseconds
+now = dt.datetime.utcnow().replace(microsecond=0)
+month_ago = now - dt.timedelta(days=30)
+
+
+def setup_func():
+    db.bills.drop()
+    db.import_manifests.drop()
+    db.billy_runs.drop()
+
+    # HB 1-4 were last updated a month ago, HB 2 was scraped since
+    for n, last in enumerate([5, 20, 10, 15], 1):
+        db.bills.insert({'_id': 'EXB0000000%s' % n, 'state': 'ex',
+                         'session': 'S1', 'chamber': 'lower',
+                         'bill_id': 'HB %s' % n, 'updated_at': month_ago,
+                         'action_dates': {'last': dt.datetime(2013, 1,
+                                                              last)}})
+        db.import_manifests.insert({'_id': 'ex/bills/lower_S1_HB%s.json' % n,
+                                    'state': 'ex', 'type': 'bill',
+                                    'obj_id': 'EXB0000000%s' % n,
+                                    'scraped_at': month_ago})
+    db.import_manifests.update({'obj_id': 'EXB00000002'},
+                               {'$set': {'scraped_at': now}})
+    # changed recently, so scraped recently too
+    db.bills.insert({'_id': 'EXB00000005', 'state': 'ex', 'session': 'S1',
+                     'chamber': 'lower', 'bill_id': 'HB 5',
+                     'updated_at': now,
+                     'action_dates': {'last': dt.datetime(2013, 1, 30)}})
+    db.bills.insert({'_id': 'EXB00000006', 'state': 'ex', 'session': 'S1',
+                     'chamber': 'upper', 'bill_id': 'SB 1',
+                     'updated_at': month_ago,
+                     'action_dates': {'last': dt.datetime(2013, 1, 1)}})
+
+
+def test_parse_since():
+    assert_equal(update._parse_since('2013-02-01', 'ex'),
+                 dt.datetime(2013, 2, 1))
+    assert_equal(update._parse_since('2013-02-01T08:30', 'ex'),
+                 dt.datetime(2013, 2, 1, 8, 30))
+    assert_equal(update._parse_since('2013-02-01T08:30:15', 'ex'),
+                 dt.datetime(2013, 2, 1, 8, 30, 15))
+    assert_raises(ScrapeError, update._parse_since, '02/01/2013', 'ex')
+
+
+@with_setup(setup_func)
+def test_parse_since_last():
+    assert_raises(ScrapeError, update._parse_since, 'last', 'ex')
+
+    db.billy_runs.save({'abbr': 'ex', 'scraped': {'started': month_ago}})
+    # failed runs and other jurisdictions' runs don't count
+    db.billy_runs.save({'abbr': 'ex', 'scraped': {'started': now},
+                        'failure': True})
+    db.billy_runs.save({'abbr': 'yz', 'scraped': {'started': now}})
+    assert_equal(update._parse_since('last', 'ex'), month_ago)
+
+
+@with_setup(setup_func)
+def test_stale_bills():
+    week = dt.timedelta(days=7)
+    # most recently acted on first, without those scraped or changed within
+    # the horizon
+    assert_equal(update._stale_bills('ex', 'S1', ['lower', 'upper'], week),
+                 [('lower', 'HB 4'), ('lower', 'HB 3'), ('lower', 'HB 1'),
+                  ('upper', 'SB 1')])
+    assert_equal(update._stale_bills('ex', 'S1', ['lower'], week, limit=2),
+                 [('lower', 'HB 4'), ('lower', 'HB 3')])
+    # nothing is older than the horizon
+    assert_equal(update._stale_bills('ex', 'S1', ['lower'],
+                                     dt.timedelta(days=60)), [])
+
+
+class ChangesScraper(object):
+
+    def __init__(self, changed):
+        self.changed = changed
+        self.scraped = []
+
+    def changed_bills(self, session, since):
+        return self.changed
+
+    def scrape_bill(self, chamber, session, bill_id):
+        self.scraped.append((chamber, session, bill_id))
+
+
+@with_setup(setup_func)
+def test_scrape_changed_bills():
+    horizon = settings.BILLY_RESCRAPE_HORIZON
+    limit = settings.BILLY_RESCRAPE_STALE_LIMIT
+    settings.BILLY_RESCRAPE_HORIZON = 7
+    settings.BILLY_RESCRAPE_STALE_LIMIT = 1
+    try:
+        scraper = ChangesScraper([('lower', 'HB 9'), ('upper', 'SB 9')])
+        assert_equal(update._scrape_changed_bills(scraper, 'S1', ['lower'],
+                                                  month_ago, 'ex'), 2)
+        # changed bills in the requested chambers and the stalest bill
+        assert_equal(scraper.scraped, [('lower', 'S1', 'HB 4'),
+                                       ('lower', 'S1', 'HB 9')])
+
+        # stale bills aren't rescraped without a horizon
+        settings.BILLY_RESCRAPE_HORIZON = 0
+        scraper = ChangesScraper([('lower', 'HB 9')])
+        assert_equal(update._scrape_changed_bills(scraper, 'S1', ['lower'],
+                                                  month_ago, 'ex'), 1)
+        assert_equal(scraper.scraped, [('lower', 'S1', 'HB 9')])
+    finally:
+        settings.BILLY_RESCRAPE_HORIZON = horizon
+        settings.BILLY_RESCRAPE_STALE_LIMIT = limit
+
+
+@with_setup(setup_func)
+def test_scrape_changed_bills_fallback():
+    # scrapers that can't report changes scrape the whole session
+    scraper = ChangesScraper(None)
+    assert_equal(update._scrape_changed_bills(scraper, 'S1', ['lower'],
+                                              month_ago, 'ex'), None)
+    assert_equal(scraper.scraped, [])
+
+
+@with_setup(setup_func)
+def test_mark_scraped():
+    update._mark_scraped('ex', ['lower_S1_HB1.json', 'lower_S1_HB9.json'])
+    assert_equal(update._stale_bills('ex', 'S1', ['lower'],
+                                     dt.timedelta(days=7)),
+                 [('lower', 'HB 4'), ('lower', 'HB 3')])
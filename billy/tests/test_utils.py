@@ -28,3 +28,10 @@ def test_find_bill():
     assert utils.find_bill({'bill_id': 'HB 4'})['bill_id'] == 'HB 4'
 
     # TODO: also test fields parameter
+
+
+def test_normalize_value():
+    # whitespace is kept, so that matches don't change
+    assert utils.normalize_value(u' Jo \t ANN  ') == u' jo \t ann  '
+    assert utils.normalize_value(12) == u'12'
+    assert utils.normalize_value(None) is None
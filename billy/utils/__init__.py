@@ -125,6 +125,29 @@ def fix_bill_id(bill_id):
     return _bill_id_re.sub(r'\1 \2', bill_id, 1).strip()
 
 
+# fields with case-folded copies kept in the object's (or role's) '_normalized'
+# dict by the importers, so that the API can filter on them case insensitively
+# using an index
+NORMALIZED_FIELDS = {
+    'person': ('first_name', 'last_name', 'full_name'),
+    'legislator': ('first_name', 'last_name', 'full_name'),
+    'committee': ('committee', 'subcommittee'),
+}
+NORMALIZED_ROLE_FIELDS = ('term', 'district', 'party')
+
+
+def normalize_value(value):
+    """
+    case-folded value for _normalized fields, matching it is the same as a
+    case insensitive match of the whole value
+    """
+    if value is None:
+        return None
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    return value.lower()
+
+
 def find_bill(query, fields=None):
     bill = db.bills.find_one(query, fields=fields)
     if not bill and 'bill_id' in query:
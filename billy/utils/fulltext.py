@@ -1,26 +1,26 @@
 import os
 import re
+import time
 import string
 import logging
 import tempfile
 import importlib
+import threading
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 import requests
 import boto.s3.key
 
-from billy.scrape.utils import convert_pdf
-from billy.core import settings, s3bucket
+from billy.scrape.utils import convert_pdf_data
+from billy.core import settings, db, s3bucket
 
 
 _log = logging.getLogger('billy.utils.fulltext')
 
 
 def pdfdata_to_text(data):
-    with tempfile.NamedTemporaryFile(delete=True) as tmpf:
-        tmpf.write(data)
-        tmpf.flush()
-        return convert_pdf(tmpf.name, 'text')
+    return convert_pdf_data(data, 'text')
 
 
 def worddata_to_text(data):
@@ -85,6 +85,7 @@ def s3_get(abbr, doc):
 
 
 PUNCTUATION = re.compile('[%s]' % re.escape(string.punctuation))
+SPACES = re.compile('\s+')
 
 
 def plaintext(abbr, doc, doc_bytes):
@@ -101,5 +102,193 @@ def plaintext(abbr, doc, doc_bytes):
         text = text.decode('utf8', 'ignore').encode('ascii', 'ignore')
     text = text.replace(u'\xa0', u' ')  # nbsp -> sp
     text = PUNCTUATION.sub(' ', text)   # strip punctuation
-    text = re.sub('\s+', ' ', text)     # collapse spaces
+    text = SPACES.sub(' ', text)        # collapse spaces
     return text
+
+
+class LocalBlobStore(object):
+    """ stores blobs as files under directory, a stand-in for S3 """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """ the blob stored as key, or None """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def put(self, key, data, content_type=None):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        # write to a temporary file first so readers never see partial blobs
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+class S3BlobStore(object):
+    """ stores blobs as public-read keys of an S3 bucket """
+
+    def __init__(self, bucket=None):
+        self.bucket = bucket if bucket is not None else s3bucket
+
+    def exists(self, key):
+        return self.bucket.get_key(key) is not None
+
+    def get(self, key):
+        k = self.bucket.get_key(key)
+        if k is not None:
+            return k.get_contents_as_string()
+
+    def put(self, key, data, content_type=None):
+        k = boto.s3.key.Key(self.bucket)
+        k.key = key
+        headers = {'x-amz-acl': 'public-read'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        k.set_contents_from_string(data, headers=headers)
+
+
+def document_key(abbr, doc):
+    return 'documents/{0}/{1}'.format(abbr, doc['doc_id'])
+
+
+def text_key(abbr, doc):
+    return 'text/{0}/{1}.txt'.format(abbr, doc['doc_id'])
+
+
+def _guess_content_type(response, url):
+    content_type = response.headers.get('content-type')
+    if not content_type:
+        url = url.lower()
+        if url.endswith('htm') or url.endswith('html'):
+            content_type = 'text/html'
+        elif url.endswith('pdf'):
+            content_type = 'application/pdf'
+    return content_type
+
+
+def iter_versions(abbr, session=None):
+    """ the versions of every bill in abbr, each doc_id once """
+    spec = {settings.LEVEL_FIELD: abbr}
+    if session:
+        spec['session'] = session
+    seen = set()
+    for bill in db.bills.find(spec, fields=['versions'], timeout=False):
+        for doc in bill.get('versions', []):
+            if doc.get('doc_id') and doc['doc_id'] not in seen:
+                seen.add(doc['doc_id'])
+                yield doc
+
+
+class FulltextPipeline(object):
+    """
+    Fetches bill versions into a blob store and extracts their plain text.
+
+    Documents are fetched (or read back from the store if they were fetched
+    before) and run through the jurisdiction's extract_text on a pool of
+    threads, the network and converter subprocesses release the GIL so
+    both overlap.  Versions whose text is already stored are skipped.
+    Documents are fetched with the scrapers' SCRAPELIB_TIMEOUT unless
+    timeout is given.
+    """
+
+    def __init__(self, abbr, store, workers=8, session=None,
+                 report_interval=30, timeout=None):
+        self.abbr = abbr
+        self.store = store
+        self.workers = workers
+        self.report_interval = report_interval
+        self.session = session or requests.Session()
+        self.timeout = timeout or settings.SCRAPELIB_TIMEOUT
+        self.counts = dict.fromkeys(('skipped', 'fetched', 'cached',
+                                     'empty', 'failed', 'extracted'), 0)
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def _count(self, key, nbytes=0):
+        with self._lock:
+            self.counts[key] += 1
+            self.bytes += nbytes
+
+    def fetch(self, doc):
+        """ the document's bytes, from the store if it's already there """
+        key = document_key(self.abbr, doc)
+        data = self.store.get(key)
+        if data is not None:
+            self._count('cached', len(data))
+            return data
+
+        url = doc['url'].replace(' ', '%20')
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        self.store.put(key, response.content,
+                       content_type=_guess_content_type(response, url))
+        _log.debug('stored %s as %s', doc['url'], key)
+        self._count('fetched', len(response.content))
+        return response.content
+
+    def process(self, doc):
+        try:
+            text = plaintext(self.abbr, doc, self.fetch(doc))
+        except Exception as e:
+            _log.warning('failed to process %s (%s): %s', doc['doc_id'],
+                         doc['url'], e)
+            self._count('failed')
+            return
+        if not text:
+            self._count('empty')
+            return
+        self.store.put(text_key(self.abbr, doc), text,
+                       content_type='text/plain')
+        self._count('extracted')
+
+    def _pending(self, docs):
+        for doc in docs:
+            if self.store.exists(text_key(self.abbr, doc)):
+                self._count('skipped')
+            else:
+                yield doc
+
+    def report(self, elapsed):
+        done = sum(self.counts[k] for k in ('extracted', 'empty', 'failed'))
+        _log.info('%s documents in %.1fs (%.2f docs/s, %.1f KB/s): %s',
+                  done, elapsed, done / elapsed if elapsed else 0,
+                  self.bytes / 1024. / elapsed if elapsed else 0,
+                  ', '.join('%s %s' % (v, k)
+                            for k, v in sorted(self.counts.items())))
+
+    def run(self, docs):
+        """ process docs (version dicts), returns the counts """
+        start = last_report = time.time()
+        pool = ThreadPool(self.workers)
+        try:
+            for _ in pool.imap_unordered(self.process, self._pending(docs)):
+                now = time.time()
+                if now - last_report >= self.report_interval:
+                    self.report(now - start)
+                    last_report = now
+        finally:
+            pool.close()
+            pool.join()
+        self.report(time.time() - start)
+        return dict(self.counts, seconds=time.time() - start)
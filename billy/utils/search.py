@@ -0,0 +1,102 @@
+"""
+Full text search of bills without an external search engine.
+
+Bills are indexed by the terms of their title, alternate titles and scraped
+subjects (and optionally of their versions' text, see billy-util
+search-index), kept in the bill's '_search_terms' field alongside the
+weight of each term in '_search_weights'.  '_search_terms' has a multikey
+index, so finding the bills that contain every term of a query doesn't
+depend on how many bills there are.
+"""
+import re
+from collections import Counter
+
+import six
+
+TERM_RE = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'into', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to',
+    'was', 'which', 'with'))
+
+# weight of a term by where it occurs, terms only found in the text of a
+# version weigh TEXT_WEIGHT
+FIELD_WEIGHTS = (('title', 4), ('alternate_titles', 2),
+                 ('scraped_subjects', 2))
+TEXT_WEIGHT = 1
+
+
+def stem(word):
+    """ strip plural endings so 'taxes' finds 'tax' and 'agencies' 'agency' """
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if (len(word) > 3 and word.endswith('s') and
+            not word.endswith(('ss', 'us', 'is'))):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """ the search terms of text, in order, repeats included """
+    if not text:
+        return []
+    if not isinstance(text, six.text_type):
+        text = text.decode('utf-8', 'ignore')
+    return [stem(word) for word in TERM_RE.findall(text.lower())
+            if word not in STOPWORDS and (len(word) > 1 or word.isdigit())]
+
+
+def query_terms(query):
+    """ distinct terms of a search query, in order """
+    terms = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def text_terms(text, limit=None):
+    """ distinct terms of a version's text, the limit most common ones """
+    return [term for term, _ in Counter(tokenize(text)).most_common(limit)]
+
+
+def _field_text(bill, field):
+    value = bill.get(field) or []
+    if isinstance(value, six.string_types):
+        return [value]
+    return value
+
+
+def search_fields(bill, text_terms=None):
+    """
+    The '_search_terms' and '_search_weights' of a bill, text_terms are the
+    terms of its versions' text.
+    """
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for value in _field_text(bill, field):
+            for term in tokenize(value):
+                weights[term] = max(weights.get(term, 0), weight)
+    terms = set(weights)
+    terms.update(text_terms or ())
+    return {'_search_terms': sorted(terms), '_search_weights': weights}
+
+
+def set_search_fields(bill, text_terms=None):
+    """ set a bill's search fields, returns True if they changed """
+    fields = search_fields(bill, text_terms)
+    changed = False
+    for key, value in fields.items():
+        if bill.get(key) != value:
+            bill[key] = value
+            changed = True
+    return changed
+
+
+def score(bill, terms):
+    """ relevance of a bill that contains every one of terms """
+    weights = bill.get('_search_weights') or {}
+    return sum(weights.get(term, TEXT_WEIGHT) for term in terms)
@@ -1,67 +1,223 @@
 import json
 import datetime
 
+import six
+
 from billy.utils import chamber_name
 from billy.core import settings
 
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
 from django.template import defaultfilters
+from django.utils import dateformat
+from django.utils.encoding import smart_text
+from django.utils.formats import get_format
 from piston.emitters import Emitter, JSONEmitter
 
 
-class DateTimeAwareJSONEncoder(json.JSONEncoder):
-    # We wouldn't need this if django's stupid DateTimeAwareJSONEncoder
-    # used settings.DATETIME_FORMAT instead of hard coding its own
-    # format string.
+# Django date format characters that have an strftime equivalent
+_STRFTIME_CODES = {'d': '%d', 'm': '%m', 'y': '%y', 'Y': '%Y', 'H': '%H',
+                   'i': '%M', 's': '%S'}
+
+_date_formatters = {}
+
+
+def date_formatter(format):
+    """
+    A function formatting dates and datetimes like Django's date filter
+    with format, compiled to strftime when format only uses numeric codes.
+    Formatters are cached by format.
+    """
+    if format in _date_formatters:
+        return _date_formatters[format]
+
+    parts = []
+    escaped = False
+    for char in format:
+        if escaped:
+            parts.append(char.replace('%', '%%'))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in _STRFTIME_CODES:
+            parts.append(_STRFTIME_CODES[char])
+        elif char.isalpha():
+            # eg. month names, only Django knows those
+            parts = None
+            break
+        else:
+            parts.append(char.replace('%', '%%'))
+
+    if parts is None:
+        def formatter(value):
+            return dateformat.format(value, format)
+    else:
+        strftime_format = ''.join(parts)
+
+        def formatter(value):
+            # strftime can't handle years before 1900 on python 2
+            if value.year < 1900:
+                return dateformat.format(value, format)
+            return value.strftime(strftime_format)
+
+    _date_formatters[format] = formatter
+    return formatter
+
+
+_SCALAR_TYPES = (six.text_type, str, float, bool,
+                 type(None)) + six.integer_types
+
+
+def _identity(obj):
+    return obj
+
+
+def _format_time(obj):
+    return defaultfilters.date(obj, 'TIME_FORMAT')
+
+
+def _to_text(obj):
+    return smart_text(obj, strings_only=True)
+
+
+class Serializer(object):
+    """
+    Converts documents to what json.dumps can encode in a single pass,
+    without modifying them: private keys (preceded by '_') are left out,
+    _id and _all_ids become id and all_ids and datetimes are formatted with
+    the DATETIME_FORMAT / DATE_FORMAT / TIME_FORMAT settings.
+    """
+
+    def __init__(self):
+        self.format_datetime = date_formatter(get_format('DATETIME_FORMAT'))
+        self.format_date = date_formatter(get_format('DATE_FORMAT'))
+        self.converters = {
+            dict: self.convert_dict,
+            list: self.convert_list,
+            tuple: self.convert_list,
+            datetime.datetime: self.format_datetime,
+            datetime.date: self.format_date,
+        }
+        for type_ in _SCALAR_TYPES:
+            self.converters[type_] = _identity
 
-    def default(self, o):
-        if isinstance(o, datetime.datetime):
-            return defaultfilters.date(o, 'DATETIME_FORMAT')
-        elif isinstance(o, datetime.date):
-            return defaultfilters.date(o, 'DATE_FORMAT')
-        elif isinstance(o, datetime.time):
-            return defaultfilters.date(o, 'TIME_FORMAT')
+    def __call__(self, obj):
+        converter = self.converters.get(type(obj))
+        if converter is None:
+            converter = self.converters[type(obj)] = self.converter_for(obj)
+        return converter(obj)
 
-        return super(DateTimeAwareJSONEncoder, self).default(o)
+    def converter_for(self, obj):
+        """ converter for subclasses (eg. Bill documents) and other types """
+        for type_ in (dict, list, tuple, datetime.datetime, datetime.date):
+            if isinstance(obj, type_):
+                return self.converters[type_]
+        if isinstance(obj, datetime.time):
+            return _format_time
+        # what piston's Emitter.construct does with unknown types
+        return _to_text
+
+    def convert_dict(self, obj):
+        convert = self.__call__
+        result = {}
+        for key, value in obj.items():
+            if not key.startswith('_'):
+                result[key] = convert(value)
+        if '_id' in obj:
+            result['id'] = convert(obj['_id'])
+        if '_all_ids' in obj:
+            result['all_ids'] = convert(obj['_all_ids'])
+        return result
+
+    def convert_list(self, obj):
+        convert = self.__call__
+        return [convert(item) for item in obj]
+
+
+class DocumentStream(object):
+    """
+    Documents for BillyJSONEmitter to send as a JSON array one at a time,
+    rather than building the whole response in memory.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class StreamingJSONResponse(HttpResponse):
+    """
+    A response whose content is generated as it is sent.
+
+    Like StreamingHttpResponse, but an HttpResponse so that piston returns
+    it as is instead of reading it into a new response.
+    """
+
+    def __init__(self, chunks, *args, **kwargs):
+        # skip HttpResponse.__init__, which sets content
+        HttpResponseBase.__init__(self, *args, **kwargs)
+        self.streaming_content = chunks
+
+    # piston sets streaming from PISTON_STREAM_OUTPUT, but this always is
+    streaming = property(lambda self: True, lambda self, value: None)
+
+    @property
+    def streaming_content(self):
+        return (self.make_bytes(chunk) for chunk in self._chunks)
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._chunks = value
+
+    @property
+    def content(self):
+        return b''.join(self.streaming_content)
+
+    def __iter__(self):
+        return self.streaming_content
 
 
 class BillyJSONEmitter(JSONEmitter):
     """
-    Removes private fields (keys preceded by '_') recursively and
-    outputs as JSON, with datetimes converted to strings.
+    Outputs data as JSON after converting it with a Serializer, which
+    leaves out private fields and formats datetimes.
+
+    A DocumentStream is converted and encoded one document at a time while
+    the response is sent.
     """
 
     def render(self, request):
         cb = request.GET.get('callback', None)
-        seria = json.dumps(self.construct(), cls=DateTimeAwareJSONEncoder,
-                           ensure_ascii=False)
+        if isinstance(self.data, DocumentStream):
+            return StreamingJSONResponse(
+                self.stream(self.data, cb),
+                content_type='application/json; charset=utf-8')
+
+        seria = json.dumps(self.construct(), ensure_ascii=False)
 
         if cb:
             return "%s(%s)" % (cb, seria)
 
         return seria
 
+    def stream(self, documents, callback=None):
+        """ yields the JSON of documents, a document at a time """
+        serialize = Serializer()
+        encoder = json.JSONEncoder(ensure_ascii=False)
+        if callback:
+            yield callback + '('
+        yield '['
+        for i, document in enumerate(documents):
+            yield (',' if i else '') + encoder.encode(serialize(document))
+        yield ']'
+        if callback:
+            yield ')'
+
     def construct(self):
-        return self._clean(super(BillyJSONEmitter, self).construct())
-
-    def _clean(self, obj):
-        if isinstance(obj, dict):
-            # convert _id to id
-            if '_id' in obj:
-                obj['id'] = obj['_id']
-            if '_all_ids' in obj:
-                obj['all_ids'] = obj['_all_ids']
-
-            for key, value in obj.items():
-                if key.startswith('_'):
-                    del obj[key]
-                else:
-                    obj[key] = self._clean(value)
-        elif isinstance(obj, list):
-            obj = [self._clean(item) for item in obj]
-        elif hasattr(obj, '__dict__'):
-            for key, value in obj.__dict__.items():
-                if key.startswith('_'):
-                    del obj.__dict__[key]
-                else:
-                    obj.__dict__[key] = self._clean(value)
-        return obj
+        data = self.data
+        if not isinstance(data, (dict, list, tuple)):
+            # eg. Django models, which piston knows how to handle
+            data = super(BillyJSONEmitter, self).construct()
+        return Serializer()(data)
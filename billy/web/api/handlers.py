@@ -9,8 +9,11 @@ from django.http import HttpResponse
 
 from billy.core import db
 from billy.models import Bill
+from billy.web.api.emitters import DocumentStream
 from billy.core import settings
-from billy.utils import find_bill, parse_param_dt, fix_bill_id
+from billy.utils import (find_bill, parse_param_dt, fix_bill_id,
+                         normalize_value, NORMALIZED_FIELDS,
+                         NORMALIZED_ROLE_FIELDS)
 
 import pymongo
 
@@ -24,7 +27,16 @@ ACTIVE_BOUNDARY_SETS = settings.BOUNDARY_SERVICE_SETS.split(",")
 _lower_fields = (settings.LEVEL_FIELD, 'chamber')
 
 
-def _build_mongo_filter(request, keys, icase=True):
+# values with these can't be looked up in _normalized fields, they're
+# matched as regular expressions
+_regex_chars = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def _build_mongo_filter(request, keys, icase=True, normalized=()):
+    """
+    normalized - keys that have a '_normalized' copy (see
+                 billy.utils.NORMALIZED_FIELDS) to match exactly
+    """
     _filter = {}
     keys = set(keys) - set(['fields'])
 
@@ -38,6 +50,9 @@ def _build_mongo_filter(request, keys, icase=True):
                 _filter[key[:-4]] = values
             elif key == 'bill_id':
                 _filter[key] = fix_bill_id(value.upper())
+            elif key in normalized and not _regex_chars.search(value):
+                # same matches as the regex below, but indexed
+                _filter['_normalized.' + key] = normalize_value(value)
             else:
                 # We use regex queries to get case insensitive search - this
                 # means they won't use any indexes for now. Real case
@@ -62,6 +77,34 @@ def _build_field_list(request, default_fields=None):
         return d
 
 
+# private fields that no handler needs, they're left out of queries that
+# don't ask for specific fields so they are never fetched
+_private_fields = {
+    'bills': ('_search_terms', '_search_weights', '_text_terms', '_term',
+              '_current_term', '_current_session', '_locked_fields'),
+    'votes': ('_voters',),
+    'legislators': ('_normalized', 'roles._normalized', '_scraped_name',
+                    '_locked_fields'),
+    'committees': ('_normalized', '_locked_fields'),
+}
+
+
+def _projection(collection, fields):
+    """
+    fields (from _build_field_list) for a query of collection, with the
+    collection's private fields excluded unless only some fields are
+    included
+    """
+    if fields and (isinstance(fields, list) or any(fields.values())):
+        return fields
+    projection = dict(fields or {})
+    for field in _private_fields[collection]:
+        # excluding a field and one of its subfields is an error
+        if field.split('.')[0] not in projection:
+            projection[field] = 0
+    return projection
+
+
 def _get_vote_fields(fields):
     return [field.replace('votes.', '', 1) for field in fields or [] if
             field.startswith('votes.')] or None
@@ -166,16 +209,47 @@ class BillHandler(BillyHandler):
                 query['chamber'] = chamber.lower()
 
         fields = _build_field_list(request)
-        bill = find_bill(query, fields=fields)
+        bill = find_bill(query, fields=_projection('bills', fields))
         vote_fields = _get_vote_fields(fields)
         # include votes if no fields are specified, if it is specified, or
         # if subfields are specified
         if bill and (not fields or 'votes' in fields or vote_fields):
-            bill['votes'] = list(db.votes.find({'bill_id': bill['_id']},
-                                               fields=vote_fields))
+            bill['votes'] = list(db.votes.find(
+                {'bill_id': bill['_id']},
+                fields=_projection('votes', vote_fields)))
         return bill
 
 
+def _with_votes(bills, bill_fields, batch_size=100):
+    """
+    Yields bills with their votes attached if bill_fields asks for votes,
+    the votes of batch_size bills are fetched at a time.
+    """
+    vote_fields = _get_vote_fields(bill_fields) or []
+    if 'votes' not in bill_fields and not vote_fields:
+        for bill in bills:
+            yield bill
+        return
+
+    bills = iter(bills)
+    while True:
+        batch = list(itertools.islice(bills, batch_size))
+        if not batch:
+            break
+        bill_ids = [bill['_id'] for bill in batch]
+        # add bill_id to vote_fields for relating back
+        votes_by_bill = defaultdict(list)
+        for vote in db.votes.find({'bill_id': {'$in': bill_ids}},
+                                  fields=vote_fields + ['bill_id']):
+            votes_by_bill[vote['bill_id']].append(vote)
+            # remove bill_id unless they really requested it
+            if 'bill_id' not in vote_fields:
+                vote.pop('bill_id')
+        for bill in batch:
+            bill['votes'] = votes_by_bill[bill['_id']]
+            yield bill
+
+
 class BillSearchHandler(BillyHandler):
     def read(self, request):
         bill_fields = {'title': 1, 'created_at': 1, 'updated_at': 1,
@@ -225,12 +299,23 @@ class BillSearchHandler(BillyHandler):
         # add pagination
         page = request.GET.get('page')
         per_page = request.GET.get('per_page')
-        if page and not per_page:
+        cursor = request.GET.get('cursor')
+        if (page or cursor is not None) and not per_page:
             per_page = 50
         if per_page and not page:
             page = 1
 
-        if page:
+        if cursor is not None:
+            # cursor= (empty) starts at the first page, the cursor of the
+            # next page is returned in the X-Next-Cursor header
+            try:
+                bills, request.next_cursor = query.page(cursor,
+                                                        int(per_page))
+            except ValueError as e:
+                resp = rc.BAD_REQUEST
+                resp.write('%s' % e)
+                return resp
+        elif page:
             page = int(page)
             per_page = int(per_page)
             start = per_page * (page - 1)
@@ -238,36 +323,23 @@ class BillSearchHandler(BillyHandler):
             bills = query[start:end]
         else:
             # limit response size
-            if len(query) > 10000:
+            max_results = settings.BILLY_API_MAX_RESULTS
+            if max_results is not None and len(query) > max_results:
                 resp = rc.BAD_REQUEST
                 resp.write('request too large, try narrowing your search by '
                            'adding more filters.')
                 return resp
-            bills = query[:]
-
-        bills = list(bills)
-        # attach votes if necessary
-        bill_ids = [bill['_id'] for bill in bills]
-        vote_fields = _get_vote_fields(bill_fields) or []
-        if 'votes' in bill_fields or vote_fields:
-            # add bill_id to vote_fields for relating back
-            votes = list(db.votes.find({'bill_id': {'$in': bill_ids}},
-                                       fields=vote_fields + ['bill_id']))
-            votes_by_bill = defaultdict(list)
-            for vote in votes:
-                votes_by_bill[vote['bill_id']].append(vote)
-                # remove bill_id unless they really requested it
-                if 'bill_id' not in vote_fields:
-                    vote.pop('bill_id')
-            for bill in bills:
-                bill['votes'] = votes_by_bill[bill['_id']]
-
-        return bills
+            # sent by the emitter as they're read from the cursor
+            return DocumentStream(_with_votes(query, bill_fields))
+
+        return list(_with_votes(bills, bill_fields))
 
 
 class LegislatorHandler(BillyHandler):
     def read(self, request, id):
-        return db.legislators.find_one({'_all_ids': id}, _build_field_list(request))
+        return db.legislators.find_one(
+            {'_all_ids': id},
+            _projection('legislators', _build_field_list(request)))
 
 
 class LegislatorSearchHandler(BillyHandler):
@@ -276,9 +348,13 @@ class LegislatorSearchHandler(BillyHandler):
         # replace with request's fields if they exist
         legislator_fields = _build_field_list(request, legislator_fields)
 
-        _filter = _build_mongo_filter(request, (settings.LEVEL_FIELD, 'first_name', 'last_name',
-                                                'full_name'))
-        elemMatch = _build_mongo_filter(request, ('chamber', 'term', 'district', 'party'))
+        _filter = _build_mongo_filter(
+            request, (settings.LEVEL_FIELD, 'first_name', 'last_name',
+                      'full_name'),
+            normalized=NORMALIZED_FIELDS['person'])
+        elemMatch = _build_mongo_filter(
+            request, ('chamber', 'term', 'district', 'party'),
+            normalized=NORMALIZED_ROLE_FIELDS)
         if elemMatch:
             _filter['roles'] = {'$elemMatch': elemMatch}
 
@@ -290,13 +366,15 @@ class LegislatorSearchHandler(BillyHandler):
         elif active and active.lower() == 'true':
             _filter['active'] = True
 
-        return list(db.legislators.find(_filter, legislator_fields))
+        return list(db.legislators.find(
+            _filter, _projection('legislators', legislator_fields)))
 
 
 class CommitteeHandler(BillyHandler):
     def read(self, request, id):
-        return db.committees.find_one({'_all_ids': id},
-                                      _build_field_list(request))
+        return db.committees.find_one(
+            {'_all_ids': id},
+            _projection('committees', _build_field_list(request)))
 
 
 class CommitteeSearchHandler(BillyHandler):
@@ -305,10 +383,12 @@ class CommitteeSearchHandler(BillyHandler):
         # replace with request's fields if they exist
         committee_fields = _build_field_list(request, committee_fields)
 
-        _filter = _build_mongo_filter(request, ('committee', 'subcommittee',
-                                                'chamber',
-                                                settings.LEVEL_FIELD))
-        return list(db.committees.find(_filter, committee_fields))
+        _filter = _build_mongo_filter(
+            request, ('committee', 'subcommittee', 'chamber',
+                      settings.LEVEL_FIELD),
+            normalized=NORMALIZED_FIELDS['committee'])
+        return list(db.committees.find(
+            _filter, _projection('committees', committee_fields)))
 
 
 
@@ -373,7 +453,8 @@ class LegislatorGeoHandler(BillyHandler):
         fields = _build_field_list(request)
         if fields is not None:
             fields['state'] = fields['district'] = fields['chamber'] = 1
-        legislators = list(db.legislators.find({'$or': filters}, fields))
+        legislators = list(db.legislators.find(
+            {'$or': filters}, _projection('legislators', fields)))
         for leg in legislators:
             if leg['district'] not in AT_LARGE:
                 leg['boundary_id'] = boundary_mapping[(
@@ -20,6 +20,55 @@ class BillsSearchTestCase(BaseTestCase):
         self.assert_200()
 
 
+class BillsSearchVotesTestCase(BaseTestCase):
+
+    url_tmpl = '/api/v1/bills/'
+    data = dict(state='ex', fields='bill_id,votes')
+
+    def test_streamed(self):
+        response = self.client.get(self._url, self._data)
+        self.assertTrue(response.streaming)
+
+    def test_votes_attached(self):
+        for bill in self.json:
+            votes = self.db.votes.find({'bill_id': bill['id']})
+            self.assertEquals(len(bill['votes']), votes.count())
+
+
+class BillsCursorTestCase(BaseTestCase):
+
+    url_tmpl = '/api/v1/bills/'
+    data = dict(state='ex', per_page=1)
+
+    def walk_pages(self, **params):
+        everything = self.load(self.client.get(
+            self._url, dict(params, state='ex')))
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(self._url,
+                                       dict(self.data, cursor=cursor,
+                                            **params))
+            self.assertEquals(response.status_code, 200)
+            seen.extend(bill['id'] for bill in self.load(response))
+            cursor = response.get('X-Next-Cursor')
+        # every bill exactly once
+        self.assertEquals(sorted(seen),
+                          sorted(bill['id'] for bill in everything))
+
+    def test_walk_pages(self):
+        self.walk_pages()
+
+    def test_walk_pages_without_sort_values(self):
+        # unsigned bills are paged after the signed ones
+        self.walk_pages(sort='signed')
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self._url,
+                                   dict(self.data, cursor='not a cursor'))
+        self.assertEquals(response.status_code, 400)
+
+
 class BillLookupTestCase(BaseTestCase):
 
     url_tmpl = '/api/v1/bills/{abbr}/{session}/{bill_id}/'
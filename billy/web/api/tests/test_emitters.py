@@ -0,0 +1,42 @@
+import copy
+import datetime
+import unittest
+
+from django.template import defaultfilters
+
+from billy.web.api.emitters import Serializer, date_formatter
+
+
+class SerializerTestCase(unittest.TestCase):
+
+    doc = {'_id': 'EXB00000001', '_all_ids': ['EXB00000001'],
+           '_search_terms': ['tax'], 'title': 'Taxes',
+           'actions': [{'date': datetime.datetime(2014, 3, 4, 5, 6, 7),
+                        '_private': 1, 'action': 'Introduced'}]}
+
+    def test_private_fields(self):
+        result = Serializer()(self.doc)
+        self.assertEquals(set(result), set(['id', 'all_ids', 'title',
+                                            'actions']))
+        self.assertEquals(result['id'], 'EXB00000001')
+        self.assertEquals(set(result['actions'][0]), set(['date', 'action']))
+
+    def test_unmodified(self):
+        doc = copy.deepcopy(self.doc)
+        Serializer()(doc)
+        self.assertEquals(doc, self.doc)
+
+    def test_datetimes(self):
+        result = Serializer()(self.doc)
+        self.assertEquals(result['actions'][0]['date'],
+                          defaultfilters.date(self.doc['actions'][0]['date'],
+                                              'DATETIME_FORMAT'))
+
+    def test_date_formatter(self):
+        value = datetime.datetime(1850, 1, 2, 3, 4, 5)
+        for format in ('Y-m-d H:i:s', r'\Y\e\a\r Y', 'N j, Y, P'):
+            self.assertEquals(date_formatter(format)(value),
+                              defaultfilters.date(value, format))
+            value = value.replace(year=2014)
+            self.assertEquals(date_formatter(format)(value),
+                              defaultfilters.date(value, format))
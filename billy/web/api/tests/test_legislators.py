@@ -22,6 +22,15 @@ class LegislatorsSearchTestCase(BaseTestCase):
         self.assert_200()
 
 
+class LegislatorsNameSearchTestCase(BaseTestCase):
+
+    url_tmpl = '/api/v1/legislators/'
+    data = dict(state='ex', last_name='fakelegislator1', party='democratic')
+
+    def test_case_insensitive(self):
+        self.assertEquals([leg['id'] for leg in self.json], ['EXL000001'])
+
+
 class LegislatorLookupTestCase(BaseTestCase):
 
     url_tmpl = '/api/v1/legislators/{legislator_id}/'
@@ -11,9 +11,14 @@ from billy.web.api.emitters import BillyJSONEmitter
 
 
 class CORSResource(piston.resource.Resource):
-    def __call__(self, *args, **kwargs):
-        r = super(CORSResource, self).__call__(*args, **kwargs)
+    def __call__(self, request, *args, **kwargs):
+        r = super(CORSResource, self).__call__(request, *args, **kwargs)
         r['Access-Control-Allow-Origin'] = '*'
+        # set by handlers that paginate with cursors
+        next_cursor = getattr(request, 'next_cursor', None)
+        if next_cursor:
+            r['X-Next-Cursor'] = next_cursor
+            r['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
         return r
 
 
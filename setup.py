@@ -19,6 +19,7 @@ setup(name='billy',
       entry_points="""[console_scripts]
 billy-update = billy.bin.update:main
 billy-util = billy.bin.util:main
+billy-run-many = billy.bin.run_many:main
 """,
       install_requires=[
           'Django<1.10',
@@ -28,7 +29,7 @@ billy-util = billy.bin.util:main
           "lxml>=2.2",
           "name_tools>=0.1.2",
           "nose",
-          "pymongo>=2.2,<3.0.0",
+          "pymongo>=2.7,<3.0.0",
           "scrapelib==1.1.0",
           "unicodecsv!=0.9.3",
           "validictory",